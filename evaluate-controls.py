@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+#
+# evaluate-controls.py - report the accuracy of aligners from the results of
+# their positive and negative controls summarized by generate-csv.py
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 2 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+from gargamel.util import require_python_version
+require_python_version(2, 7)
+
+import os.path
+import sys
+
+from gargamel.argumentparsers import EvaluationArgumentParser
+from gargamel.evaluation import evaluate
+from gargamel.evaluation import evaluation_report
+from gargamel.logger import logger
+from gargamel.results import results_dirname
+
+# a brief description of the purpose of this program
+PROGRAM_DESCRIPTION = ('Reports the AUC, ROCn score and sensitivity, with '
+                       'bootstrap confidence intervals, of each aligner from '
+                       'the results summarized by generate-csv.py')
+
+# exit status code representing no results store found
+STATUS_NO_RESULTS = 1 << 0
+
+# create an argument parser and parse the command-line arguments
+argparser = EvaluationArgumentParser(PROGRAM_DESCRIPTION)
+parsed_args = argparser.parse_args()
+
+# determine the amount of logging info to output
+if parsed_args.verbose:
+    from logging import DEBUG
+    from gargamel.logger import console_handler
+    console_handler.setLevel(DEBUG)
+
+# check that generate-csv.py has been run for each aligner
+for aligner in parsed_args.aligners:
+    if not os.path.isdir(results_dirname(parsed_args.outputdir, aligner)):
+        logger.critical('No results of ' + aligner + ' found in '
+                        + parsed_args.outputdir)
+        logger.critical('Please run generate-csv.py first')
+        sys.exit(STATUS_NO_RESULTS)
+
+evaluations = evaluate(parsed_args.outputdir, parsed_args.aligners)
+for line in evaluation_report(evaluations, n=parsed_args.roc_n,
+                              num_resamples=parsed_args.resamples,
+                              confidence=parsed_args.confidence,
+                              seed=parsed_args.seed,
+                              families=parsed_args.families):
+    print line
@@ -25,11 +25,27 @@ require_python_version(2, 7)
 
 from argparse import Action
 from argparse import ArgumentParser
+from argparse import ArgumentTypeError
 
 from constants import VERSION_NUMBER
+from constants import DEFAULT_CONFIDENCE
+from constants import DEFAULT_NUM_RESAMPLES
+from constants import DEFAULT_ROC_N
+from constants import HMMER_EXECUTABLE
+from constants import HMMER_HMMPRESS_EXECUTABLE
+from constants import HMMER_HMMSCAN_EXECUTABLE
+from constants import HMMER_REQUIRED_VERSION
+from constants import MATT_CACHE_DIR
+from constants import MODEL_CACHE_DIR
+from constants import MODEL_CACHE_SIZE
+from constants import REFERENCE_SOCKET
 from constants import HMMER, SMURF, PROFILE_SMURF, SMURF_LITE, DEFAULT_SMURF_LITE_THRESHOLD, DEFAULT_SIMEV_FREQUENCY, DEFAULT_SIMEV_COUNT, DEFAULT_SIMEV_THRESHOLD, MRFY
+from fasta import FASTA_FILENAME
+from jobs import DEFAULT_NUM_JOBS
+from nrpdb import NRPDB_FILENAME
 from nrpdb import RepresentativeFields
 from scop import Keys
+from scop import SCOP_CLASSIFICATION_FILE
 
 # the default argument for which field in a NRPDB record to examine to
 # determine whether a chain is a representative of a set of redundant chains
@@ -38,25 +54,86 @@ DEFAULT_REP_ARG = RepresentativeFields.BLAST80
 # the default directory containing PDB files in a hierarchy
 DEFAULT_PDB_DIR = '/r/bcb/protein_structure/pdb'
 
+# the default number of query chains in each shard of the negative controls
+DEFAULT_SHARD_SIZE = 100
+
 # text to display after the help message
 DEFAULT_EPILOG = ('For bugs or comments, contact Jeffrey Finkelstein '
                  '<jeffrey.finkelstein@gmail.com>')
 
 # help messages for options and arguments
 ALIGNER_HELP = 'the program to use to align chains'
+ALIGNERS_HELP = ('the aligners whose controls to evaluate, each summarized '
+                 'by generate-csv.py')
+ANNOTATE_JOBS_HELP = ('the maximum number of secondary structure annotations '
+                      'to run at once (default: the value of --jobs)')
+BATCH_HELP = ('query each model with all of its query chains in a single run '
+              'of the aligner (HMMER only; requires ' + HMMER_EXECUTABLE
+              + ' from HMMER ' + HMMER_REQUIRED_VERSION + ' or later)')
+BUILD_JOBS_HELP = ('the maximum number of model builds to run at once '
+                   '(default: the value of --jobs)')
+CONFIDENCE_HELP = 'the confidence level of the bootstrap confidence intervals'
+EVERY_HELP = ('query only every Nth chain outside the target hierarchy level, '
+              'in sorted order')
+CACHE_DIR_HELP = ('the directory in which to reuse and store the alignments '
+                  'made by matt')
+NO_CACHE_HELP = ('always run matt, rather than reusing an earlier alignment '
+                 'of the same chains')
+MODEL_CACHE_DIR_HELP = ('the directory in which to reuse and store the built '
+                        'models')
+MODEL_CACHE_SIZE_HELP = ('the number of bytes beyond which the least recently '
+                         'used models are removed from the cache')
+NO_MODEL_CACHE_HELP = ('always preparse and build the models, rather than '
+                       'reusing models built from the same inputs')
+FAMILIES_HELP = 'also report the AUC and ROCn score of each family model'
+JOBS_HELP = 'the maximum number of external programs to run at once'
 LEVEL_HELP = ('the SCOP hierarchy identifier and sunid of the top hierarchy '
              'level to test, specified in the form "key=sunid", where "key" '
              'is one of "cl", "cf", "sf", "fa", "dm", "sp", or "px" and '
              '"sunid" is the sunid of the hierarchy element to test')
 OUTPUT_DIR_HELP = 'the directory in which to place output alignment files'
+RUN_HMMER_HELP = ('also train and query HMMER, after smurf-lite')
+SKIP_MATT_HELP = ('do not align the structures with Matt, but use the '
+                  'alignments already in the output directory')
+STREAM_HELP = ('run the jobs of every stage together, starting each as soon '
+               'as the jobs before it for the same family have finished, '
+               'rather than waiting for every family to finish each stage')
 PDBDIR_HELP = 'the directory containing all PDB files in a hierarchy'
+RESAMPLES_HELP = 'the number of bootstrap resamples of the controls'
+ROC_N_HELP = ('the number of false positives up to which the ROCn score is '
+              'computed')
 REPFIELD_HELP = ('identifier of field in NRPDB file containing the flag for '
                 'whether a chain is a representative of a set of chains')
+FASTA_HELP = 'the FASTA file containing the sequences of all PDB chains'
+NRPDB_HELP = 'the NRPDB file listing the non-redundant sets of PDB chains'
+SCAN_HELP = ('query the models of all families with each shard of query '
+             'chains in a single run of hmmscan (HMMER only; requires '
+             + HMMER_HMMPRESS_EXECUTABLE + ' and ' + HMMER_HMMSCAN_EXECUTABLE
+             + ' from HMMER ' + HMMER_REQUIRED_VERSION + ' or later)')
+SCOP_HELP = 'the SCOP classification file'
+SEED_HELP = 'the seed of the random resamples, for a repeatable report'
+SHARD_SIZE_HELP = ('the number of query chains run against one family model by '
+                   'each restartable unit of work')
+SOCKET_HELP = 'the Unix domain socket on which to listen for requests'
 SUPERFAMILY_HELP = ('the SCOP "sunid" of the superfamily whose families will '
                    'be aligned')
 THRESHOLD_HELP = ('the maximum interleave count allowed in a beta strand pair')                   
 VERBOSE_HELP = 'print debug messages'
 
+def positive_int(value):
+    """Returns the specified command-line argument as an integer, raising an
+    argparse.ArgumentTypeError unless it is a positive integer.
+
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise ArgumentTypeError('invalid int value: ' + repr(value))
+    if number < 1:
+        raise ArgumentTypeError('must be a positive integer, but was '
+                                + value)
+    return number
+
 class LevelParser(Action):
     """The argparse.Action class which is called when a -l or --level hierarchy
     level specification argument is provided.
@@ -96,10 +173,95 @@ class BaseArgumentParser(object):
         self.argparser.add_argument('outputdir', type=str,
                                     help=OUTPUT_DIR_HELP)
 
+    def parse_args(self, args=None):
+        """Parse the specified list of arguments, or the command-line arguments
+        provided in sys.argv if none are specified.
+
+        """
+        return self.argparser.parse_args(args)
+
+class ReferenceServerArgumentParser(object):
+    """Argument parser for the reference data server (reference-server.py),
+    which, unlike the other scripts, does not write to an output directory.
+
+    """
+    def __init__(self, description, epilog=DEFAULT_EPILOG):
+        super(ReferenceServerArgumentParser, self).__init__()
+        self.argparser = ArgumentParser(description=description, epilog=epilog)
+        # options
+        self.argparser.add_argument('--version', action='version',
+                                    version='%(prog)s ' + str(VERSION_NUMBER))
+        self.argparser.add_argument('-v', '--verbose', action='store_true',
+                                    default=False, help=VERBOSE_HELP)
+        self.argparser.add_argument('--socket', default=REFERENCE_SOCKET,
+                                    type=str, help=SOCKET_HELP)
+        self.argparser.add_argument('--scop', default=SCOP_CLASSIFICATION_FILE,
+                                    type=str, help=SCOP_HELP)
+        self.argparser.add_argument('--nrpdb', default=NRPDB_FILENAME,
+                                    type=str, help=NRPDB_HELP)
+        self.argparser.add_argument('--fasta', default=FASTA_FILENAME,
+                                    type=str, help=FASTA_HELP)
+
     def parse_args(self):
         """Parse the command-line arguments provided in sys.argv."""
         return self.argparser.parse_args()
 
+class PipelineArgumentParser(BaseArgumentParser):
+    """Argument parser for running the whole leave-one-out analysis in a
+    single process (for example, in the run-pipeline.py script).
+
+    """
+    def __init__(self, description, epilog=DEFAULT_EPILOG):
+        super(PipelineArgumentParser, self).__init__(description, epilog)
+        # positional arguments
+        self.argparser.add_argument('level', action=LevelParser, type=str,
+                                    help=LEVEL_HELP)
+        # options
+        self.argparser.add_argument('-s', '--smurf_lite_threshold', default=DEFAULT_SMURF_LITE_THRESHOLD, type=str, help=THRESHOLD_HELP)
+        self.argparser.add_argument('-f', '--simev_frequency', default=DEFAULT_SIMEV_FREQUENCY, type=str, help=THRESHOLD_HELP)
+        self.argparser.add_argument('-c', '--simev_count', default=DEFAULT_SIMEV_COUNT, type=str, help=THRESHOLD_HELP)
+        self.argparser.add_argument('-t', '--simev_threshold', default=DEFAULT_SIMEV_THRESHOLD, type=str, help=THRESHOLD_HELP)
+        self.argparser.add_argument('--run-hmmer', action='store_true',
+                                    default=False, help=RUN_HMMER_HELP)
+        self.argparser.add_argument('--skip-matt', action='store_true',
+                                    default=False, help=SKIP_MATT_HELP)
+        self.argparser.add_argument('--stream', action='store_true',
+                                    default=False, help=STREAM_HELP)
+        self.argparser.add_argument('-j', '--jobs', default=DEFAULT_NUM_JOBS,
+                                    type=int, help=JOBS_HELP)
+        self.argparser.add_argument('--scop', default=SCOP_CLASSIFICATION_FILE,
+                                    type=str, help=SCOP_HELP)
+        self.argparser.add_argument('--nrpdb', default=NRPDB_FILENAME,
+                                    type=str, help=NRPDB_HELP)
+        self.argparser.add_argument('--fasta', default=FASTA_FILENAME,
+                                    type=str, help=FASTA_HELP)
+
+class EvaluationArgumentParser(BaseArgumentParser):
+    """Argument parser for evaluating the accuracy of aligners from their
+    positive and negative controls (for example, in the evaluate-controls.py
+    script).
+
+    """
+    def __init__(self, description, epilog=DEFAULT_EPILOG):
+        super(EvaluationArgumentParser, self).__init__(description, epilog)
+        # positional arguments
+        self.argparser.add_argument('aligners', type=str, nargs='+',
+                                    choices=[HMMER, SMURF, PROFILE_SMURF,
+                                             SMURF_LITE, MRFY],
+                                    help=ALIGNERS_HELP)
+        # options
+        self.argparser.add_argument('-n', '--roc-n', default=DEFAULT_ROC_N,
+                                    type=positive_int, help=ROC_N_HELP)
+        self.argparser.add_argument('--resamples',
+                                    default=DEFAULT_NUM_RESAMPLES,
+                                    type=positive_int, help=RESAMPLES_HELP)
+        self.argparser.add_argument('--confidence', default=DEFAULT_CONFIDENCE,
+                                    type=float, help=CONFIDENCE_HELP)
+        self.argparser.add_argument('--seed', default=None, type=int,
+                                    help=SEED_HELP)
+        self.argparser.add_argument('--families', action='store_true',
+                                    default=False, help=FAMILIES_HELP)
+
 class SmurfArgumentParser(BaseArgumentParser):
     def __init__(self, description, epilog=DEFAULT_EPILOG):
         super(SmurfArgumentParser, self).__init__(description, epilog)
@@ -129,7 +291,24 @@ class AlignmentArgumentParser(BaseArgumentParser):
         self.argparser.add_argument('-f', '--simev_frequency', default=DEFAULT_SIMEV_FREQUENCY, type=str, help=THRESHOLD_HELP)
         self.argparser.add_argument('-c', '--simev_count', default=DEFAULT_SIMEV_COUNT, type=str, help=THRESHOLD_HELP)
         self.argparser.add_argument('-t', '--simev_threshold', default=DEFAULT_SIMEV_THRESHOLD, type=str, help=THRESHOLD_HELP)
+        self.argparser.add_argument('-j', '--jobs', default=DEFAULT_NUM_JOBS,
+                                    type=int, help=JOBS_HELP)
         
+class ModelArgumentParser(AlignmentArgumentParser):
+    """Argument parser for building models from multiple alignments (for
+    example, in the generate-hmm.py script).
+
+    """
+    def __init__(self, description, epilog=DEFAULT_EPILOG):
+        super(ModelArgumentParser, self).__init__(description, epilog)
+        # options
+        self.argparser.add_argument('--cache-dir', default=MODEL_CACHE_DIR,
+                                    type=str, help=MODEL_CACHE_DIR_HELP)
+        self.argparser.add_argument('--cache-size', default=MODEL_CACHE_SIZE,
+                                    type=int, help=MODEL_CACHE_SIZE_HELP)
+        self.argparser.add_argument('--no-cache', action='store_true',
+                                    default=False, help=NO_MODEL_CACHE_HELP)
+
 class MrfArgumentParser(BaseArgumentParser):
     def __init__(self, description, epilog=DEFAULT_EPILOG):
         super(MrfArgumentParser, self).__init__(description, epilog)
@@ -138,6 +317,18 @@ class MrfArgumentParser(BaseArgumentParser):
         self.argparser.add_argument('-f', '--simev_frequency', default=DEFAULT_SIMEV_FREQUENCY, type=str, help=THRESHOLD_HELP)
         self.argparser.add_argument('-c', '--simev_count', default=DEFAULT_SIMEV_COUNT, type=str, help=THRESHOLD_HELP)
         self.argparser.add_argument('-t', '--simev_threshold', default=DEFAULT_SIMEV_THRESHOLD, type=str, help=THRESHOLD_HELP)
+        self.argparser.add_argument('-j', '--jobs', default=DEFAULT_NUM_JOBS,
+                                    type=int, help=JOBS_HELP)
+        self.argparser.add_argument('--annotate-jobs', default=None, type=int,
+                                    help=ANNOTATE_JOBS_HELP)
+        self.argparser.add_argument('--build-jobs', default=None, type=int,
+                                    help=BUILD_JOBS_HELP)
+        self.argparser.add_argument('--cache-dir', default=MODEL_CACHE_DIR,
+                                    type=str, help=MODEL_CACHE_DIR_HELP)
+        self.argparser.add_argument('--cache-size', default=MODEL_CACHE_SIZE,
+                                    type=int, help=MODEL_CACHE_SIZE_HELP)
+        self.argparser.add_argument('--no-cache', action='store_true',
+                                    default=False, help=NO_MODEL_CACHE_HELP)
 
 class MultipleAlignmentArgumentParser(SuperfamilyArgumentParser):
     """Argument parser for generating multiple alignments (for example, in the
@@ -150,9 +341,34 @@ class MultipleAlignmentArgumentParser(SuperfamilyArgumentParser):
         # options
         self.argparser.add_argument('-p', '--pdbdir', default=DEFAULT_PDB_DIR,
                                     type=str, help=PDBDIR_HELP)
+        self.argparser.add_argument('-j', '--jobs', default=DEFAULT_NUM_JOBS,
+                                    type=int, help=JOBS_HELP)
+        self.argparser.add_argument('--cache-dir', default=MATT_CACHE_DIR,
+                                    type=str, help=CACHE_DIR_HELP)
+        self.argparser.add_argument('--no-cache', action='store_true',
+                                    default=False, help=NO_CACHE_HELP)
 
 class StructuralAlignmentArgumentParser(SuperfamilyArgumentParser,
                                         AlignmentArgumentParser):
     def __init__(self, description, epilog=DEFAULT_EPILOG):
         super(StructuralAlignmentArgumentParser, self).__init__(description,
                                                                 epilog)
+        # options
+        self.argparser.add_argument('--batch', action='store_true',
+                                    default=False, help=BATCH_HELP)
+
+class NegativeControlArgumentParser(StructuralAlignmentArgumentParser):
+    """Argument parser for running negative controls (for example, in the
+    generate-negative-controls.py script).
+
+    """
+    def __init__(self, description, epilog=DEFAULT_EPILOG):
+        super(NegativeControlArgumentParser, self).__init__(description,
+                                                            epilog)
+        # options
+        self.argparser.add_argument('--shard-size', default=DEFAULT_SHARD_SIZE,
+                                    type=positive_int, help=SHARD_SIZE_HELP)
+        self.argparser.add_argument('--every', default=1, type=positive_int,
+                                    help=EVERY_HELP)
+        self.argparser.add_argument('--scan', action='store_true',
+                                    default=False, help=SCAN_HELP)
@@ -0,0 +1,187 @@
+# cache.py - persistent indices of large reference data files
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Provides functions for building an index of a large reference data file
+(for example, the SCOP classification file) once, saving it to disk, and
+loading it quickly on subsequent runs.
+
+An index is identified by the kind of index and by the signature of the file
+from which it was built, that is, the size, modification time, and MD5 digest
+of that file. A new release of the file therefore gets a new index.
+
+"""
+
+from util import require_python_version
+require_python_version(2, 7)
+
+import cPickle
+import errno
+import hashlib
+import os
+import os.path
+import tempfile
+from distutils.spawn import find_executable
+
+from constants import INDEX_DIR
+from logger import logger
+
+# the number of bytes to read at a time when computing the digest of a file
+BLOCK_SIZE = 1 << 20
+
+# the suffix of files containing the signature of a reference data file
+SIGNATURE_SUFFIX = '.sig'
+
+# the suffix of files containing an index of a reference data file
+INDEX_SUFFIX = '.idx'
+
+# indices which have already been loaded by this process, keyed by the name of
+# the file containing the index
+_loaded_indices = {}
+
+def make_dirs(dirname):
+    """Creates the specified directory (and any missing parents) if it does not
+    already exist.
+
+    It is not an error if another process creates the directory first.
+
+    """
+    try:
+        os.makedirs(dirname)
+    except OSError as error:
+        if error.errno != errno.EEXIST or not os.path.isdir(dirname):
+            raise
+
+def file_digest(filename):
+    """Returns the MD5 hex digest of the contents of the specified file."""
+    digest = hashlib.md5()
+    with open(filename, 'rb') as f:
+        block = f.read(BLOCK_SIZE)
+        while block:
+            digest.update(block)
+            block = f.read(BLOCK_SIZE)
+    return digest.hexdigest()
+
+def dump_atomically(obj, filename):
+    """Pickles the specified object to the specified file.
+
+    The object is first written to a temporary file in the same directory,
+    which is then renamed, so that other processes never see a partially
+    written file.
+
+    """
+    dirname = os.path.dirname(filename) or '.'
+    make_dirs(dirname)
+    fd, temp_filename = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            cPickle.dump(obj, f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(temp_filename, filename)
+    except:
+        os.remove(temp_filename)
+        raise
+
+def load(filename):
+    """Returns the object pickled in the specified file, or None if the file
+    does not exist or cannot be read.
+
+    """
+    if not os.path.isfile(filename):
+        return None
+    try:
+        with open(filename, 'rb') as f:
+            return cPickle.load(f)
+    except (EOFError, IOError, cPickle.UnpicklingError) as error:
+        logger.warning('Ignoring unreadable cache file ' + filename + ': '
+                       + str(error))
+        return None
+
+def file_signature(filename):
+    """Returns a tuple containing the size, modification time, and MD5 hex
+    digest of the specified file.
+
+    Computing the digest requires reading the entire file, so the signature is
+    remembered in INDEX_DIR and the digest is only recomputed when the size or
+    modification time of the file changes.
+
+    """
+    filename = os.path.abspath(filename)
+    stat = os.stat(filename)
+    size, mtime = stat.st_size, stat.st_mtime
+    signature_filename = os.path.join(INDEX_DIR,
+                                      hashlib.md5(filename).hexdigest()
+                                      + SIGNATURE_SUFFIX)
+    signature = load(signature_filename)
+    if signature is not None and signature[:2] == (size, mtime):
+        return signature
+    logger.debug('Computing digest of ' + filename + '...')
+    signature = (size, mtime, file_digest(filename))
+    dump_atomically(signature, signature_filename)
+    return signature
+
+def executable_digest(executable):
+    """Returns the MD5 hex digest of the specified executable, found on the
+    path if it is not a path itself, or None if it cannot be found.
+
+    The digest changes with the version of the executable, so it can be used
+    in the key of a cached output of the executable.
+
+    """
+    filename = executable
+    if os.path.dirname(executable) == '':
+        filename = find_executable(executable)
+    if filename is None or not os.path.isfile(filename):
+        return None
+    return file_signature(os.path.realpath(filename))[2]
+
+def index_filename(filename, kind):
+    """Returns the name of the file in INDEX_DIR which contains the index of
+    the specified kind for the specified reference data file.
+
+    """
+    size, mtime, digest = file_signature(filename)
+    return os.path.join(INDEX_DIR, '.'.join((os.path.basename(filename), kind,
+                                             digest)) + INDEX_SUFFIX)
+
+def cached_index(filename, kind, build_index):
+    """Returns the index of the specified kind for the specified reference data
+    file.
+
+    If no index has been saved for the current signature of the file, the index
+    is built by calling build_index(filename) and saved in INDEX_DIR. The
+    returned index is also remembered for the lifetime of this process, so it
+    must not be modified by the caller.
+
+    `kind' is a short string identifying the type of index, for example
+    'scop1'. It should be changed whenever the structure of the index changes.
+
+    """
+    saved_filename = index_filename(filename, kind)
+    if saved_filename in _loaded_indices:
+        return _loaded_indices[saved_filename]
+
+    index = load(saved_filename)
+    if index is None:
+        logger.debug('Building ' + kind + ' index of ' + filename + '...')
+        index = build_index(filename)
+        dump_atomically(index, saved_filename)
+        logger.debug('  saved to ' + saved_filename)
+    else:
+        logger.debug('Loaded ' + kind + ' index of ' + filename + ' from '
+                     + saved_filename)
+
+    _loaded_indices[saved_filename] = index
+    return index
@@ -73,6 +73,16 @@ HMMER_HMMBUILD_EXECUTABLE = 'hmmbuild-a2'
 SMURF_LITE_HMMBUILD_EXECUTABLE = 'smurfbuild'
 MRFBUILD_EXECUTABLE = 'mrfbuild'
 
+# executable names for indexing a database of HMMER models and for querying
+# every model in it at once
+HMMER_HMMPRESS_EXECUTABLE = 'hmmpress-a2'
+HMMER_HMMSCAN_EXECUTABLE = 'hmmscan-a2'
+
+# the earliest HMMER release whose output formats (including the tabular
+# outputs and their '# [ok]' trailer) the batch and scan modes can split; the
+# HMMER executables above must be built from it or a later 3.x release
+HMMER_REQUIRED_VERSION = '3.1b2'
+
 HMMER_HMMBUILD_OPTIONS = '--symfrac 0.2 --eent --ere 0.7'
 SMURF_HMMBUILD_OPTIONS = '--symfrac 0.2 --eent --ere 0.7 --fragthresh 0.0' 
 # --fragthresh 0.0
@@ -83,6 +93,10 @@ PROFILE_SMURF_HMMBUILD_OPTIONS = ''
 
 DEFAULT_SMURF_LITE_THRESHOLD = 1000
 
+# the name of the file in each aligner output directory to which the output of
+# the commands which build its model is written
+BUILD_LOG_FILENAME = 'build.log'
+
 # the prefix for files generated by matt
 MATT_PREFIX = 'mattAlignment'
 
@@ -90,7 +104,58 @@ MATT_PREFIX = 'mattAlignment'
 POSITIVE_DIRNAME = 'positive'
 NEGATIVE_DIRNAME = 'negative'
 
+# the suffix of the file to which the result of each query is written
+QUERY_OUTPUT_SUFFIX = '.out'
+
+# the suffixes of the files to which the tabular and domain tabular outputs of
+# each HMMER query are written, beside its main output
+TABLE_OUTPUT_SUFFIX = '.tbl'
+DOMAIN_TABLE_OUTPUT_SUFFIX = '.domtbl'
+
+# the suffix of the file to which the result of querying many chains at once is
+# written, before it is split into one file per chain
+BATCH_OUTPUT_SUFFIX = '.batch'
+
+# the name of the file in the output directory which contains the HMMER models
+# of every family, each named by its sunid, for querying all of them at once
+HMMER_DATABASE_FILENAME = '.'.join(('families', HMMER, HMM_SUFFIX))
+
+# the suffix of the file listing the other chains which share the sequence of
+# a queried chain, and therefore also share its result
+SHARED_CHAINS_SUFFIX = '.shared'
+
+# the suffix of the file which marks that a shard of queries has finished, so
+# that it is not run again when a sweep is restarted
+SHARD_DONE_SUFFIX = '.done'
+
 # the temporary directory for use with smurf
 TMP_DIR = '/tmp/smurf'
 if not os.path.isdir(TMP_DIR):
     os.mkdir(TMP_DIR)
+
+# the directory in which to store indices built from the reference data files
+# (SCOP, NRPDB, FASTA) so that each release need only be parsed once
+INDEX_DIR = os.path.join(TMP_DIR, 'index')
+
+# the directory in which the outputs of matt are stored, keyed by the chains
+# aligned, so that an alignment is reused by every output directory which
+# needs it (see gargamel.mattcache)
+MATT_CACHE_DIR = os.path.join(TMP_DIR, 'matt')
+
+# the directory in which built models are stored, keyed by the inputs from
+# which they were built, and the number of bytes beyond which the least
+# recently used models are removed from it (see gargamel.modelcache)
+MODEL_CACHE_DIR = os.path.join(TMP_DIR, 'models')
+MODEL_CACHE_SIZE = 4 << 30
+
+# the Unix domain socket on which the reference data server (see
+# reference-server.py) listens for requests
+REFERENCE_SOCKET = os.path.join(TMP_DIR, 'reference.sock')
+
+# the default number of false positives up to which the ROCn score of the
+# controls is computed, the default number of bootstrap resamples of the
+# controls, and the default confidence level of the bootstrap confidence
+# intervals (see gargamel.evaluation)
+DEFAULT_ROC_N = 50
+DEFAULT_NUM_RESAMPLES = 1000
+DEFAULT_CONFIDENCE = 0.95
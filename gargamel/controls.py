@@ -0,0 +1,534 @@
+# controls.py - query the HMMs with positive and negative control chains
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Provides the third and fourth stages of the leave-one-out analysis, which
+query the model built for each hierarchy level left out with the chains of
+that level (the positive controls) and with chains outside the target level
+(the negative controls), for use by generate-positive-controls.py,
+generate-negative-controls.py and gargamel.pipeline.
+
+"""
+
+from util import require_python_version
+require_python_version(2, 7)
+
+import os
+import os.path
+from distutils.spawn import find_executable
+from functools import partial
+
+from constants import HMMER
+from constants import HMMER_DATABASE_FILENAME
+from constants import HMMER_EXECUTABLE
+from constants import HMMER_HMMPRESS_EXECUTABLE
+from constants import HMMER_HMMSCAN_EXECUTABLE
+from constants import HMMER_HMM_FILENAME
+from constants import HMMER_REQUIRED_VERSION
+from constants import NEGATIVE_DIRNAME
+from constants import POSITIVE_DIRNAME
+from fasta import mapped_sequences_from_file
+from fasta import sequences_from_file
+from jobs import Call
+from jobs import Job
+from jobs import log_summary
+from jobs import run_graph
+from jobs import run_jobs
+from jobs import will_exist
+from logger import logger
+from nrpdb import representatives_from_file
+from queries import batch_output_filename
+from queries import batch_query_command
+from queries import distinct_queries
+from queries import model_filename
+from queries import negative_query_chains
+from queries import press_command
+from queries import query_command
+from queries import query_output_filename
+from queries import scan_query_command
+from queries import shard_done_filename
+from queries import split_batch_output
+from queries import split_scan_output_by_family
+from queries import write_batch_fasta
+from queries import write_query_fasta
+from queries import write_query_readme
+from queries import write_scan_database
+from queries import write_shared_chains
+from scop import hierarchy_sets_from_file
+#from whitelist import WHITELIST_FILENAME
+#from whitelist import whitelist_from_file
+
+# exit status code representing that an executable required by the options
+# could not be found
+STATUS_NO_EXECUTABLE = 8
+
+def _find_executables(batch=False, scan=False):
+    """Returns True if and only if the HMMER executables needed to query many
+    chains (if `batch' is True) or many models (if `scan' is True) at once can
+    be found on the path, logging the missing ones otherwise.
+
+    Without this check, a missing executable would only be noticed as the
+    failure of every query job.
+
+    """
+    executables = []
+    if batch:
+        executables.append(HMMER_EXECUTABLE)
+    if scan:
+        executables.extend((HMMER_HMMPRESS_EXECUTABLE,
+                            HMMER_HMMSCAN_EXECUTABLE))
+    missing = [executable for executable in executables
+               if find_executable(executable) is None]
+    if missing:
+        logger.critical('Could not find ' + ', '.join(missing)
+                        + ' on the path')
+        logger.critical('Querying many chains or models at once requires '
+                        'HMMER ' + HMMER_REQUIRED_VERSION + ' or later')
+    return not missing
+
+def generate_positive_controls(parsed_args, reference):
+    """Queries the model built by the aligner given in the specified options
+    (as parsed by gargamel.argumentparsers.StructuralAlignmentArgumentParser)
+    for each hierarchy level left out with the representatives of the chains
+    of that level.
+
+    The chains are read from the files of the specified ReferenceData. Returns
+    the exit status of generate-positive-controls.py.
+
+    """
+    # get the values from the command-line arguments
+    aligner = parsed_args.aligner
+    output_dir = parsed_args.outputdir.rstrip('/')  # remove trailing slash
+    target_level = parsed_args.target_level
+    target_sunid = parsed_args.target_sunid
+    representative_field = parsed_args.repfield
+    num_jobs = parsed_args.jobs
+    batch = parsed_args.batch
+
+    # configuration summary
+    config = {'target_level' : target_level,
+              'target_sunid' : target_sunid,
+              'output_dir' : output_dir,
+              #'logging_level' : level,
+              'aligner' : aligner,
+              'representative_field' : representative_field,
+              'num_jobs' : num_jobs,
+              'batch' : batch}
+    logger.debug('Program configuration: ' + str(config))
+
+    # only HMMER can query many chains in a single run
+    if batch and aligner != HMMER:
+        logger.warning('Cannot query many chains at once with ' + aligner
+                       + '; querying one chain at a time')
+        batch = False
+    if not _find_executables(batch=batch):
+        return STATUS_NO_EXECUTABLE
+
+    # create a mapping from PDB ID:chains to residue sequences
+    logger.debug('Building a mapping from PDBID to residue sequence...')
+    sequences = sequences_from_file(reference.fasta_filename, by_chain=True)
+
+    # get all the records from the SCOP classification file
+    # this now has (pdbid,chain) tuples
+    logger.debug('Getting records to test from SCOP Classification file...')
+    hierarchy = hierarchy_sets_from_file(reference.scop_filename, target_level,
+                                         target_sunid)
+    logger.debug('hierarchy: ' + str(hierarchy))
+
+    # get the representatives of these chains in the non-redundant set from
+    # the NRPDB file
+    logger.debug('Getting non-redundant set of PDB chains...')
+    nrpdbs = representatives_from_file(reference.nrpdb_filename,
+                                       [pdbid + ':' + chain
+                                        for pdbid_tuples
+                                        in hierarchy.itervalues()
+                                        for pdbid, chain in pdbid_tuples
+                                        if chain is not None],
+                                       representative_field)
+
+    # create the whitelist of PDB chains on which to train explicitly
+    #logger.debug('Getting the whitelist of chains to test...')
+    #whitelist = whitelist_from_file(WHITELIST_FILENAME)
+
+    # end the program if the output dir doesn't exist
+    logger.debug('Checking whether output directory exists...')
+    if not os.path.isdir(output_dir):
+        logger.critical('Output directory ' + output_dir
+                        + ' does not yet exist')
+        logger.critical('Please run generate-matt-alignments.py and '
+                        'generate-hmm.py first')
+        return 2
+
+    # the queries to run, which are run concurrently once all have been
+    # prepared
+    query_jobs = []
+
+    # iterate over each hierarchy level to query
+    logger.debug('Iterating over query families ' + str(hierarchy))
+
+    for sunid, pdbid_tuples in hierarchy.iteritems():
+
+        # create a directory for the positive control queries, if it doesn't
+        # exist
+        logger.debug('Checking whether directory for positive controls '
+                     'exists...')
+        aligner_output_dir = os.path.join(output_dir, str(sunid), aligner)
+        positive_dir = os.path.join(aligner_output_dir, POSITIVE_DIRNAME)
+        if not os.path.isdir(positive_dir):
+            os.makedirs(positive_dir)
+            logger.debug('  it doesn\'t, so we created it at ' + positive_dir)
+
+        # take the pdbid WITH chain. Find its full entry in nrpdb.
+        # get the associated group, and use the rep from that group.
+        # finally, uniq the resulting list.
+        representatives = set()
+        # pdbids is the set of all pdbids in this subtree of the hierarchy
+        for orig_pdbid, orig_pdbchain in pdbid_tuples:
+            if orig_pdbchain is None:
+                continue
+            query_id = orig_pdbid + ':' + orig_pdbchain
+            if query_id not in nrpdbs:
+                continue
+            logger.debug('query PDB id: ' + query_id
+                         + ', representative PDB id: ' + nrpdbs[query_id])
+            representatives.add(nrpdbs[query_id])
+
+        # query each distinct sequence only once, and share its result with
+        # every chain which has an identical sequence
+        queries = distinct_queries(sequences, representatives)
+        query_pdbids = [pdbid for pdbid, shared_pdbids in queries]
+        output_filenames = [query_output_filename(positive_dir, pdbid)
+                            for pdbid in query_pdbids]
+
+        # in batch mode, query the model with all of the sequences in a single
+        # run, then split the output into one file per query
+        if batch and queries:
+            fasta_filename, names = write_batch_fasta(sequences, query_pdbids)
+            batch_filename = batch_output_filename(positive_dir, query_pdbids)
+            batch_cmd = batch_query_command(aligner, aligner_output_dir,
+                                            fasta_filename, batch_filename)
+            logger.debug('  Queueing batch query of ' + str(len(queries))
+                         + ' sequences...')
+            query_jobs.append(Job(batch_filename,
+                                  [batch_cmd,
+                                   Call(split_batch_output, batch_filename,
+                                        names, output_filenames)],
+                                  cost=len(queries),
+                                  inputs=[model_filename(aligner,
+                                                         aligner_output_dir)]))
+
+        for i, (pdbid, shared_pdbids) in enumerate(queries):
+
+            logger.debug('query number ' + str(i + 1) + ' out of '
+                         + str(len(queries)) + ' in hierarchy level with '
+                         'sunid ' + str(sunid))
+
+            output_filename = output_filenames[i]
+            if batch:
+                query_cmd = batch_cmd
+            else:
+                # open a FASTA file to which to write the sequence
+                fasta_filename = write_query_fasta(sequences, pdbid)
+
+                # determine which executable and model file to use for the
+                # query
+                try:
+                    query_cmd = query_command(aligner, aligner_output_dir,
+                                              fasta_filename, output_filename)
+                except ValueError as error:
+                    logger.critical(str(error))
+                    return 1
+
+                # queue the query script on the current protein
+                logger.debug('  Queueing query script...')
+                query_jobs.append(Job(output_filename, [query_cmd],
+                                      inputs=[model_filename(
+                                          aligner, aligner_output_dir)]))
+            write_shared_chains(output_filename, shared_pdbids)
+
+            # add a README to the directory containing the alignment of the
+            # current query protein
+            logger.debug('  Writing README for smurf query result...')
+            query_readme = output_filename + '.README'
+            write_query_readme(query_readme, query_cmd)
+            logger.debug('    wrote to ' + query_readme)
+
+    # run the queries, at most num_jobs at a time
+    logger.debug('Running ' + str(len(query_jobs)) + ' queries, '
+                 + str(num_jobs) + ' at a time...')
+    log_summary(run_jobs(query_jobs, num_jobs))
+    return 0
+
+def generate_negative_controls(parsed_args, reference):
+    """Queries the model built by the aligner given in the specified options
+    (as parsed by gargamel.argumentparsers.NegativeControlArgumentParser) for
+    each hierarchy level left out with the representatives of chains outside
+    the target hierarchy level, in restartable shards.
+
+    The chains are read from the files of the specified ReferenceData. Returns
+    the exit status of generate-negative-controls.py.
+
+    """
+    # get the values from the command-line arguments
+    aligner = parsed_args.aligner
+    output_dir = parsed_args.outputdir.rstrip('/')  # remove trailing slash
+    target_level = parsed_args.target_level
+    target_sunid = parsed_args.target_sunid
+    representative_field = parsed_args.repfield
+    num_jobs = parsed_args.jobs
+    shard_size = parsed_args.shard_size
+    every = parsed_args.every
+    batch = parsed_args.batch
+    scan = parsed_args.scan
+
+    # configuration summary
+    config = {'target_level' : target_level,
+              'target_sunid' : target_sunid,
+              'output_dir' : output_dir,
+              #'logging_level' : level,
+              'aligner' : aligner,
+              'representative_field' : representative_field,
+              'num_jobs' : num_jobs,
+              'shard_size' : shard_size,
+              'every' : every,
+              'batch' : batch,
+              'scan' : scan}
+
+    logger.debug('Program configuration: ' + str(config))
+
+    # only HMMER can query many chains in a single run
+    if batch and aligner != HMMER:
+        logger.warning('Cannot query many chains at once with ' + aligner
+                       + '; querying one chain at a time')
+        batch = False
+    if scan and aligner != HMMER:
+        logger.warning('Cannot query many models at once with ' + aligner
+                       + '; querying one model at a time')
+        scan = False
+    # scan mode queries every family with hmmscan alone
+    if not _find_executables(batch=batch and not scan, scan=scan):
+        return STATUS_NO_EXECUTABLE
+
+    # create a mapping from PDB ID:chains to residue sequences; this sweep
+    # touches most of the FASTA file, so share one memory mapped copy of it
+    # between processes
+    logger.debug('Building a mapping from PDBID to residue sequence...')
+    sequences = mapped_sequences_from_file(reference.fasta_filename,
+                                           by_chain=True)
+
+    # get the representatives of the chains on which to test, leaving out the
+    # already trained hierarchy level and every other chain of its PDB
+    # entries; the query chains are the same for every family, so choose them
+    # once, in sorted order so that sampling with --every is repeatable
+    logger.debug('Choosing query chains from the SCOP Classification and '
+                 'NRPDB files...')
+    selected_pdbids, total_count = \
+        negative_query_chains(reference.scop_filename,
+                              reference.nrpdb_filename, representative_field,
+                              target_level, target_sunid, every)
+    logger.debug('  number of query chains: ' + str(total_count))
+
+    # create the whitelist of PDB chains on which to train explicitly
+    #logger.debug('Getting the whitelist of chains to test...')
+    #whitelist = whitelist_from_file(WHITELIST_FILENAME)
+
+    # end the program if the output dir doesn't exist
+    logger.debug('Checking whether output directory exists...')
+    if not os.path.isdir(output_dir):
+        logger.critical('Output directory ' + output_dir
+                        + ' does not yet exist')
+        logger.critical('Please run generate-matt-alignments.py, '
+                        'generate-hmm.py, and generate-positive-controls.py '
+                        'first')
+        return 2
+
+    # determine which hierarchy levels exist
+    logger.debug('Determining which hierarchy levels were left out during '
+                 'training...')
+    logger.debug('  output_dir contains: ' + str(os.listdir(output_dir)))
+    sunids = sorted(x for x in os.listdir(output_dir)
+                    if x.isdigit()
+                    and os.path.isdir(os.path.join(output_dir, x)))
+    logger.debug('  sunids: ' + str(sunids))
+
+    # query each distinct sequence only once, and share its result with every
+    # chain which has an identical sequence
+    queries = distinct_queries(sequences, selected_pdbids)
+    used_count = sum(1 + len(shared_pdbids)
+                     for pdbid, shared_pdbids in queries)
+    logger.debug('Using ' + str(used_count) + ' out of ' + str(total_count)
+                 + ' pdbids')
+
+    # write each FASTA file once, for use against every family model; in
+    # batch and scan modes, write one FASTA file for each shard instead
+    query_pdbids = [pdbid for pdbid, shared_pdbids in queries]
+    if batch or scan:
+        batches = [write_batch_fasta(sequences,
+                                     query_pdbids[start:start + shard_size])
+                   for start in range(0, len(query_pdbids), shard_size)]
+    else:
+        fasta_filenames = [write_query_fasta(sequences, pdbid)
+                           for pdbid in query_pdbids]
+
+    # in scan mode, each shard runs up to shard_size query chains against the
+    # models of every family at once, in a single database in the output
+    # directory
+    database_filename = os.path.join(output_dir, HMMER_DATABASE_FILENAME)
+    if scan:
+        scan_filenames = [batch_output_filename(output_dir,
+                                                query_pdbids[start:start
+                                                             + shard_size])
+                          for start in range(0, len(query_pdbids),
+                                             shard_size)]
+        scan_cmds = [scan_query_command(database_filename,
+                                        batch_fasta_filename, scan_filename)
+                     for (batch_fasta_filename, names), scan_filename in
+                     zip(batches, scan_filenames)]
+        family_output_filenames = []
+
+    # otherwise, each shard runs up to shard_size query chains against a
+    # single family model
+    query_jobs = []
+
+    # iterate over each family
+    for sunid in sunids:
+
+        aligner_output_dir = os.path.join(output_dir, sunid, aligner)
+        if not os.path.isdir(aligner_output_dir):
+            logger.critical('No directory found at ' + aligner_output_dir)
+            logger.critical('Please run generate-positive-controls.py first')
+            return 4
+
+        negative_dir = os.path.join(aligner_output_dir, NEGATIVE_DIRNAME)
+        if not os.path.isdir(negative_dir):
+            logger.debug('Creating directory ' + negative_dir)
+            os.mkdir(negative_dir)
+        else:
+            logger.debug('Directory already exists at ' + negative_dir)
+
+        output_filenames = [query_output_filename(negative_dir, pdbid)
+                            for pdbid in query_pdbids]
+
+        # in scan mode, the queries against this family are run with those
+        # against every other family, after this loop
+        if scan:
+            if not will_exist(os.path.join(aligner_output_dir,
+                                           HMMER_HMM_FILENAME)):
+                logger.critical('No model found in ' + aligner_output_dir)
+                logger.critical('Please run generate-hmm.py first')
+                return 4
+            family_output_filenames.append(output_filenames)
+            for i, ((pdbid, shared_pdbids), output_filename) in \
+                    enumerate(zip(queries, output_filenames)):
+                write_shared_chains(output_filename, shared_pdbids)
+                write_query_readme(output_filename + '.README',
+                                   scan_cmds[i // shard_size])
+            continue
+
+        # split the queries against this family into restartable shards
+        for start in range(0, len(queries), shard_size):
+            shard_pdbids = query_pdbids[start:start + shard_size]
+            shard_outputs = output_filenames[start:start + shard_size]
+
+            # determine which executable and model file to use for each
+            # query; in batch mode, the whole shard is queried at once and its
+            # output split
+            if batch:
+                batch_fasta_filename, names = batches[start // shard_size]
+                batch_filename = batch_output_filename(negative_dir,
+                                                       shard_pdbids)
+                batch_cmd = batch_query_command(aligner, aligner_output_dir,
+                                                batch_fasta_filename,
+                                                batch_filename)
+                query_cmds = [batch_cmd] * len(shard_pdbids)
+                shard_cmds = [batch_cmd,
+                              Call(split_batch_output, batch_filename, names,
+                                   shard_outputs)]
+            else:
+                try:
+                    query_cmds = [query_command(aligner, aligner_output_dir,
+                                                fasta_filename,
+                                                output_filename)
+                                  for fasta_filename, output_filename in
+                                  zip(fasta_filenames[start:start
+                                                      + shard_size],
+                                      shard_outputs)]
+                except ValueError as error:
+                    logger.critical(str(error))
+                    return 1
+                shard_cmds = query_cmds
+
+            for (pdbid, shared_pdbids), output_filename, query_cmd in \
+                    zip(queries[start:start + shard_size], shard_outputs,
+                        query_cmds):
+                write_shared_chains(output_filename, shared_pdbids)
+
+                # add a README to the directory containing the alignment of
+                # the current query protein
+                query_readme = output_filename + '.README'
+                write_query_readme(query_readme, query_cmd)
+
+            # the shard is run again if the model is built again
+            shard_model_filename = model_filename(aligner, aligner_output_dir)
+            query_jobs.append(Job(negative_dir + ' [' + str(start) + ':'
+                                  + str(start + len(shard_outputs)) + ']',
+                                  shard_cmds, keep_going=not batch,
+                                  done_filename=partial(shard_done_filename,
+                                                        negative_dir,
+                                                        shard_outputs,
+                                                        shard_model_filename,
+                                                        shard_cmds),
+                                  inputs=[shard_model_filename]))
+
+    # in scan mode, gather the models of every family into a single database,
+    # each named by the sunid of its family, once every model has been built,
+    # and split each shard into the negative directory of each family
+    if scan:
+        model_filenames = [os.path.join(output_dir, sunid, aligner,
+                                        HMMER_HMM_FILENAME)
+                           for sunid in sunids]
+        query_jobs.append(Job(database_filename,
+                              [Call(write_scan_database, model_filenames,
+                                    sunids, database_filename),
+                               press_command(database_filename)],
+                              inputs=model_filenames,
+                              outputs=[database_filename]))
+        for start in range(0, len(queries), shard_size):
+            batch_fasta_filename, names = batches[start // shard_size]
+            shard_outputs = [output_filenames[start:start + shard_size]
+                             for output_filenames in family_output_filenames]
+            scan_filename = scan_filenames[start // shard_size]
+            shard_cmds = [scan_cmds[start // shard_size],
+                          Call(split_scan_output_by_family, scan_filename,
+                               names, sunids, shard_outputs)]
+            query_jobs.append(Job(database_filename + ' [' + str(start) + ':'
+                                  + str(start + len(names)) + ']',
+                                  shard_cmds,
+                                  done_filename=partial(shard_done_filename,
+                                                        output_dir,
+                                                        sum(shard_outputs,
+                                                            []),
+                                                        database_filename,
+                                                        shard_cmds),
+                                  inputs=[database_filename]))
+
+    # run the shards, at most num_jobs at a time, after the database in scan
+    # mode
+    logger.debug('Running ' + str(len(queries)) + ' queries against each of '
+                 + str(len(sunids)) + ' families in ' + str(len(query_jobs))
+                 + ' shards, ' + str(num_jobs) + ' at a time...')
+    log_summary(run_graph(query_jobs, num_jobs))
+    return 0
@@ -0,0 +1,344 @@
+# evaluation.py - accuracy statistics of the positive and negative controls
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Provides functions for computing the accuracy of an aligner from the scores
+of its positive and negative controls, as summarized by generate-csv.py: ROC
+curves, the area under the ROC curve (AUC), the ROC50 score, the sensitivity
+at fixed false positive rates, and bootstrap confidence intervals of each.
+
+The scores are sorted once, and every statistic is computed from cumulative
+sums of the labels in that order, evaluated only at the last of each run of
+equal scores, so that tied scores are treated as a single threshold. The
+bootstrap resamples the controls by giving each one a random Poisson(1)
+weight, so that many resamples can be computed at once from the same sorted
+order, as rows of two dimensional arrays of cumulative sums.
+
+"""
+
+from util import require_python_version
+require_python_version(2, 7)
+
+import numpy
+
+from constants import DEFAULT_CONFIDENCE
+from constants import DEFAULT_NUM_RESAMPLES
+from constants import DEFAULT_ROC_N
+from constants import MRFY
+from results import load_results
+from results import results_dirname
+
+# the aligners for which a lower score is a better match; every other aligner
+# gives a higher score to a better match
+LOWER_IS_BETTER = frozenset((MRFY, ))
+
+# the default false positive rates at which the sensitivity is reported
+DEFAULT_FPRS = (0.001, 0.01, 0.05, 0.1)
+
+# the maximum number of weights held in memory at once during the bootstrap,
+# which determines how many resamples are computed together
+MAX_BATCH_ELEMENTS = 1 << 24
+
+def oriented_scores(aligner, scores):
+    """Returns the specified scores of the specified aligner as a float array
+    in which a higher score is always a better match.
+
+    The scores of aligners in LOWER_IS_BETTER are negated, so, for example,
+    the score of 1000000 which stands for an infinite MRFy score becomes the
+    worst possible score. Missing scores (NaN) become negative infinity.
+
+    """
+    scores = numpy.array(scores, dtype=numpy.float64)
+    if aligner in LOWER_IS_BETTER:
+        scores = -scores
+    scores[numpy.isnan(scores)] = -numpy.inf
+    return scores
+
+def _sorted(scores, labels):
+    """Returns the specified scores and labels in decreasing order of score,
+    along with the indices of the last element of each run of equal scores.
+
+    """
+    order = numpy.argsort(-scores, kind='mergesort')
+    scores = scores[order]
+    labels = numpy.asarray(labels, dtype=bool)[order]
+    ends = numpy.append(numpy.flatnonzero(scores[1:] != scores[:-1]),
+                        len(scores) - 1) if len(scores) else \
+        numpy.zeros(0, dtype=numpy.intp)
+    return scores, labels, ends
+
+def _counts(labels, ends, weights=None):
+    """Returns the cumulative (weighted) numbers of true positives and false
+    positives at each threshold, starting from zero, given the labels in
+    decreasing order of score and the indices of the ends of the thresholds.
+
+    If `weights' is a two dimensional array, with one row of weights for each
+    resample, the result has one row for each resample.
+
+    """
+    positives = labels.astype(numpy.float64)
+    negatives = 1.0 - positives
+    if weights is not None:
+        positives = weights * positives
+        negatives = weights * negatives
+    zero = numpy.zeros(positives.shape[:-1] + (1, ))
+    tps = numpy.cumsum(positives, axis=-1)[..., ends]
+    fps = numpy.cumsum(negatives, axis=-1)[..., ends]
+    return (numpy.concatenate((zero, tps), axis=-1),
+            numpy.concatenate((zero, fps), axis=-1))
+
+def _divide(numerator, denominator):
+    """Returns numerator / denominator, or NaN where the denominator is 0."""
+    denominator = numpy.asarray(denominator, dtype=numpy.float64)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return numpy.where(denominator > 0, numerator / denominator, numpy.nan)
+
+def _auc(tps, fps):
+    """Returns the area under the ROC curves with the specified cumulative
+    counts.
+
+    """
+    area = numpy.sum((fps[..., 1:] - fps[..., :-1])
+                     * (tps[..., 1:] + tps[..., :-1]) / 2.0, axis=-1)
+    return _divide(area, tps[..., -1] * fps[..., -1])
+
+def _roc_n(tps, fps, n):
+    """Returns the ROCn scores of the ROC curves with the specified cumulative
+    counts, that is, the area under each curve up to the nth false positive,
+    divided by n times the number of positives.
+
+    A curve with fewer than n false positives is extended at its final number
+    of true positives.
+
+    """
+    x0 = fps[..., :-1]
+    dx = fps[..., 1:] - x0
+    y0 = tps[..., :-1]
+    dy = tps[..., 1:] - y0
+    # the width of each segment which lies below n false positives, and the
+    # number of true positives at the end of that part of the segment
+    width = numpy.clip(numpy.minimum(fps[..., 1:], n) - x0, 0, None)
+    y1 = y0 + dy * _divide(width, dx)
+    y1 = numpy.where(dx > 0, y1, y0 + dy)
+    area = numpy.sum(width * (y0 + y1) / 2.0, axis=-1)
+    area += numpy.clip(n - fps[..., -1], 0, None) * tps[..., -1]
+    return _divide(area, n * tps[..., -1])
+
+def _sensitivity(tps, fps, fprs):
+    """Returns the highest true positive rate of the ROC curves with the
+    specified cumulative counts at a false positive rate no greater than each
+    of the specified rates, with one column for each rate.
+
+    The sensitivity is NaN for a curve with no positive or no negative
+    controls, as the area under it is.
+
+    """
+    tpr = _divide(tps, tps[..., -1:])
+    has_negatives = fps[..., -1] > 0
+    # a curve with no negatives has no false positive rate, so its rates are
+    # replaced by zeros, and its sensitivity by NaN below
+    fpr = numpy.where(has_negatives[..., None],
+                      _divide(fps, fps[..., -1:]), 0.0)
+    columns = []
+    for rate in fprs:
+        # the false positive rates of each curve never decrease, so the last
+        # threshold within the rate is the one with the most true positives
+        last = numpy.maximum(numpy.sum(fpr <= rate, axis=-1) - 1, 0)
+        column = numpy.take_along_axis(tpr, last[..., None], axis=-1)[..., 0]
+        columns.append(numpy.where(has_negatives, column, numpy.nan))
+    return numpy.stack(columns, axis=-1)
+
+class RocCurve(object):
+    """The ROC curve of a set of scored positive and negative controls.
+
+    `thresholds' is the decreasing list of distinct scores, and `tps' and
+    `fps' are the numbers of true positives and false positives scoring at
+    least each threshold, each preceded by 0.
+
+    """
+
+    def __init__(self, scores, labels):
+        """Computes the ROC curve of the specified scores, in which a higher
+        score is a better match (see oriented_scores), and labels, which are
+        True for the positive controls.
+
+        """
+        scores, labels, ends = _sorted(numpy.asarray(scores,
+                                                     dtype=numpy.float64),
+                                       labels)
+        self._labels = labels
+        self._ends = ends
+        self.thresholds = scores[ends]
+        self.tps, self.fps = _counts(labels, ends)
+        self.positives = int(self.tps[-1])
+        self.negatives = int(self.fps[-1])
+
+    @property
+    def tpr(self):
+        """The true positive rate at each threshold, preceded by 0."""
+        return _divide(self.tps, self.positives)
+
+    @property
+    def fpr(self):
+        """The false positive rate at each threshold, preceded by 0."""
+        return _divide(self.fps, self.negatives)
+
+    def auc(self):
+        """Returns the area under this curve, or NaN if there are no positive
+        or no negative controls.
+
+        """
+        return float(_auc(self.tps, self.fps))
+
+    def roc_n(self, n=DEFAULT_ROC_N):
+        """Returns the ROCn score of this curve (for example, the ROC50 score
+        for the default n), or NaN if there are no positive controls.
+
+        """
+        return float(_roc_n(self.tps, self.fps, n))
+
+    def sensitivity(self, fprs=DEFAULT_FPRS):
+        """Returns the list of the highest true positive rates at a false
+        positive rate no greater than each of the specified rates.
+
+        """
+        return list(_sensitivity(self.tps, self.fps, fprs))
+
+    def bootstrap(self, num_resamples=DEFAULT_NUM_RESAMPLES,
+                  confidence=DEFAULT_CONFIDENCE, n=DEFAULT_ROC_N,
+                  fprs=DEFAULT_FPRS, seed=None):
+        """Returns a map from the name of each statistic ('auc', 'roc_n', and
+        'sensitivity') to a tuple containing the lower and upper bounds of its
+        bootstrap confidence interval at the specified confidence level.
+
+        Each resample gives every control a random Poisson(1) weight, and the
+        resamples are computed in batches of as many as fit in
+        MAX_BATCH_ELEMENTS weights. The bounds of the sensitivity are lists,
+        with one element for each of the specified false positive rates.
+
+        """
+        random = numpy.random.RandomState(seed)
+        size = max(1, len(self._labels))
+        batch_size = max(1, MAX_BATCH_ELEMENTS // size)
+        samples = {'auc': [], 'roc_n': [], 'sensitivity': []}
+        remaining = num_resamples
+        while remaining > 0:
+            batch = min(batch_size, remaining)
+            weights = random.poisson(1.0, size=(batch, len(self._labels)))
+            tps, fps = _counts(self._labels, self._ends, weights)
+            samples['auc'].append(_auc(tps, fps))
+            samples['roc_n'].append(_roc_n(tps, fps, n))
+            samples['sensitivity'].append(_sensitivity(tps, fps, fprs))
+            remaining -= batch
+        alpha = (1.0 - confidence) / 2.0
+        intervals = {}
+        for name, values in samples.iteritems():
+            values = numpy.concatenate(values, axis=0)
+            lower, upper = numpy.nanpercentile(values,
+                                               [100.0 * alpha,
+                                                100.0 * (1.0 - alpha)],
+                                               axis=0)
+            if name == 'sensitivity':
+                intervals[name] = (list(lower), list(upper))
+            else:
+                intervals[name] = (float(lower), float(upper))
+        return intervals
+
+def family_curves(results, aligner):
+    """Returns a map from each family in the specified Results of the
+    specified aligner to the RocCurve of the controls of its model.
+
+    The scores are sorted by family once, so each family is a contiguous
+    slice of a single array.
+
+    """
+    scores = oriented_scores(aligner, results.scores)
+    families = numpy.asarray(results.families)
+    labels = numpy.asarray(results.labels)
+    order = numpy.argsort(families, kind='mergesort')
+    families = families[order]
+    starts = numpy.searchsorted(families,
+                                numpy.arange(len(results.family_names)))
+    ends = numpy.append(starts[1:], len(families))
+    curves = {}
+    for code, family in enumerate(results.family_names):
+        rows = order[starts[code]:ends[code]]
+        curves[str(family)] = RocCurve(scores[rows], labels[rows])
+    return curves
+
+def pooled_curve(results, aligner):
+    """Returns the RocCurve of all the controls in the specified Results of
+    the specified aligner together.
+
+    """
+    return RocCurve(oriented_scores(aligner, results.scores), results.labels)
+
+def evaluate(output_dir, aligners):
+    """Loads the results store written by generate-csv.py for each of the
+    specified aligners in the specified output directory, and returns a map
+    from each aligner to a tuple containing its pooled RocCurve and the map
+    from each family to its RocCurve.
+
+    """
+    evaluations = {}
+    for aligner in aligners:
+        results = load_results(results_dirname(output_dir, aligner))
+        evaluations[aligner] = (pooled_curve(results, aligner),
+                                family_curves(results, aligner))
+    return evaluations
+
+def _interval(value, bounds):
+    """Returns the specified statistic followed by its specified confidence
+    interval, as a string.
+
+    """
+    return '%.4f [%.4f, %.4f]' % ((value, ) + tuple(bounds))
+
+def evaluation_report(evaluations, n=DEFAULT_ROC_N, fprs=DEFAULT_FPRS,
+                      num_resamples=DEFAULT_NUM_RESAMPLES,
+                      confidence=DEFAULT_CONFIDENCE, seed=None,
+                      families=False):
+    """Returns the list of the lines of a report of the AUC, the ROCn score
+    and the sensitivity at each of the specified false positive rates, each
+    with its bootstrap confidence interval, of each aligner in the specified
+    map returned by evaluate.
+
+    If `families' is True, the AUC and ROCn score of the model of each family
+    follow those of the aligner.
+
+    """
+    lines = []
+    for aligner in sorted(evaluations):
+        curve, curves = evaluations[aligner]
+        intervals = curve.bootstrap(num_resamples, confidence, n, fprs, seed)
+        lines.append(aligner + ': ' + str(curve.positives) + ' positive and '
+                     + str(curve.negatives) + ' negative controls, '
+                     + '%g%%' % (100 * confidence) + ' confidence intervals')
+        lines.append('  AUC:     ' + _interval(curve.auc(), intervals['auc']))
+        lines.append('  ROC' + str(n) + ':' + ' ' * max(1, 5 - len(str(n)))
+                     + _interval(curve.roc_n(n), intervals['roc_n']))
+        lower, upper = intervals['sensitivity']
+        for rate, value, bounds in zip(fprs, curve.sensitivity(fprs),
+                                       zip(lower, upper)):
+            lines.append('  sensitivity at FPR ' + '%g' % rate + ': '
+                         + _interval(value, bounds))
+        if families:
+            for family in sorted(curves, key=int):
+                lines.append('  family ' + family + ': AUC '
+                             + '%.4f' % curves[family].auc() + ', ROC'
+                             + str(n) + ' '
+                             + '%.4f' % curves[family].roc_n(n))
+    return lines
@@ -23,35 +23,415 @@ from util import require_python_version
 require_python_version(2, 7)
 
 import gzip
+import hashlib
+import mmap
+import threading
+from collections import Mapping
+
+from Bio import bgzf
+
+from cache import cached_index
+from logger import logger
+from refclient import ReferenceServerError
+from refclient import call
+from refclient import function_name
+from refclient import register
+from refclient import server_available
+from util import chain_name
 
 # the FASTA file containing all protein sequences, along with their PDB IDs
 FASTA_FILENAME = '/r/bcb/protein_structure/PDB/pdb_seqres.fasta'
 
-def sequences_from_file(filename):
-    """Read the specified file containing multiple sequences in FASTA format
-    and return a map from PDB ID to tuple containing the header line and the
-    sequence line of that protein.
+# the kind of index saved for FASTA files; change this whenever the structure
+# of the index built by _index_from_file changes
+INDEX_KIND = 'fasta2'
+
+# the first bytes of a file compressed in the blocked gzip format (BGZF)
+BGZF_MAGIC = '\x1f\x8b\x08\x04'
+
+def _is_bgzf(filename):
+    """Returns True if and only if the specified file is compressed in the
+    blocked gzip format, as written by `bgzip'.
+
+    """
+    with open(filename, 'rb') as f:
+        header = f.read(14)
+    return header[:4] == BGZF_MAGIC and header[12:14] == 'BC'
+
+def _open_fasta(filename):
+    """Opens the specified FASTA file for random access, returning a file-like
+    object with readline, read, tell and seek methods.
+
+    Files ending in '.gz' are opened with Bio.bgzf if they are in the blocked
+    gzip format, in which case offsets are BGZF virtual offsets. Other gzipped
+    files can only be read by decompressing from the beginning, so seeking
+    backwards in them is slow.
+
+    """
+    if filename[-3:] != '.gz':
+        return open(filename, 'rb')
+    if _is_bgzf(filename):
+        return bgzf.BgzfReader(filename, 'rb')
+    logger.warning('FASTA file ' + filename + ' is not block gzipped; random '
+                   'access will be slow (compress it with bgzip instead)')
+    return gzip.open(filename, 'rb')
+
+def _index_from_file(filename):
+    """Reads the specified file containing multiple sequences in FASTA format
+    and returns a list containing an (identifier, offset, length, digest) tuple
+    for each record.
+
+    The identifier is the first word of the header line, without the leading
+    '>' (for example, '101m_A'). The offset is the position of the header line,
+    as returned by the tell method of the file opened by _open_fasta, and the
+    length is the number of bytes in the header and sequence lines. The digest
+    is the MD5 digest of the residues of the sequence, so records with
+    identical sequences have identical digests.
+
+    """
+    index = []
+    record = None
+    with _open_fasta(filename) as f:
+        offset = f.tell()
+        line = f.readline()
+        while line:
+            if line[0] == '>':
+                if record is not None:
+                    index.append(tuple(record[:3]) + (record[3].digest(), ))
+                record = [line[1:].split(None, 1)[0], offset, 0, hashlib.md5()]
+            elif record is not None:
+                record[3].update(line.strip().upper())
+            if record is not None:
+                record[2] += len(line)
+            offset = f.tell()
+            line = f.readline()
+    if record is not None:
+        index.append(tuple(record[:3]) + (record[3].digest(), ))
+    return index
+
+def chain_key(identifier):
+    """Returns the PDB ID:chain key of the record with the specified
+    identifier, for example '101m:A' for the identifier '101m_A', as named by
+    gargamel.util.chain_name.
+
+    """
+    pdbid, underscore, chain = identifier.partition('_')
+    return chain_name(pdbid, chain)
+
+class IndexedSequences(Mapping):
+    """A read-only mapping from PDB ID to a tuple containing the header line
+    and the sequence line of that protein, as read from a FASTA file.
+
+    If `by_chain' is True, the mapping is instead keyed by PDB ID:chain (for
+    example '101m:A'), so that each chain of a protein has its own entry.
+    Otherwise, the FASTA file contains entries for the A, B, C, etc. chains of
+    the same protein, and only the first entry for each PDB ID is used.
+
+    Only the offsets of the records are held in memory. Each record is read
+    from the file when it is requested, by seeking to its offset, so only the
+    records which are actually used are ever read. The offsets are saved in
+    INDEX_DIR the first time a file is read.
+
+    """
+
+    def __init__(self, filename, by_chain=False):
+        """Instantiates this mapping for the specified FASTA file, which may be
+        uncompressed, gzipped, or block gzipped.
+
+        """
+        super(IndexedSequences, self).__init__()
+        self.filename = filename
+        self.by_chain = by_chain
+        self._offsets = {}
+        self._digests = {}
+        for identifier, offset, length, digest in \
+                cached_index(filename, INDEX_KIND, _index_from_file):
+            if by_chain:
+                key = chain_key(identifier)
+            else:
+                key = identifier[0:4]
+            if key not in self._offsets:
+                self._offsets[key] = (offset, length)
+                self._digests[key] = digest
+        self._file = None
+        self._lock = threading.Lock()
+
+    def digest(self, key):
+        """Returns the MD5 digest of the residues of the sequence with the
+        specified key.
+
+        """
+        return self._digests[key]
+
+    def identical_groups(self, keys):
+        """Groups the specified keys by the sequences to which they map.
+
+        Returns a list of (key, shared_keys) tuples, one for each distinct
+        sequence, where `key' is the first of the specified keys (in sorted
+        order) with that sequence and `shared_keys' is a list of the others.
+        Keys which are not in this mapping are ignored.
+
+        """
+        groups = {}
+        for key in sorted(keys):
+            if key in self._digests:
+                groups.setdefault(self._digests[key], []).append(key)
+        return sorted((group[0], group[1:]) for group in groups.itervalues())
+
+    def records(self, keys):
+        """Returns a map from each of the specified keys which is in this
+        mapping to its (header, sequence) tuple.
+
+        """
+        return dict((key, self[key]) for key in keys if key in self._offsets)
+
+    def _read(self, offset, length):
+        """Returns the (header, sequence) tuple of the record of the specified
+        length at the specified offset.
+
+        """
+        with self._lock:
+            if self._file is None:
+                self._file = _open_fasta(self.filename)
+            self._file.seek(offset)
+            text = self._file.read(length)
+        split = text.index('\n') + 1
+        return text[:split], text[split:]
+
+    def __getitem__(self, pdbid):
+        """Returns the (header, sequence) tuple for the specified PDB ID."""
+        offset, length = self._offsets[pdbid]
+        return self._read(offset, length)
+
+    def __contains__(self, pdbid):
+        """Returns True if and only if the file contains the specified PDB
+        ID.
+
+        """
+        return pdbid in self._offsets
+
+    def __iter__(self):
+        """Returns an iterator over the PDB IDs in the file."""
+        return iter(self._offsets)
+
+    def __len__(self):
+        """Returns the number of PDB IDs in the file."""
+        return len(self._offsets)
+
+    def close(self):
+        """Closes the FASTA file, if it has been opened."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+class MappedSequences(IndexedSequences):
+    """A read-only mapping from PDB ID to a tuple containing the header line
+    and the sequence line of that protein, served from a memory map of an
+    uncompressed FASTA file.
+
+    The header and sequence are read-only buffer objects which refer directly
+    to the mapped file, so looking up a sequence copies nothing. Every process
+    which maps the same file shares the single copy of it in the page cache.
+    The buffers can be passed to file.write and file.writelines, or converted
+    to strings with str.
+
+    """
+
+    def __init__(self, filename, by_chain=False):
+        """Instantiates this mapping for the specified uncompressed FASTA
+        file.
+
+        """
+        if filename[-3:] == '.gz':
+            raise ValueError('Cannot memory map compressed FASTA file '
+                             + filename)
+        super(MappedSequences, self).__init__(filename, by_chain)
+        with open(filename, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _read(self, offset, length):
+        """Returns the (header, sequence) tuple of buffers referring to the
+        record of the specified length at the specified offset.
+
+        """
+        split = self._map.find('\n', offset, offset + length) + 1
+        return (buffer(self._map, offset, split - offset),
+                buffer(self._map, split, offset + length - split))
+
+    def close(self):
+        """Unmaps the FASTA file."""
+        self._map.close()
+
+class RemoteSequences(Mapping):
+    """A read-only mapping like IndexedSequences whose records are looked up
+    by the reference data server (see gargamel.refserver), which keeps the
+    FASTA file and its index loaded.
+
+    Each lookup is a round trip to the server, so many records should be
+    fetched at once with `records'; the records fetched that way are
+    remembered, and later lookups of the same keys are answered without asking
+    the server. If the connection to the server is lost, the records are read
+    directly from the file instead.
+
+    """
+
+    def __init__(self, filename, by_chain=False):
+        """Instantiates this mapping for the specified FASTA file, as opened
+        by the reference data server.
+
+        """
+        super(RemoteSequences, self).__init__()
+        self.filename = filename
+        self.by_chain = by_chain
+        self._keys = None
+        self._local = None
+        # the records fetched by `records', and the keys found to be missing
+        self._records = {}
+        self._missing = set()
+
+    def _call(self, method, *args):
+        """Returns the result of calling the specified method of the mapping
+        on the server with the specified arguments.
+
+        """
+        if self._local is None:
+            try:
+                return call(function_name(_served_sequences_call),
+                            self.filename, self.by_chain, method, *args)
+            except ReferenceServerError as error:
+                logger.warning(str(error) + '; reading ' + self.filename
+                               + ' directly')
+                self._local = mapped_sequences_from_file(self.filename,
+                                                         self.by_chain)
+        if method == 'keys':
+            return list(self._local)
+        return getattr(self._local, method)(*args)
+
+    def digest(self, key):
+        """Returns the MD5 digest of the residues of the sequence with the
+        specified key.
+
+        """
+        return self._call('digest', key)
+
+    def identical_groups(self, keys):
+        """Groups the specified keys by the sequences to which they map, as
+        described in IndexedSequences.identical_groups.
+
+        """
+        return self._call('identical_groups', list(keys))
+
+    def records(self, keys):
+        """Returns a map from each of the specified keys which is in this
+        mapping to its (header, sequence) tuple, asking the server only for
+        the keys which have not been fetched before, in a single call.
+
+        """
+        keys = set(keys)
+        wanted = list(keys - self._missing - set(self._records))
+        if wanted:
+            found = self._call('records', wanted)
+            self._records.update(found)
+            self._missing.update(key for key in wanted if key not in found)
+        return dict((key, self._records[key]) for key in keys
+                    if key in self._records)
+
+    def __getitem__(self, pdbid):
+        """Returns the (header, sequence) tuple for the specified PDB ID."""
+        if pdbid in self._records:
+            return self._records[pdbid]
+        if pdbid in self._missing:
+            raise KeyError(pdbid)
+        return self._call('__getitem__', pdbid)
+
+    def __contains__(self, pdbid):
+        """Returns True if and only if the file contains the specified PDB
+        ID.
+
+        """
+        if pdbid in self._records:
+            return True
+        if pdbid in self._missing:
+            return False
+        return self._call('__contains__', pdbid)
+
+    def __iter__(self):
+        """Returns an iterator over the PDB IDs in the file."""
+        if self._keys is None:
+            self._keys = self._call('keys')
+        return iter(self._keys)
+
+    def __len__(self):
+        """Returns the number of PDB IDs in the file."""
+        return self._call('__len__')
+
+    def close(self):
+        """Closes the FASTA file, if it has been read directly."""
+        if self._local is not None:
+            self._local.close()
+
+# the mappings opened by the reference data server, keyed by filename and
+# by_chain
+_served_sequences = {}
+_served_sequences_lock = threading.Lock()
+
+@register
+def _served_sequences_call(filename, by_chain, method, *args):
+    """Calls the specified method of the mapping from the specified FASTA file
+    held by the reference data server, on behalf of a RemoteSequences.
+
+    Records are returned as strings, and the method 'keys' returns a list of
+    all of the keys of the mapping.
+
+    The whole mapping is never returned, only the records asked for.
 
     """
-    # determine the command which opens the FASTA file (gzip.open or open)
-    open_cmd = (open, gzip.open)[filename[-3:] == '.gz']
+    with _served_sequences_lock:
+        if (filename, by_chain) not in _served_sequences:
+            _served_sequences[filename, by_chain] = \
+                mapped_sequences_from_file(filename, by_chain)
+        sequences = _served_sequences[filename, by_chain]
+    if method == '__getitem__':
+        return tuple(str(part) for part in sequences[args[0]])
+    elif method == 'records':
+        return dict((key, tuple(str(part) for part in record))
+                    for key, record in sequences.records(args[0]).iteritems())
+    elif method == 'keys':
+        return list(sequences)
+    elif method in ('digest', 'identical_groups', '__contains__', '__len__'):
+        return getattr(sequences, method)(*args)
+    raise ValueError('Unknown method of served sequences: ' + method)
 
-    sequences = {}
-    with open_cmd(filename, 'r') as f:
+def sequences_from_file(filename, by_chain=False):
+    """Returns a mapping from PDB ID to tuple containing the header line and
+    the sequence line of that protein, read from the specified file containing
+    multiple sequences in FASTA format.
 
-        # get the header line and the sequence
-        header = f.readline()
-        sequence = f.readline()
+    If `by_chain' is True, the mapping is from PDB ID:chain instead.
 
-        while not header == '':
-            # this can happen when there are FASTA entries for A, B, C,
-            # etc. chains. However, the sequences seem to be identical.
-            # TODO check that the sequences in the FASTA file are identical
-            id = header[1:5]
-            if id not in sequences:
-                sequences[id] = (header, sequence)
+    The returned mapping is an IndexedSequences, so sequences are read from
+    the file only when they are looked up, or a RemoteSequences if a reference
+    data server is running.
 
-            header = f.readline()
-            sequence = f.readline()
+    """
+    if server_available():
+        return RemoteSequences(filename, by_chain)
+    return IndexedSequences(filename, by_chain)
+
+def mapped_sequences_from_file(filename, by_chain=False):
+    """Returns a mapping like that returned by sequences_from_file, but backed
+    by a memory map of the specified FASTA file (see MappedSequences).
 
-    return sequences
+    Compressed files cannot be memory mapped, so for those an IndexedSequences
+    is returned instead. If a reference data server is running, a
+    RemoteSequences is returned.
+
+    """
+    if server_available():
+        return RemoteSequences(filename, by_chain)
+    if filename[-3:] == '.gz':
+        logger.debug('Cannot memory map ' + filename + '; reading records '
+                     'from the file instead')
+        return IndexedSequences(filename, by_chain)
+    return MappedSequences(filename, by_chain)
@@ -22,36 +22,13 @@
 from util import require_python_version
 require_python_version(2, 7)
 
+import collections
+import os
+import os.path
 import re
-from logger import logger
-
-SCORES_REGEX = r"""(?P<result>  # the total result group
-                     (?P<scores>  # the group containing the score triples
-                       (-?[0-9]+      # a number...
-                       (\.[0-9]+)?  # ...possibly followed by a decimal...
-                       (e-?[0-9]+)? # ...possibly followed by an exponent...
-                       \s+          # ...followed by spaces...
-                       ){3}         # ...repeated three times
-                     ){2}         # repeated two times
-                     [0-9]+(.[0-9]+)? # a decimal number
-                     \s+              # followed by spaces
-                     [0-9]+           # followed by an integer
-                     \s+              # followed by spaces
-                     (?P<sequence>  # the sequence ID group
-                       [0-9A-Z]{4}    # four letters or numbers (the PDBID)...
-                       _[A-Z0-9]         # ...the underscore and the chain ID
-                     )
-                   )"""
-"""A regular expression matching the score line of an output file from
-`hmmsearch'.
-
-"""
+import tempfile
 
-scores_regex = re.compile(SCORES_REGEX, re.IGNORECASE | re.VERBOSE)
-"""The compiled regular expression, ignoring case, and allowing for extra
-comments and whitespace within the regular expression string.
-
-"""
+from logger import logger
 
 class Score(object):
     """A score for a HMMER alignment.
@@ -71,6 +48,48 @@ class Score(object):
         return 'Score[{}, {}, {}]'.format(self.evalue, self.score, self.bias)
 
 
+class Domain(object):
+    """A single domain of a HMMER alignment, as listed in the domain
+    annotation of the output of, for example, `hmmsearch'.
+
+    `included' is True if and only if the domain satisfies the inclusion
+    thresholds (marked by '!' in the output). `alignment' is the list of the
+    lines of the alignment of this domain, if they were read.
+
+    """
+
+    def __init__(self, number, included, score, bias, c_evalue, i_evalue,
+                 hmm_from, hmm_to, ali_from, ali_to, env_from, env_to, acc):
+        """Instantiates this domain with the specified fields of its line in
+        the domain annotation.
+
+        """
+        self.number = int(number)
+        self.included = included
+        self.score = float(score)
+        self.bias = float(bias)
+        self.c_evalue = float(c_evalue)
+        self.i_evalue = float(i_evalue)
+        self.hmm_from = int(hmm_from)
+        self.hmm_to = int(hmm_to)
+        self.ali_from = int(ali_from)
+        self.ali_to = int(ali_to)
+        self.env_from = int(env_from)
+        self.env_to = int(env_to)
+        self.acc = float(acc)
+        self.alignment = []
+
+    def __str__(self):
+        """Returns the string representation of this domain."""
+        return 'Domain[{}: {}, {}, {}-{}, {}-{}]'.format(self.number,
+                                                        self.score,
+                                                        self.i_evalue,
+                                                        self.hmm_from,
+                                                        self.hmm_to,
+                                                        self.ali_from,
+                                                        self.ali_to)
+
+
 class HmmerResult(object):
     """The result of a HMMER alignment, as expressed by the output from, for
     example, `hmmsearch'.
@@ -82,10 +101,13 @@ class HmmerResult(object):
     """
 
     def __init__(self, full_seq_score, best_domain_score, domain_exp, domain_N,
-                 pdbid, chain):
+                 pdbid, chain, domains=None):
         """Instantiates this class with the specified Score objects for the
         full sequence and the best one domain, respectively.
 
+        `domains' is the list of Domain objects of the alignment, if they were
+        read.
+
         """
         self.full_seq_score = full_seq_score
         self.best_domain_score = best_domain_score
@@ -93,6 +115,7 @@ class HmmerResult(object):
         self.domain_N = int(domain_N)
         self.pdbid = pdbid
         self.chain = chain
+        self.domains = domains if domains is not None else []
 
     def __str__(self):
         """Returns the string representation of this result."""
@@ -104,36 +127,535 @@ class HmmerResult(object):
                                                         self.domain_N)
 
 
+def _result_from_fields(fields):
+    """Returns a HmmerResult from the specified whitespace-separated fields of
+    a score line of the output of `hmmsearch'.
+
+    """
+    # get the PDBID and chain ID from the name of the target sequence
+    pdbid, _, chain = fields[8].partition('_')
+    return HmmerResult(Score(*fields[0:3]), Score(*fields[3:6]), fields[6],
+                       fields[7], pdbid, chain)
+
+def _domain_from_fields(fields):
+    """Returns a Domain from the specified whitespace-separated fields of a
+    line of the domain annotation of the output of `hmmsearch'.
+
+    """
+    # the fields between the coordinates mark whether each range is complete
+    return Domain(fields[0], fields[1] == '!', *(fields[2:8] + fields[9:11]
+                                                 + fields[12:14] + fields[15:16]))
+
+def _is_domain_line(fields):
+    """Returns True if and only if the specified fields are those of a line of
+    the domain annotation table of a single target.
+
+    """
+    return len(fields) >= 16 and fields[0].isdigit() and fields[1] in ('!', '?')
+
+def iter_results(filename, domains=False):
+    """Reads the specified `filename' output by `hmmsearch' (or `hmmscan') and
+    yields an instance of HmmerResult for each target listed in its score
+    lines, for each query in the file, in the order in which they are listed.
+
+    The file is read one line at a time, so it is never held in memory. If
+    `domains' is False, each result is yielded as soon as its score line has
+    been read and the domain annotation is skipped. Otherwise, the Domain
+    objects of each result, including the lines of their alignments, are read
+    from the domain annotation, so the results of a single query are held
+    until its annotation has been read.
+
+    """
+    section = 'header'
+    # the results waiting for their domain annotation, keyed by target name
+    pending = collections.OrderedDict()
+    # the result and the domain whose annotation is currently being read
+    current = None
+    domain = None
+    with open(filename, 'r') as f:
+        for line in f:
+            if section == 'header':
+                # the scores follow the underlining of the column headings
+                if line.strip().startswith('-------'):
+                    section = 'scores'
+            elif section == 'scores':
+                fields = line.split()
+                if len(fields) == 0:
+                    section = 'domains' if domains else 'footer'
+                # skip the line marking the inclusion threshold
+                elif not fields[0].startswith('---') and len(fields) > 8:
+                    result = _result_from_fields(fields)
+                    if domains:
+                        pending[fields[8]] = result
+                    else:
+                        yield result
+            elif section == 'domains':
+                if line.startswith('>> ') or \
+                        line.startswith('Internal pipeline statistics'):
+                    if current is not None:
+                        yield current
+                    current = domain = None
+                    if line.startswith('>> '):
+                        current = pending.pop(line.split()[1], None)
+                    else:
+                        for result in pending.itervalues():
+                            yield result
+                        pending.clear()
+                        section = 'footer'
+                elif current is not None:
+                    fields = line.split()
+                    if line.lstrip().startswith('== domain'):
+                        number = int(fields[2])
+                        domain = ([d for d in current.domains
+                                   if d.number == number] or [None])[0]
+                    elif domain is not None:
+                        if fields:
+                            domain.alignment.append(line.rstrip('\n'))
+                    elif _is_domain_line(fields):
+                        current.domains.append(_domain_from_fields(fields))
+            # the output of each query ends with a line containing only '//'
+            elif line.startswith('//'):
+                section = 'header'
+    # yield whatever was read from a truncated file
+    if current is not None:
+        yield current
+    for result in pending.itervalues():
+        yield result
+
 def result_from_file(filename):
     """Reads the specified `filename' output by `hmmsearch' and returns an
-    instance of HmmResult.
+    instance of HmmResult for the first (that is, the best scoring) sequence
+    in it.
+
+    Returns None if the file is empty. If no sequence was reported, returns a
+    result with a score of -1000.
+
+    """
+    if os.path.getsize(filename) < 1:
+      return None
+    for result in iter_results(filename):
+        return result
+    return _no_result()
+
+def _no_result():
+    """Returns the fake HmmerResult, with a score of -1000, which stands for
+    an output in which no sequence was reported.
+
+    """
+    # instead, deal with broken hmmsearch
+    # return a fake HmmerResult
+    logger.debug('Got no result from input. Setting negative value.')
+    return HmmerResult(Score(1.0, -1000.0, 0.0), Score(1.0, -1000.0, 0.0),
+                       '0.0', '0', 'unkn', 'A')
+
+class TableHit(object):
+    """A single row of the tabular output of `hmmsearch' (written with the
+    --tblout option), which lists the scores of one target sequence.
+
+    Only the fields used by this package are kept, and instances have no
+    attribute dictionary, so many of them can be held at once.
+
+    """
+    __slots__ = ('target', 'query', 'evalue', 'score', 'bias', 'domain_evalue',
+                 'domain_score', 'domain_bias', 'domain_exp', 'domain_N')
+
+    def __init__(self, fields):
+        """Instantiates this hit from the whitespace-separated fields of its
+        row.
+
+        """
+        self.target = fields[0]
+        self.query = fields[2]
+        self.evalue = float(fields[4])
+        self.score = float(fields[5])
+        self.bias = float(fields[6])
+        self.domain_evalue = float(fields[7])
+        self.domain_score = float(fields[8])
+        self.domain_bias = float(fields[9])
+        self.domain_exp = float(fields[10])
+        # the number of domains defined, shown as "N" in the main output
+        self.domain_N = int(fields[15])
+
+    def result(self):
+        """Returns the HmmerResult with the scores of this hit, as read from
+        the main output by result_from_file.
+
+        """
+        pdbid, _, chain = self.target.partition('_')
+        return HmmerResult(Score(self.evalue, self.score, self.bias),
+                           Score(self.domain_evalue, self.domain_score,
+                                 self.domain_bias),
+                           self.domain_exp, self.domain_N, pdbid, chain)
+
+    def __str__(self):
+        """Returns the string representation of this hit."""
+        return 'TableHit[{}, {}: {}, {}]'.format(self.target, self.query,
+                                                 self.evalue, self.score)
+
+class DomainTableHit(object):
+    """A single row of the domain tabular output of `hmmsearch' (written with
+    the --domtblout option), which lists the scores of one domain of one
+    target sequence.
+
+    As for TableHit, only the fields used by this package are kept.
+
+    """
+    __slots__ = ('target', 'target_length', 'query', 'query_length', 'evalue',
+                 'score', 'bias', 'number', 'num_domains', 'c_evalue',
+                 'i_evalue', 'domain_score', 'domain_bias', 'hmm_from',
+                 'hmm_to', 'ali_from', 'ali_to', 'env_from', 'env_to', 'acc')
+
+    def __init__(self, fields):
+        """Instantiates this hit from the whitespace-separated fields of its
+        row.
+
+        """
+        self.target = fields[0]
+        self.target_length = int(fields[2])
+        self.query = fields[3]
+        self.query_length = int(fields[5])
+        self.evalue = float(fields[6])
+        self.score = float(fields[7])
+        self.bias = float(fields[8])
+        self.number = int(fields[9])
+        self.num_domains = int(fields[10])
+        self.c_evalue = float(fields[11])
+        self.i_evalue = float(fields[12])
+        self.domain_score = float(fields[13])
+        self.domain_bias = float(fields[14])
+        self.hmm_from = int(fields[15])
+        self.hmm_to = int(fields[16])
+        self.ali_from = int(fields[17])
+        self.ali_to = int(fields[18])
+        self.env_from = int(fields[19])
+        self.env_to = int(fields[20])
+        self.acc = float(fields[21])
+
+    def __str__(self):
+        """Returns the string representation of this hit."""
+        return 'DomainTableHit[{}, {}: {} of {}, {}]'.format(self.target,
+                                                             self.query,
+                                                             self.number,
+                                                             self.num_domains,
+                                                             self.domain_score)
+
+# the number of whitespace-separated fields before the description of the
+# target in each row of the tabular and domain tabular outputs
+TABLE_FIELDS = 18
+DOMAIN_TABLE_FIELDS = 22
+
+def _iter_rows(filename, num_fields):
+    """Yields the list of whitespace-separated fields of each row of the
+    specified tabular output file, skipping the comment lines.
+
+    The description of the target, which may contain spaces, is kept as a
+    single last field.
 
     """
-    # read all the text from the file
     with open(filename, 'r') as f:
-        all_text = f.read()
+        for line in f:
+            if not line.startswith('#') and line.strip():
+                yield line.split(None, num_fields)
+
+def iter_table(filename):
+    """Yields a TableHit for each row of the specified file written by the
+    --tblout option of `hmmsearch', in order.
+
+    """
+    for fields in _iter_rows(filename, TABLE_FIELDS):
+        yield TableHit(fields)
+
+def iter_domain_table(filename):
+    """Yields a DomainTableHit for each row of the specified file written by
+    the --domtblout option of `hmmsearch', in order.
+
+    """
+    for fields in _iter_rows(filename, DOMAIN_TABLE_FIELDS):
+        yield DomainTableHit(fields)
+
+# the last line which HMMER writes to a tabular output file once the search
+# has finished
+TABLE_TRAILER = '# [ok]'
+
+def table_finished(filename):
+    """Returns True if and only if the specified tabular output file ends with
+    the line which HMMER writes once the search has finished.
+
+    HMMER writes the rows of a tabular output file as it finds them, so the
+    file of a search which was killed part way through may be empty or may
+    list only some of the hits.
+
+    """
+    with open(filename, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 2 * len(TABLE_TRAILER) - 2))
+        lines = f.read().splitlines()
+    return bool(lines) and lines[-1].strip() == TABLE_TRAILER
+
+def result_from_table(filename):
+    """Reads the specified file written by the --tblout option of `hmmsearch'
+    and returns an instance of HmmerResult for the first (that is, the best
+    scoring) sequence in it, as result_from_file does for the main output.
+
+    Returns None if the file is empty, and a result with a score of -1000 if
+    it lists no sequence.
 
-    if len(all_text) < 1:
+    """
+    if os.path.getsize(filename) < 1:
       return None
-    # search for a match in the text
-    match = scores_regex.search(all_text)
-    # split the match up into space-separated fields
-    if match == None:
-      # instead, deal with broken hmmsearch
-      # return a fake HmmerResult
-      logger.debug('Got no result from input. Setting negative value.')
-      return HmmerResult(Score(1.0, -1000.0, 0.0), Score(1.0, -1000.0, 0.0),
-                         '0.0', '0', 'unkn', 'A')
-    fields = match.group('result').split()
-    # create the Score objects from the fields
-    full_seq_score = Score(*fields[0:3])
-    best_domain_score = Score(*fields[3:6])
-    # get the PDBID and chain ID from the last field
-    pdbid = fields[-1].split('_')[0]
-    chain = fields[-1].split('_')[1]
-
-    # return a new instance of HmmerResult, with the created full sequence and
-    # best domain scores, the domain exponent and domain N, and the PDB ID and
-    # chain ID of the compared sequence
-    return HmmerResult(full_seq_score, best_domain_score, fields[6], fields[7],
-                       pdbid, chain)
+    for hit in iter_table(filename):
+        return hit.result()
+    return _no_result()
+
+def _split_table(filename, num_fields, output_filename, swap):
+    """Reads a tabular output file and groups its rows by the file to which
+    each is to be written.
+
+    `output_filename' is a function which returns the file to which to write
+    the specified row (a list of fields), or None to drop the row. If `swap'
+    is nonzero, the target and query columns (the first `swap' fields and the
+    `swap' fields after them) are exchanged in each row. Returns a tuple
+    containing the list of the comment lines before the rows, a map from each
+    file to the list of its rows, and the list of the comment lines after the
+    rows.
+
+    """
+    header = []
+    footer = []
+    rows = collections.defaultdict(list)
+    with open(filename, 'r') as f:
+        for line in f:
+            if line.startswith('#'):
+                (footer if rows else header).append(line)
+            elif line.strip():
+                fields = line.split(None, num_fields)
+                if swap:
+                    fields = (fields[swap:2 * swap] + fields[:swap]
+                              + fields[2 * swap:])
+                    line = ' '.join(fields)
+                    if not line.endswith('\n'):
+                        line += '\n'
+                rows[output_filename(fields)].append(line)
+    return header, rows, footer
+
+def _write_tables(header, rows, footer, output_filenames):
+    """Writes the specified comment lines and rows, as returned by
+    _split_table, to each of the specified files.
+
+    """
+    for output_filename in output_filenames:
+        with open(output_filename, 'w') as f:
+            f.writelines(header)
+            f.writelines(rows.get(output_filename, ()))
+            f.writelines(footer)
+
+def split_table_output(filename, output_filenames, domains=False):
+    """Splits the tabular output (or the domain tabular output, if `domains'
+    is True) of a single `hmmsearch' of one model against many sequences, in
+    the specified file, into one file per sequence.
+
+    `output_filenames' is a map from the name of each sequence in the search
+    to the file to which to write its rows, as for split_search_output.
+
+    """
+    num_fields = DOMAIN_TABLE_FIELDS if domains else TABLE_FIELDS
+    header, rows, footer = _split_table(filename, num_fields,
+                                        lambda fields:
+                                            output_filenames.get(fields[0]),
+                                        0)
+    _write_tables(header, rows, footer, output_filenames.values())
+
+def split_scan_table_output(filename, output_filenames, domains=False):
+    """Splits the tabular output (or the domain tabular output, if `domains'
+    is True) of `hmmscan' of many sequences against a database of many models
+    into one file for each pair of sequence and model, with the target and
+    query columns exchanged, as in the tabular output of `hmmsearch' of that
+    model against that sequence alone.
+
+    `output_filenames' is a map from the name of each sequence to a map from
+    the name of each model to the file to which to write its rows, as for
+    split_scan_output.
+
+    """
+    num_fields = DOMAIN_TABLE_FIELDS if domains else TABLE_FIELDS
+    swap = 3 if domains else 2
+    header, rows, footer = _split_table(filename, num_fields,
+                                        lambda fields:
+                                            output_filenames.get(
+                                                fields[0], {}).get(
+                                                    fields[swap]),
+                                        swap)
+    _write_tables(header, rows, footer,
+                  [output_filename for models in output_filenames.values()
+                   for output_filename in models.values()])
+
+# the lines which hmmsearch writes in place of the hits table and the domain
+# annotation when no sequence scores above the reporting thresholds
+NO_HITS_LINE = '   [No hits detected that satisfy reporting thresholds]\n'
+NO_TARGETS_LINE = \
+    '   [No targets detected that satisfy reporting thresholds]\n'
+
+# the heading of the domain annotation section of the output of `hmmsearch'
+DOMAIN_HEADING = 'Domain annotation for each sequence (and alignments):\n'
+
+def _parse_search_output(lines):
+    """Splits the specified lines of the output of a single search by
+    `hmmsearch' or `hmmscan' into its sections.
+
+    Returns a tuple containing the list of lines before the score lines, a map
+    from the name of each target (a sequence for `hmmsearch', a model for
+    `hmmscan') to its score line, a map from the name of each target to the
+    list of lines of its domain annotation, and the list of lines from the
+    pipeline statistics to the end of the search.
+
+    """
+    header = []
+    scores = {}
+    domains = {}
+    footer = []
+    section = 'header'
+    target = None
+    for line in lines:
+        if section == 'header':
+            header.append(line)
+            # the scores follow the underlining of the column headings
+            if line.strip().startswith('-------'):
+                section = 'scores'
+        elif section == 'scores':
+            fields = line.split()
+            if len(fields) == 0:
+                section = 'domains'
+            # skip the line marking the inclusion threshold
+            elif not fields[0].startswith('---') and len(fields) > 8:
+                scores[fields[8]] = line
+        elif line.startswith('Internal pipeline statistics'):
+            footer.append(line)
+            section = 'footer'
+        elif section == 'domains':
+            if line.startswith('>> '):
+                target = line.split()[1]
+                domains[target] = [line]
+            elif target is not None:
+                domains[target].append(line)
+        else:
+            footer.append(line)
+    return header, scores, domains, footer
+
+def _write_search_output(filename, header, score_line, domain_lines, footer):
+    """Writes the output of a search of a single sequence by `hmmsearch' to
+    the specified file, from the specified sections, as returned by
+    _parse_search_output.
+
+    If `score_line' is None, the output states that no hits were detected.
+
+    """
+    with open(filename, 'w') as f:
+        f.writelines(header)
+        if score_line is not None:
+            f.write(score_line)
+            f.write('\n\n' + DOMAIN_HEADING)
+            f.writelines(domain_lines)
+        else:
+            f.write('\n' + NO_HITS_LINE)
+            f.write('\n\n' + DOMAIN_HEADING)
+            f.write(NO_TARGETS_LINE + '\n')
+        f.writelines(footer)
+
+def split_search_output(filename, output_filenames):
+    """Splits the output of a single `hmmsearch' of one model against many
+    sequences, in the specified file, into one output file per sequence.
+
+    `output_filenames' is a map from the name of each sequence in the search
+    (for example, '101m_A') to the file to which to write its output. Each
+    file contains the header of the search output, the score line and domain
+    annotation of that sequence alone, and the pipeline statistics of the whole
+    search, so that result_from_file reads the same result from it as from the
+    output of a search of that sequence alone. A sequence with no hit gets the
+    same "no hits" output as a search of it alone would produce.
+
+    """
+    with open(filename, 'r') as f:
+        header, scores, domains, footer = _parse_search_output(f)
+    for name, output_filename in output_filenames.iteritems():
+        _write_search_output(output_filename, header, scores.get(name),
+                             domains.get(name, ()), footer)
+
+def _rename_target(line, name):
+    """Returns the specified score line with the name of its target replaced
+    by the specified name.
+
+    """
+    match = re.match(r'(\s*(?:\S+\s+){8})\S+(.*)', line, re.DOTALL)
+    return match.group(1) + name + match.group(2)
+
+def split_scan_output(filename, output_filenames):
+    """Splits the output of `hmmscan' of many sequences against a database of
+    many models, in the specified file, into one output file for each pair of
+    sequence and model, in the format of the output of `hmmsearch' of that
+    model against that sequence alone.
+
+    `output_filenames' is a map from the name of each sequence (for example,
+    '101m_A') to a map from the name of each model (as written in the NAME
+    line of the model) to the file to which to write the output. As for
+    split_search_output, a pair with no hit gets a "no hits" output.
+
+    """
+    program_header = []
+
+    def split_query(lines):
+        header, scores, domains, footer = _parse_search_output(lines)
+        query_line = [i for i, line in enumerate(header)
+                      if line.startswith('Query:')][0]
+        scores_heading = [i for i, line in enumerate(header)
+                          if line.startswith('Scores for complete')][0]
+        if not program_header:
+            program_header.extend(header[:query_line])
+        query = header[query_line].split()[1]
+        for model, output_filename in \
+                output_filenames.get(query, {}).iteritems():
+            score_line = None
+            domain_lines = ()
+            if model in scores:
+                score_line = _rename_target(scores[model], query)
+                domain_lines = domains.get(model, [])
+                if domain_lines:
+                    domain_lines = ([domain_lines[0].replace(model, query, 1)]
+                                    + domain_lines[1:])
+            _write_search_output(output_filename,
+                                 program_header
+                                 + ['Query:       ' + model + '\n']
+                                 + header[scores_heading:],
+                                 score_line, domain_lines, footer)
+
+    with open(filename, 'r') as f:
+        lines = []
+        for line in f:
+            lines.append(line)
+            # the output of each query ends with a line containing only '//'
+            if line.startswith('//'):
+                split_query(lines)
+                lines = []
+
+def write_model_database(model_filenames, names, database_filename):
+    """Concatenates the models in the specified files into a single database
+    file for `hmmscan', renaming each to the corresponding name in `names'.
+
+    The database is written to a temporary file which is then renamed, so a
+    partially written database is never used. It must still be indexed with
+    `hmmpress' before it can be searched.
+
+    """
+    dirname = os.path.dirname(database_filename) or '.'
+    fd, temp_filename = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as database:
+            for model_filename, name in zip(model_filenames, names):
+                with open(model_filename, 'r') as model:
+                    for line in model:
+                        if line.startswith('NAME'):
+                            line = 'NAME  ' + name + '\n'
+                        database.write(line)
+        os.rename(temp_filename, database_filename)
+    except:
+        os.remove(temp_filename)
+        raise
@@ -0,0 +1,487 @@
+# jobs.py - run external commands concurrently
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Provides classes and functions for running the external programs (aligners,
+model builders, etc.) invoked by the scripts in this package on a bounded
+number of workers at once.
+
+The work is done by the external programs, so the workers are threads, each
+of which waits for one child process at a time.
+
+A job may list the files it reads and writes, so that run_graph can start
+each job as soon as the jobs producing its inputs have finished. The jobs of
+several scripts can be collected with defer_jobs, instead of being run by
+each script in turn, and then run together as a single graph, so that, for
+example, the model of one family is built while other families are still
+being aligned.
+
+"""
+
+from util import require_python_version
+require_python_version(2, 7)
+
+import Queue
+import heapq
+import multiprocessing
+import os.path
+import subprocess
+import time
+from multiprocessing.pool import ThreadPool
+
+from logger import logger
+
+# the default number of jobs to run at once
+DEFAULT_NUM_JOBS = multiprocessing.cpu_count()
+
+# the return code recorded for a command whose executable could not be run
+# (the same code as is returned by the shell for a missing command)
+COMMAND_NOT_RUN = 127
+
+# the list of jobs collected instead of run while deferring (see defer_jobs),
+# or None if jobs are run when they are specified
+_deferred = None
+
+class Call(object):
+    """A call of a Python function, which can be one of the commands of a
+    Job, for example to process the output of the command before it.
+
+    The function is called with the specified arguments, and should return 0
+    if and only if it succeeds. If it raises an exception, the exception is
+    logged and the call returns 1.
+
+    """
+
+    def __init__(self, function, *args):
+        """Instantiates this call of the specified function with the
+        specified arguments.
+
+        """
+        super(Call, self).__init__()
+        self.function = function
+        self.args = args
+
+    def __call__(self):
+        """Calls the function and returns its return code."""
+        try:
+            return self.function(*self.args)
+        except Exception as error:
+            logger.error(str(self) + ' raised ' + repr(error))
+            return 1
+
+    def __str__(self):
+        """Returns a description of this call."""
+        return (self.function.__name__ + '('
+                + ', '.join(repr(arg) for arg in self.args) + ')')
+
+def describe(command):
+    """Returns a description of the specified command of a Job."""
+    if isinstance(command, Call):
+        return str(command)
+    return ' '.join(command)
+
+class Job(object):
+    """A named list of commands which are run one after another, stopping at
+    the first command which fails unless `keep_going' is True.
+
+    Each command is either a list of arguments, as for subprocess.call, or a
+    Call of a Python function. If `log_filename' is specified, the standard
+    output and standard error of the commands are appended to that file.
+    `cost' is an estimate of the time the job will take, in arbitrary units;
+    more costly jobs are started first.
+
+    If `done_filename' is specified, that file is created when every command
+    has succeeded, and the job is skipped if the file already exists, so an
+    interrupted run can be restarted without repeating finished jobs. It may
+    also be a function, called with no arguments just before the job would
+    run, which returns the name of that file (or None), so that the name can
+    depend on inputs which do not exist until then.
+
+    `inputs' and `outputs' are the lists of the files which the job reads and
+    writes; run_graph runs a job only after the jobs whose outputs are among
+    its inputs.
+
+    If `reuse' is specified, it is called with no arguments just before the
+    commands would be run, and the job is skipped, as if it had already
+    finished, if it returns True, for example because it has restored the
+    outputs of the job from a cache.
+
+    After the job has been run, `return_codes' is a list of the return codes of
+    the commands which were run, and `elapsed' is the number of seconds it
+    took to run them.
+
+    """
+
+    def __init__(self, name, commands, log_filename=None, cost=0,
+                 keep_going=False, done_filename=None, inputs=(),
+                 outputs=(), reuse=None):
+        """Instantiates this job with the specified name, list of commands,
+        log filename, cost, and so on.
+
+        """
+        super(Job, self).__init__()
+        self.name = name
+        self.commands = commands
+        self.log_filename = log_filename
+        self.cost = cost
+        self.keep_going = keep_going
+        self.done_filename = done_filename
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.reuse = reuse
+        self.skipped = False
+        self.return_codes = []
+        self.elapsed = None
+
+    @property
+    def succeeded(self):
+        """True if and only if the job was skipped, or every command was run
+        and returned 0.
+
+        """
+        if self.skipped:
+            return True
+        return (len(self.return_codes) == len(self.commands)
+                and not any(self.return_codes))
+
+    def _call(self, command):
+        """Runs the specified command and returns its return code."""
+        if isinstance(command, Call):
+            return command()
+        try:
+            if self.log_filename is None:
+                return subprocess.call(command)
+            with open(self.log_filename, 'a') as log_file:
+                return subprocess.call(command, stdout=log_file,
+                                       stderr=subprocess.STDOUT)
+        except OSError as error:
+            logger.error('Could not run ' + describe(command) + ': '
+                         + str(error))
+            return COMMAND_NOT_RUN
+
+    def run(self):
+        """Runs the commands of this job, and returns this job."""
+        start = time.time()
+        self.return_codes = []
+        done_filename = self.done_filename
+        if callable(done_filename):
+            done_filename = done_filename()
+        self.skipped = (done_filename is not None
+                        and os.path.isfile(done_filename))
+        if self.skipped:
+            logger.debug('Skipping finished job ' + self.name)
+            self.elapsed = 0.0
+            return self
+        if self.reuse is not None and self.reuse():
+            logger.debug('Reusing the outputs of job ' + self.name)
+            self.skipped = True
+            self.elapsed = time.time() - start
+            return self
+        for command in self.commands:
+            logger.debug('  ' + describe(command))
+            return_code = self._call(command)
+            self.return_codes.append(return_code)
+            if return_code != 0 and not self.keep_going:
+                break
+        self.elapsed = time.time() - start
+        if done_filename is not None and self.succeeded:
+            open(done_filename, 'w').close()
+        return self
+
+    def __str__(self):
+        """Returns the name of this job, with its return codes and elapsed time
+        if it has been run.
+
+        """
+        if self.elapsed is None:
+            return self.name
+        if self.skipped:
+            return self.name + ' (already finished)'
+        return (self.name + ' (return codes ' + str(self.return_codes) + ', '
+                + '%.1f' % self.elapsed + ' seconds)')
+
+def _run_job(job):
+    """Runs the specified job and returns it."""
+    return job.run()
+
+def defer_jobs():
+    """Starts collecting the jobs specified to run_jobs and run_graph instead
+    of running them, until deferred_jobs is called.
+
+    """
+    global _deferred
+    _deferred = []
+
+def deferred_jobs():
+    """Stops collecting jobs, and returns the list of the jobs collected since
+    defer_jobs was called.
+
+    """
+    global _deferred
+    jobs, _deferred = _deferred or [], None
+    return jobs
+
+def will_exist(filename):
+    """Returns True if and only if the specified file exists, or is an output
+    of a job collected since defer_jobs was called.
+
+    """
+    if os.path.exists(filename):
+        return True
+    if _deferred is None:
+        return False
+    filename = os.path.normpath(filename)
+    return any(os.path.normpath(output) == filename
+               for job in _deferred for output in job.outputs)
+
+def _defer(jobs):
+    """Collects the specified jobs to be run later, and returns an empty list
+    of finished jobs.
+
+    """
+    logger.debug('Deferring ' + str(len(jobs)) + ' jobs')
+    _deferred.extend(jobs)
+    return []
+
+def run_jobs(jobs, num_jobs=DEFAULT_NUM_JOBS):
+    """Runs the specified jobs, with at most num_jobs of them running at once,
+    and returns the list of jobs in the order in which they finished.
+
+    Jobs are started in decreasing order of cost, so that the longest jobs do
+    not hold up the end of the run. Jobs of equal cost are started in the order
+    in which they were specified.
+
+    If defer_jobs has been called, the jobs are collected instead of run, and
+    the returned list is empty.
+
+    """
+    if _deferred is not None:
+        return _defer(jobs)
+    jobs = sorted(jobs, key=lambda job: -job.cost)
+    finished = []
+    if not jobs:
+        return finished
+    pool = ThreadPool(max(1, min(num_jobs, len(jobs))))
+    try:
+        for job in pool.imap_unordered(_run_job, jobs):
+            finished.append(job)
+            if job.succeeded:
+                logger.debug('Finished job ' + str(len(finished)) + ' of '
+                             + str(len(jobs)) + ': ' + str(job))
+            else:
+                logger.error('Job failed: ' + str(job))
+    finally:
+        pool.terminate()
+        pool.join()
+    return finished
+
+def run_pipelined(pipelines, limits):
+    """Runs each of the specified pipelines, which are lists of jobs, one job
+    after another, and returns the list of jobs in the order in which they
+    finished.
+
+    The ith job of each pipeline belongs to stage i, and at most limits[i]
+    jobs of stage i run at once, so a later stage of one pipeline can run
+    while an earlier stage of another is running. A pipeline stops at the
+    first job which fails. Pipelines are started in decreasing order of the
+    cost of their first job.
+
+    """
+    pipelines = sorted((pipeline for pipeline in pipelines if pipeline),
+                       key=lambda pipeline: -pipeline[0].cost)
+    finished = []
+    if not pipelines:
+        return finished
+    pools = [ThreadPool(max(1, limit)) for limit in limits]
+    done = Queue.Queue()
+
+    def run_stage(pipeline, stage):
+        try:
+            pipeline[stage].run()
+        except Exception as error:
+            logger.error('Job ' + pipeline[stage].name + ' raised '
+                         + repr(error))
+        finally:
+            done.put((pipeline, stage))
+
+    def submit(pipeline, stage):
+        pools[stage].apply_async(run_stage, (pipeline, stage))
+
+    try:
+        for pipeline in pipelines:
+            submit(pipeline, 0)
+        running = len(pipelines)
+        while running > 0:
+            pipeline, stage = done.get()
+            job = pipeline[stage]
+            finished.append(job)
+            if not job.succeeded:
+                logger.error('Job failed: ' + str(job))
+                running -= 1
+            elif stage + 1 < len(pipeline):
+                logger.debug('Finished stage ' + str(stage + 1) + ': '
+                             + str(job))
+                submit(pipeline, stage + 1)
+            else:
+                logger.debug('Finished stage ' + str(stage + 1) + ': '
+                             + str(job))
+                running -= 1
+    finally:
+        for pool in pools:
+            pool.terminate()
+            pool.join()
+    return finished
+
+def _dependencies(jobs):
+    """Returns a map from each of the specified jobs to the set of the jobs
+    which write one of its inputs.
+
+    Raises a ValueError if the jobs depend on each other in a cycle.
+
+    """
+    producers = {}
+    for job in jobs:
+        for filename in job.outputs:
+            producers[os.path.normpath(filename)] = job
+    dependencies = {}
+    for job in jobs:
+        dependencies[job] = set(producers[filename] for filename in
+                                map(os.path.normpath, job.inputs)
+                                if filename in producers) - set((job, ))
+
+    # check for cycles by repeatedly removing the jobs which depend on no
+    # remaining job
+    remaining = dict((job, set(jobs_before))
+                     for job, jobs_before in dependencies.iteritems())
+    while remaining:
+        free = [job for job, jobs_before in remaining.iteritems()
+                if not jobs_before]
+        if not free:
+            raise ValueError('Jobs depend on each other in a cycle: '
+                             + ', '.join(sorted(job.name for job in remaining)))
+        for job in free:
+            del remaining[job]
+        for jobs_before in remaining.itervalues():
+            jobs_before.difference_update(free)
+    return dependencies
+
+def run_graph(jobs, num_jobs=DEFAULT_NUM_JOBS):
+    """Runs the specified jobs on at most num_jobs workers shared by all of
+    them, each as soon as every job which writes one of its inputs has
+    succeeded, and returns the list of jobs in the order in which they
+    finished.
+
+    The jobs which are ready to run are started in decreasing order of cost,
+    and in the order in which they were specified for equal cost. A job which
+    depends on a job which failed is not run, and is returned as failed.
+    Raises a ValueError if the jobs depend on each other in a cycle.
+
+    If defer_jobs has been called, the jobs are collected instead of run, and
+    the returned list is empty.
+
+    """
+    if _deferred is not None:
+        return _defer(jobs)
+    finished = []
+    if not jobs:
+        return finished
+    dependencies = _dependencies(jobs)
+    dependents = dict((job, []) for job in jobs)
+    for job, jobs_before in dependencies.iteritems():
+        for job_before in jobs_before:
+            dependents[job_before].append(job)
+    waiting = dict((job, len(jobs_before))
+                   for job, jobs_before in dependencies.iteritems())
+    order = dict((job, i) for i, job in enumerate(jobs))
+    ready = []
+
+    def make_ready(job):
+        heapq.heappush(ready, (-job.cost, order[job], job))
+
+    for job in jobs:
+        if waiting[job] == 0:
+            make_ready(job)
+
+    num_workers = max(1, min(num_jobs, len(jobs)))
+    pool = ThreadPool(num_workers)
+    done = Queue.Queue()
+
+    def run(job):
+        try:
+            job.run()
+        except Exception as error:
+            logger.error('Job ' + job.name + ' raised ' + repr(error))
+        finally:
+            done.put(job)
+
+    def block_dependents(job, failed_job):
+        # give up on every job which depends, directly or not, on the
+        # specified job, since the specified failed job was run before it
+        for dependent in dependents[job]:
+            if waiting[dependent] > 0:
+                waiting[dependent] = -1
+                logger.error('Not running job ' + dependent.name
+                             + ', since job ' + failed_job.name + ' failed')
+                finished.append(dependent)
+                block_dependents(dependent, failed_job)
+
+    try:
+        running = 0
+        while ready or running > 0:
+            # start jobs only as workers become free, so that the pool never
+            # holds a job which is less costly than one which becomes ready
+            while ready and running < num_workers:
+                job = heapq.heappop(ready)[2]
+                pool.apply_async(run, (job, ))
+                running += 1
+            job = done.get()
+            running -= 1
+            finished.append(job)
+            if not job.succeeded:
+                logger.error('Job failed: ' + str(job))
+                block_dependents(job, job)
+                continue
+            logger.debug('Finished job ' + str(len(finished)) + ' of '
+                         + str(len(jobs)) + ': ' + str(job))
+            for dependent in dependents[job]:
+                if waiting[dependent] > 0:
+                    waiting[dependent] -= 1
+                    if waiting[dependent] == 0:
+                        make_ready(dependent)
+    finally:
+        pool.terminate()
+        pool.join()
+    return finished
+
+def log_summary(jobs):
+    """Logs the number of the specified jobs which succeeded and failed, and
+    the total time spent running them.
+
+    Nothing is logged while jobs are being deferred, since they have not yet
+    been run.
+
+    """
+    if _deferred is not None:
+        return
+    failed = [job for job in jobs if not job.succeeded]
+    skipped = [job for job in jobs if job.skipped]
+    total = sum(job.elapsed or 0 for job in jobs)
+    logger.info('Ran ' + str(len(jobs) - len(skipped)) + ' jobs ('
+                + str(len(failed)) + ' failed, ' + str(len(skipped))
+                + ' already finished) in a total of ' + '%.1f' % total
+                + ' seconds')
+    for job in failed:
+        logger.info('  failed: ' + str(job))
@@ -0,0 +1,145 @@
+# mattcache.py - reuse the multiple alignments made by matt
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Provides functions for storing the outputs of matt in a cache shared by
+every output directory, and for reusing them instead of running matt again on
+the same chains, for use by generate-matt-alignments.py and
+generate-all-matt-alignments.py.
+
+An alignment is identified by a key computed from the sorted list of the PDB
+ID:chains aligned, the MD5 digest of the matt executable, which changes with
+its version, and the output formats. Each entry of the cache is a directory
+named by its key, containing one read-only file for each output format.
+
+The files are always copied between the cache and an output directory, never
+linked, since later stages (for example the preparse steps of generate-mrf.py)
+rewrite the alignment files in an output directory in place.
+
+"""
+
+from util import require_python_version
+require_python_version(2, 7)
+
+import errno
+import hashlib
+import os
+import os.path
+import shutil
+import tempfile
+
+from cache import executable_digest
+from cache import make_dirs
+from logger import logger
+
+def alignment_key(chains, executable, formats):
+    """Returns the key of the alignment of the specified chains by the
+    specified matt executable, writing the specified output formats.
+
+    `chains' is the list of PDB ID:chains given to matt, for example
+    '1abc:A'; the key does not depend on their order, nor on the directory
+    containing the PDB files.
+
+    """
+    digest = hashlib.md5()
+    for chain in sorted(chains):
+        digest.update(chain + '\n')
+    digest.update('\0' + str(executable_digest(executable)) + '\0')
+    digest.update(','.join(sorted(formats)))
+    return digest.hexdigest()
+
+def _output_filename(prefix, format):
+    """Returns the name of the output file of the specified format written by
+    matt with the specified output prefix.
+
+    """
+    return prefix + '.' + format
+
+def remove_alignment(prefix, formats):
+    """Removes the output files of the specified formats written by matt with
+    the specified output prefix, if they exist.
+
+    They are removed before matt is run again or the alignment is restored,
+    so that a run which fails never leaves the old alignment behind.
+
+    """
+    for format in formats:
+        try:
+            os.remove(_output_filename(prefix, format))
+        except OSError as error:
+            if error.errno != errno.ENOENT:
+                raise
+
+def restore_alignment(key, prefix, formats, cache_dir):
+    """Copies the outputs of the alignment with the specified key from the
+    specified cache directory to the output files of the specified formats
+    with the specified output prefix, as if matt had written them.
+
+    Returns True if and only if the alignment was in the cache.
+
+    """
+    entry = os.path.join(cache_dir, key)
+    basename = os.path.basename(prefix)
+    if not all(os.path.isfile(_output_filename(os.path.join(entry, basename),
+                                               format))
+               for format in formats):
+        return False
+    remove_alignment(prefix, formats)
+    for format in formats:
+        # a new file, so it is writable and the entry is never changed
+        shutil.copyfile(_output_filename(os.path.join(entry, basename),
+                                         format),
+                        _output_filename(prefix, format))
+    return True
+
+def store_alignment(key, prefix, formats, cache_dir):
+    """Stores the output files of the specified formats written by matt with
+    the specified output prefix in the specified cache directory, as the
+    alignment with the specified key. Returns 0 if they were stored (or were
+    already stored by another process) and 1 if an output file is missing, for
+    use as a command of a gargamel.jobs.Job.
+
+    The entry is written to a temporary directory which is then renamed, so a
+    partially written entry is never reused, and its files are made read-only.
+
+    """
+    missing = [_output_filename(prefix, format) for format in formats
+               if not os.path.isfile(_output_filename(prefix, format))]
+    if missing:
+        logger.error('Not caching alignment ' + key + ': missing '
+                     + ', '.join(missing))
+        return 1
+    make_dirs(cache_dir)
+    entry = os.path.join(cache_dir, key)
+    if os.path.isdir(entry):
+        return 0
+    basename = os.path.basename(prefix)
+    temp_dirname = tempfile.mkdtemp(dir=cache_dir, suffix='.tmp')
+    try:
+        for format in formats:
+            filename = _output_filename(os.path.join(temp_dirname, basename),
+                                        format)
+            shutil.copyfile(_output_filename(prefix, format), filename)
+            os.chmod(filename, 0444)
+        os.chmod(temp_dirname, 0755)
+        os.rename(temp_dirname, entry)
+    except OSError:
+        # another process may have stored the same alignment first
+        shutil.rmtree(temp_dirname, ignore_errors=True)
+        if not os.path.isdir(entry):
+            raise
+    logger.debug('Cached alignment ' + key + ' of ' + prefix)
+    return 0
@@ -0,0 +1,257 @@
+# modelcache.py - reuse the models built from identical inputs
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Provides a class for storing the models built by generate-hmm.py,
+generate-complete-hmm.py and generate-mrf.py in a cache shared by every output
+directory, and for reusing them instead of preparsing and building again from
+the same inputs.
+
+A model is identified by a key computed from the MD5 digests of the files from
+which it was built (the alignment made by matt), the parameters of the
+preparse and build steps (the aligner, the smurf-lite threshold, the
+simulated evolution parameters and the build options), and the MD5 digests of
+the executables which run those steps. Each entry of the cache is a directory
+named by its key, containing read-only copies of the model files, which are
+copied into an output directory when they are reused. They are copied rather
+than linked because some scripts change a model in place once it is built (as
+add_pvalue_to_hmm.rb does after generate-complete-hmm.py in train_smurf.sh),
+which must never change the entry. The model files are named by their position
+in the list of outputs, since the name of a model file may depend on the
+output directory (as in generate-complete-hmm.py).
+
+The cache is bounded in size: whenever a model is stored, the entries which
+were least recently stored or reused are removed until the total size of the
+cache is within its bound.
+
+"""
+
+from util import require_python_version
+require_python_version(2, 7)
+
+import errno
+import hashlib
+import os
+import os.path
+import shutil
+import tempfile
+
+from cache import executable_digest
+from cache import file_digest
+from cache import make_dirs
+from constants import MODEL_CACHE_DIR
+from constants import MODEL_CACHE_SIZE
+from logger import logger
+
+# the suffix of a directory into which an entry is renamed before it is removed
+EVICTED_SUFFIX = '.evicted'
+
+def model_key(inputs, parameters, executables):
+    """Returns the key of the model built from the specified input files with
+    the specified list of parameters by the specified executables.
+
+    """
+    digest = hashlib.md5()
+    for filename in inputs:
+        digest.update(file_digest(filename) + '\n')
+    for parameter in parameters:
+        digest.update('\0' + str(parameter))
+    for executable in executables:
+        digest.update('\0' + str(executable_digest(executable)))
+    return digest.hexdigest()
+
+def remove_models(filenames):
+    """Removes the specified model files, if they exist.
+
+    They are removed before the model is built or restored again, so that a
+    build which fails never leaves the old model behind.
+
+    """
+    for filename in filenames:
+        try:
+            os.remove(filename)
+        except OSError as error:
+            if error.errno != errno.ENOENT:
+                raise
+
+def _entry_filename(entry, i):
+    """Returns the name of the ith model file in the specified entry."""
+    return os.path.join(entry, 'model' + str(i))
+
+def _entry_size(entry):
+    """Returns the total size in bytes of the files in the specified entry."""
+    size = 0
+    for name in os.listdir(entry):
+        size += os.path.getsize(os.path.join(entry, name))
+    return size
+
+def evict(cache_dir=MODEL_CACHE_DIR, max_size=MODEL_CACHE_SIZE):
+    """Removes the least recently used entries of the specified cache
+    directory until the total size of the remaining entries is at most
+    max_size bytes, and returns the number of entries removed.
+
+    An entry is renamed before it is removed, so another process never reuses
+    a partially removed entry.
+
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        entry = os.path.join(cache_dir, name)
+        if name.endswith('.tmp') or name.endswith(EVICTED_SUFFIX) \
+                or not os.path.isdir(entry):
+            continue
+        try:
+            entries.append((os.path.getmtime(entry), _entry_size(entry),
+                            entry))
+        except OSError:
+            # another process removed the entry first
+            continue
+    total = sum(size for mtime, size, entry in entries)
+    removed = 0
+    for mtime, size, entry in sorted(entries):
+        if total <= max_size:
+            break
+        evicted = tempfile.mkdtemp(dir=cache_dir, suffix=EVICTED_SUFFIX)
+        try:
+            os.rename(entry, os.path.join(evicted, os.path.basename(entry)))
+        except OSError:
+            # another process removed the entry first
+            pass
+        else:
+            removed += 1
+        shutil.rmtree(evicted, ignore_errors=True)
+        total -= size
+    if removed:
+        logger.debug('Removed ' + str(removed) + ' least recently used models '
+                     + 'from ' + cache_dir)
+    return removed
+
+class CachedModel(object):
+    """The model files written by the jobs which preparse and build a model,
+    which may be restored from the cache instead, and stored in it once they
+    have been built.
+
+    The key of the model is computed when restore is first called, just before
+    the jobs would run, so that the inputs need not exist when this object is
+    created (for example, if they are written by a deferred matt job).
+
+    """
+
+    def __init__(self, inputs, parameters, executables, outputs,
+                 cache_dir=MODEL_CACHE_DIR, max_size=MODEL_CACHE_SIZE):
+        """Instantiates this model, built from the specified input files with
+        the specified list of parameters by the specified executables, and
+        written to the specified output files, in the specified cache
+        directory of at most max_size bytes.
+
+        """
+        super(CachedModel, self).__init__()
+        self.inputs = list(inputs)
+        self.parameters = list(parameters)
+        self.executables = list(executables)
+        self.outputs = list(outputs)
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.key = None
+        self.restored = None
+
+    def _restore(self):
+        """Copies the model files from the cache to the output files, and
+        returns True if and only if they were in the cache.
+
+        """
+        entry = os.path.join(self.cache_dir, self.key)
+        if not all(os.path.isfile(_entry_filename(entry, i))
+                   for i in range(len(self.outputs))):
+            return False
+        try:
+            remove_models(self.outputs)
+            for i, output in enumerate(self.outputs):
+                # a new file, so it is writable and the entry is never changed
+                shutil.copyfile(_entry_filename(entry, i), output)
+            # mark the entry as recently used
+            os.utime(entry, None)
+        except (IOError, OSError) as error:
+            if error.errno != errno.ENOENT:
+                raise
+            # another process removed the entry while it was being restored
+            return False
+        return True
+
+    def restore(self):
+        """Restores the model files from the cache if they are there, and
+        returns True if and only if they were restored.
+
+        Only the first call has any effect; later calls return the same
+        result, so this can be the `reuse' function of each of the jobs which
+        preparse and build the model.
+
+        """
+        if self.restored is None:
+            # a missing input is left for the build to report
+            if not all(os.path.isfile(filename) for filename in self.inputs):
+                self.restored = False
+                return self.restored
+            self.key = model_key(self.inputs, self.parameters,
+                                 self.executables)
+            self.restored = self._restore()
+            if self.restored:
+                logger.debug('Reused cached model ' + self.key + ' for '
+                             + ', '.join(self.outputs))
+        return self.restored
+
+    def store(self):
+        """Stores the built model files in the cache, then removes the least
+        recently used entries if the cache is larger than its bound. Returns 0
+        if they were stored (or were already stored by another process) and 1
+        if a model file is missing, for use as a command of a
+        gargamel.jobs.Job.
+
+        restore must have been called first, to compute the key of the model;
+        nothing is stored if it could not be computed. The entry is written to
+        a temporary directory which is then renamed, so a partially written
+        entry is never reused, and its files are made read-only.
+
+        """
+        if self.key is None:
+            return 0
+        missing = [output for output in self.outputs
+                   if not os.path.isfile(output)]
+        if missing:
+            logger.error('Not caching model ' + self.key + ': missing '
+                         + ', '.join(missing))
+            return 1
+        make_dirs(self.cache_dir)
+        entry = os.path.join(self.cache_dir, self.key)
+        if os.path.isdir(entry):
+            return 0
+        temp_dirname = tempfile.mkdtemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            for i, output in enumerate(self.outputs):
+                filename = _entry_filename(temp_dirname, i)
+                shutil.copyfile(output, filename)
+                os.chmod(filename, 0444)
+            os.chmod(temp_dirname, 0755)
+            os.rename(temp_dirname, entry)
+        except OSError:
+            # another process may have stored the same model first
+            shutil.rmtree(temp_dirname, ignore_errors=True)
+            if not os.path.isdir(entry):
+                raise
+        logger.debug('Cached model ' + self.key + ' of '
+                     + ', '.join(self.outputs))
+        evict(self.cache_dir, self.max_size)
+        return 0
@@ -0,0 +1,228 @@
+# models.py - generate HMMs from the matt alignments
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Provides the second stage of the leave-one-out analysis, which builds a
+hidden Markov model from each multiple alignment generated by the first, for
+use by generate-hmm.py and gargamel.pipeline.
+
+"""
+
+from util import require_python_version
+require_python_version(2, 7)
+
+import os
+import os.path
+
+from constants import BUILD_LOG_FILENAME
+from constants import HMMER
+from constants import HMMER_HMM_FILENAME
+from constants import HMMER_HMMBUILD_EXECUTABLE
+from constants import MATT_PREFIX
+from constants import SMURF
+from constants import SMURF_HMM_FILENAME
+from constants import SMURF_HMMBUILD_EXECUTABLE
+from constants import SMURF_PREPARSE_EXECUTABLE
+from constants import PROFILE_SMURF
+from constants import PROFILE_SMURF_HMM_FILENAME
+from constants import PROFILE_SMURF_HMMBUILD_EXECUTABLE
+from constants import PROFILE_SMURF_PREPARSE_EXECUTABLE
+from constants import SMURF_LITE
+from constants import SMURF_LITE_HMM_FILENAME
+from constants import SMURF_LITE_HMMBUILD_EXECUTABLE
+from constants import SMURF_LITE_PREPARSE_EXECUTABLE
+from constants import HMMER_HMMBUILD_OPTIONS
+from constants import SMURF_HMMBUILD_OPTIONS
+from constants import PROFILE_SMURF_HMMBUILD_OPTIONS
+from constants import SMURF_LITE_HMMBUILD_OPTIONS
+from jobs import Call
+from jobs import Job
+from jobs import log_summary
+from jobs import run_jobs
+from jobs import will_exist
+from logger import logger
+from modelcache import CachedModel
+from modelcache import remove_models
+
+def generate_hmm(parsed_args):
+    """Builds a hidden Markov model with the aligner given in the specified
+    options (as parsed by gargamel.argumentparsers.ModelArgumentParser) from
+    the matt alignment in each directory of a hierarchy level left out by
+    gargamel.alignments.generate_matt_alignments.
+
+    Returns the exit status of generate-hmm.py.
+
+    """
+    # get the values from the command-line arguments
+    output_dir = parsed_args.outputdir.rstrip('/')  # remove trailing slash
+    aligner = parsed_args.aligner
+    smurf_lite_threshold = str(parsed_args.smurf_lite_threshold)
+    simev_frequency = parsed_args.simev_frequency
+    simev_count = parsed_args.simev_count
+    simev_threshold = parsed_args.simev_threshold
+    num_jobs = parsed_args.jobs
+    cache_dir = parsed_args.cache_dir
+    cache_size = parsed_args.cache_size
+    use_cache = not parsed_args.no_cache
+
+    # summary of the program configuration
+    config = {'output_dir' : output_dir, 'aligner' : aligner,
+              'num_jobs' : num_jobs}
+    logger.debug('Program configuration: ' + str(config))
+
+    # end the program if the output dir doesn't exist
+    logger.debug('Checking whether output directory exists...')
+    if not os.path.isdir(output_dir):
+        logger.critical('Output directory ' + output_dir
+                        + ' does not yet exist')
+        logger.critical('Please run generate-matt-alignments.py first')
+        return 2
+
+    logger.debug('Determining which hierarchy levels were left out during '
+                 'training...')
+    logger.debug('  output_dir contains: ' + str(os.listdir(output_dir)))
+    sunids = filter(lambda x: x.isdigit()
+                    and os.path.isdir(os.path.join(output_dir, x)),
+                    os.listdir(output_dir))
+    logger.debug('  sunids: ' + str(sunids))
+
+    # the builds to run, one for each sunid directory, which are run
+    # concurrently once all have been prepared
+    build_jobs = []
+
+    for sunid in sunids:
+
+        level_output_dir = os.path.join(output_dir, sunid)
+        aligner_output_dir = os.path.join(level_output_dir, aligner)
+
+        # create the output for the aligner if it doesn't already exist
+        if os.path.isdir(aligner_output_dir):
+            logger.warning('directory ' + aligner_output_dir
+                           + ' already exists')
+        else:
+            os.mkdir(aligner_output_dir)
+
+        # determine which executable and multiple alignment file to use for
+        # the hmmbuild step, and determine the name of the HMM file
+        if aligner == SMURF:
+            executable = SMURF_HMMBUILD_EXECUTABLE
+            preparse_executable = SMURF_PREPARSE_EXECUTABLE
+            hmm_filename = SMURF_HMM_FILENAME
+            hmmbuild_options = SMURF_HMMBUILD_OPTIONS
+        elif aligner == HMMER:
+            executable = HMMER_HMMBUILD_EXECUTABLE
+            hmm_filename = HMMER_HMM_FILENAME
+            hmmbuild_options = HMMER_HMMBUILD_OPTIONS
+        elif aligner == PROFILE_SMURF:
+            executable = PROFILE_SMURF_HMMBUILD_EXECUTABLE
+            preparse_executable = PROFILE_SMURF_PREPARSE_EXECUTABLE
+            hmm_filename = PROFILE_SMURF_HMM_FILENAME
+            hmmbuild_options = PROFILE_SMURF_HMMBUILD_OPTIONS
+        elif aligner == SMURF_LITE:
+            executable = SMURF_LITE_HMMBUILD_EXECUTABLE
+            preparse_executable = SMURF_LITE_PREPARSE_EXECUTABLE
+            hmm_filename = SMURF_LITE_HMM_FILENAME
+            hmmbuild_options = SMURF_LITE_HMMBUILD_OPTIONS
+        else:
+            logger.critical('Unknown aligner type: ' + aligner)
+            return 1
+
+        mult_alignment_file = os.path.join(level_output_dir,
+                                           MATT_PREFIX + '.ssi')
+
+        # the alignment may not exist yet if it is to be made by a deferred
+        # matt job, in which case the build runs after that job
+        if not will_exist(mult_alignment_file):
+            logger.debug('Group not aligned; could not find alignment file '
+                         + mult_alignment_file + ' - skipping.')
+            continue
+
+        # larger alignments take longer to build, so start them first
+        cost = 0
+        if os.path.isfile(mult_alignment_file):
+            cost = os.path.getsize(mult_alignment_file)
+        build_inputs = [mult_alignment_file]
+        build_parameters = [aligner, hmmbuild_options]
+        build_executables = [executable]
+        build_cmds = []
+
+        # call smurf-preparse to set up beta strand goodness
+        if aligner != HMMER:
+            logger.debug('Queueing smurf-preparse...')
+            mult_alignment_file = os.path.join(level_output_dir,
+                                               MATT_PREFIX + '_' + aligner
+                                               + '.ssi')
+            if float(simev_frequency) > 0.0:
+                preparse_cmd = [preparse_executable,
+                                os.path.join(level_output_dir,
+                                             MATT_PREFIX + '.pdb'),
+                                os.path.join(level_output_dir,
+                                             MATT_PREFIX + '.fasta'),
+                                mult_alignment_file,
+                                smurf_lite_threshold,
+                                simev_frequency,
+                                simev_count,
+                                simev_threshold,
+                                'false' # do NOT run blast augmentation.
+                                ]
+            else:
+                preparse_cmd = [preparse_executable,
+                                os.path.join(level_output_dir,
+                                             MATT_PREFIX + '.pdb'),
+                                os.path.join(level_output_dir,
+                                             MATT_PREFIX + '.fasta'),
+                                mult_alignment_file,
+                                smurf_lite_threshold
+                                ]
+            build_cmds.append(preparse_cmd)
+            build_inputs.extend(preparse_cmd[1:3])
+            build_parameters.extend(preparse_cmd[4:])
+            build_executables.append(preparse_executable)
+
+        # generate a hidden Markov model from the multiple alignment generated
+        # by matt (specifically, the .ssi file)
+        logger.debug('Queueing hmmbuild...')
+        hmmbuild_cmd = ([executable] + hmmbuild_options.split()
+                        + [os.path.join(aligner_output_dir, hmm_filename),
+                           mult_alignment_file])
+        build_cmds.append(hmmbuild_cmd)
+        build_outputs = [os.path.join(aligner_output_dir, hmm_filename)]
+        remove_models(build_outputs)
+
+        # reuse a model built from the same alignment with the same parameters
+        # if there is one, and otherwise store this model for reuse once it is
+        # built
+        reuse = None
+        if use_cache:
+            model = CachedModel(build_inputs, build_parameters,
+                                build_executables, build_outputs, cache_dir,
+                                cache_size)
+            build_cmds.append(Call(model.store))
+            reuse = model.restore
+
+        # the output of each command is written to a log in the aligner output
+        # directory, and the build stops at the first command which fails
+        build_jobs.append(Job(aligner_output_dir, build_cmds,
+                              log_filename=os.path.join(aligner_output_dir,
+                                                        BUILD_LOG_FILENAME),
+                              cost=cost, inputs=build_inputs,
+                              outputs=build_outputs, reuse=reuse))
+
+    # run the builds, at most num_jobs at a time
+    logger.debug('Running ' + str(len(build_jobs)) + ' builds, '
+                 + str(num_jobs) + ' at a time...')
+    log_summary(run_jobs(build_jobs, num_jobs))
+    return 0
@@ -22,11 +22,20 @@
 from util import require_python_version
 require_python_version(2, 7)
 
+import numpy
+
+from cache import cached_index
 from logger import logger
+from refclient import served
+from util import chain_name
 
 # the path to the NRPDB file
 NRPDB_FILENAME = '/r/bcb/protein_structure/NRPDB/nrpdb'
 
+# the kind of index saved for NRPDB files; change this whenever the structure
+# of NrpdbIndex changes
+INDEX_KIND = 'nrpdb3'
+
 class RepresentativeFields:
     """The columns in the NRPDB file at which the representative flag for each
     set of chains.
@@ -41,24 +50,103 @@ class RepresentativeFields:
     GROUPFIELDS = {NONIDENT : 12, BLAST80 : 9, BLAST40 : 6, BLAST7 : 3}
 
 
-def nrpdbs_from_file(filename, rep_type=None):
-    # this is the wrong spec. It should simply return the representative
-    # pdb-chain for a given pdb-chain and rep-type.
-    
-    # we actually want two functions: give ALL the reps for a level, or
-    # give a mapping from pdb:chain to representative pdb:chain
-  
-  
-    """Reads NRPDBs from the specified file, returning a mapping from PDB ID and
-    chain to a representative pdb ID and chain.
+class NrpdbIndex(object):
+    """The representative of every chain in a NRPDB file, for each of the
+    members of RepresentativeFields.ALL_REPS at once.
 
-    If rep_type is provided, only representatives of the specified
-    non-redundant set will be returned. Possible values for rep_type are
-    the members of the class RepresentativeFields. Any other value is ignored.
+    `chains' is a list of the PDB ID:chain strings of the records in the file,
+    and `representatives' is a map from each representative field to an
+    integer array which contains, for each record, the position in `chains'
+    of the representative of the group of that record (or -1 if the group has
+    no representative).
+
+    So that sets of chains can be handled as integer arrays of positions in
+    `chains', `sorted_chains' is an array of the chains in sorted order,
+    `order' the position in `chains' of each of them, `ranks' the position in
+    `sorted_chains' of each record, and `structures' an integer code of the
+    PDB ID of each record, which is the same for every chain of a structure.
 
     """
-    nrpdbs = {}
-    groups = {}
+
+    def __init__(self, chains, representatives):
+        """Instantiates this index with the specified list of chains and map
+        from representative field to array of representative positions.
+
+        """
+        self.chains = chains
+        self.representatives = representatives
+        self.sorted_chains = numpy.array(chains, dtype=str)
+        self.order = numpy.argsort(self.sorted_chains, kind='mergesort')
+        self.sorted_chains = self.sorted_chains[self.order]
+        self.ranks = numpy.empty(len(chains), dtype=numpy.int32)
+        self.ranks[self.order] = numpy.arange(len(chains))
+        pdbids = numpy.array([chain.split(':')[0] for chain in chains],
+                             dtype=str)
+        self.structures = numpy.unique(pdbids, return_inverse=True)[1]
+        # mappings which have already been created by mapping
+        self._mappings = {}
+
+    def representative_array(self, rep_type=None):
+        """Returns the array of the position of the representative of each
+        record in the non-redundant set specified by rep_type, as in
+        `representatives'.
+
+        If rep_type is not one of the members of RepresentativeFields, each
+        record is its own representative.
+
+        """
+        if rep_type not in self.representatives:
+            return numpy.arange(len(self.chains))
+        return self.representatives[rep_type]
+
+    def positions(self, names):
+        """Returns an integer array of the position in `chains' of each of the
+        PDB ID:chain strings in the specified array, or -1 for those which are
+        not in this index.
+
+        """
+        if len(self.chains) == 0:
+            return numpy.empty(len(names), dtype=numpy.int32) - 1
+        found = numpy.searchsorted(self.sorted_chains, names)
+        found[found == len(self.chains)] = 0
+        return numpy.where(self.sorted_chains[found] == names,
+                           self.order[found], -1)
+
+    def mapping(self, rep_type=None):
+        """Returns a map from PDB ID:chain to the PDB ID:chain of its
+        representative in the non-redundant set specified by rep_type.
+
+        If rep_type is not one of the members of RepresentativeFields, every
+        chain is mapped to itself. The returned map is remembered, so it must
+        not be modified.
+
+        """
+        if rep_type not in self.representatives:
+            rep_type = None
+        if rep_type in self._mappings:
+            return self._mappings[rep_type]
+
+        chains = self.chains
+        if rep_type is None:
+            mapping = dict((chain, chain) for chain in chains)
+        else:
+            mapping = dict((chains[i], chains[rep]) for i, rep in
+                           enumerate(self.representatives[rep_type].tolist())
+                           if rep >= 0)
+        self._mappings[rep_type] = mapping
+        return mapping
+
+def _index_from_file(filename):
+    """Reads the specified NRPDB file in a single pass and returns an
+    NrpdbIndex of the representatives of all of its records.
+
+    """
+    chains = []
+    seen = set()
+    group_ids = dict((rep_type, {}) for rep_type in
+                     RepresentativeFields.ALL_REPS)
+    groups = dict((rep_type, []) for rep_type in RepresentativeFields.ALL_REPS)
+    flags = dict((rep_type, []) for rep_type in RepresentativeFields.ALL_REPS)
     with open(filename, 'r') as nrpdb_file:
 
         # iterate over each record in the NRPDB file
@@ -74,68 +162,90 @@ def nrpdbs_from_file(filename, rep_type=None):
 
                 # get all of the fields from the current record
                 fields = line.split()
-                
-                # I THINK we want to always go into this loop, but flag
-                # those proteins that are reps
-                
-
-                # if this protein is a representative (or we don't care)
-                # (relies on short-circuiting or operator)
-                if (rep_type and rep_type in RepresentativeFields.REPFIELDS \
-                    and \
-                    int(fields[RepresentativeFields.REPFIELDS[rep_type]]) == 1):
-                  is_rep = True
-                else:
-                  is_rep = False
-                  
-                if (rep_type and rep_type in RepresentativeFields.GROUPFIELDS):
-                  group_id = fields[RepresentativeFields.GROUPFIELDS[rep_type]]
-                else:
-                  group_id = None
-                
-                # if rep_type is None or \
-                #        (rep_type in RepresentativeFields.REPFIELDS and
-                #         int(fields[RepresentativeFields.REPFIELDS[rep_type]]) \
-                #         == 1):
+
+                # get the group and representative flag of this protein for
+                # each non-redundant set before recording anything, so that a
+                # badly formatted line is skipped entirely
+                record = [(rep_type,
+                           fields[RepresentativeFields.GROUPFIELDS[rep_type]],
+                           int(fields[RepresentativeFields.REPFIELDS[rep_type]])
+                           == 1)
+                          for rep_type in RepresentativeFields.ALL_REPS]
 
                 # get the pdbid and chain letter of this protein
                 pdbid, chain = fields[:2]
-                
-
-                # ensure pdbid is lowercase, chain is uppercase
-                pdbid = pdbid.lower()
-                chain = chain.upper()
-                full_pdbid = pdbid + ':' + chain
-                
-                if group_id and group_id in groups:
-                  groups[group_id].add((full_pdbid, is_rep))
-                else:
-                  groups[group_id] = set(((full_pdbid, is_rep), ))
-                  
-                # 
-                #   
-                # # add or update the set of chains
-                # if full_pdbid in nrpdbs:
-                #     nrpdbs[full_pdbid].add((chain, is_rep))
-                # else:
-                #     nrpdbs[full_pdbid] = set(((chain, is_rep), ))
-
-            except ValueError:
+
+            except (ValueError, IndexError):
                 logger.warning('Incorrectly formatted NRPDB line ' + line)
-                
-    # now for each group, we want to add a mapping for each pdb:chain to its rep
-    
-    for group_id in groups.keys():
-      
-      redundant_entries = set()
-      for nrpdb_entry in groups[group_id]:
-        if nrpdb_entry[1]:
-          rep = nrpdb_entry[0]
-          redundant_entries.add(rep)
-        else:
-          redundant_entries.add(nrpdb_entry[0])
-      
-      for redundant_entry in redundant_entries:
-        nrpdbs[redundant_entry] = rep
-    
-    return nrpdbs
+                continue
+
+            # ensure pdbid is lowercase, chain is uppercase, and use only the
+            # first of the chains which differ only in case
+            name = chain_name(pdbid, chain)
+            if name in seen:
+                logger.debug('Skipping NRPDB chain ' + pdbid + ':' + chain
+                             + ', already read as ' + name)
+                continue
+            seen.add(name)
+            chains.append(name)
+            for rep_type, group_id, is_rep in record:
+                ids = group_ids[rep_type]
+                groups[rep_type].append(ids.setdefault(group_id, len(ids)))
+                flags[rep_type].append(is_rep)
+
+    # for each group, find the position of its representative, and then map
+    # each chain to the representative of its group
+    representatives = {}
+    for rep_type in RepresentativeFields.ALL_REPS:
+        group_codes = numpy.array(groups[rep_type], dtype=numpy.int32)
+        is_rep = numpy.array(flags[rep_type], dtype=bool)
+        group_reps = numpy.empty(len(group_ids[rep_type]), dtype=numpy.int32)
+        group_reps.fill(-1)
+        group_reps[group_codes[is_rep]] = numpy.flatnonzero(is_rep)
+        representatives[rep_type] = group_reps[group_codes]
+
+    return NrpdbIndex(chains, representatives)
+
+def index_from_file(filename):
+    """Returns the NrpdbIndex of the specified NRPDB file.
+
+    The index is saved in INDEX_DIR, so the file is only read once per
+    release. The returned index must not be modified.
+
+    """
+    return cached_index(filename, INDEX_KIND, _index_from_file)
+
+def nrpdbs_from_file(filename, rep_type=None):
+    """Reads NRPDBs from the specified file, returning a mapping from PDB ID and
+    chain to a representative pdb ID and chain.
+
+    If rep_type is provided, only representatives of the specified
+    non-redundant set will be returned. Possible values for rep_type are
+    the members of the class RepresentativeFields. Any other value is ignored,
+    and each chain is its own representative. Chains in a group with no
+    representative are not included.
+
+    The representatives for all of the non-redundant sets are computed in a
+    single pass over the file and saved in INDEX_DIR, so the file is only read
+    once per release, and each mapping is remembered for the lifetime of this
+    process. The returned mapping must not be modified.
+
+    The mapping is read in this process even if a reference data server is
+    running; representatives_from_file asks the server for only the chains
+    which are needed.
+
+    """
+    return index_from_file(filename).mapping(rep_type)
+
+@served
+def representatives_from_file(filename, pdbids, rep_type=None):
+    """Returns a map from each of the specified PDB ID:chains to its
+    representative PDB ID:chain in the specified NRPDB file, as in the mapping
+    returned by nrpdbs_from_file.
+
+    Chains which have no representative are not included.
+
+    """
+    mapping = nrpdbs_from_file(filename, rep_type)
+    return dict((pdbid, mapping[pdbid]) for pdbid in pdbids
+                if pdbid in mapping)
@@ -0,0 +1,205 @@
+# pipeline.py - run the stages of the leave-one-out analysis in one process
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Provides functions for running the stages which make up the leave-one-out
+analysis of analyze-smurf.sh (see gargamel.alignments, gargamel.models,
+gargamel.controls and gargamel.summary) one after another in this process (see
+run-pipeline.py).
+
+Each stage is called with the options its script (generate-matt-alignments.py,
+generate-hmm.py, generate-positive-controls.py, generate-negative-controls.py
+or generate-csv.py) would parse from the command line, so Biopython and this
+package are imported and the logger is configured only once, and the SCOP,
+NRPDB and FASTA indices of the ReferenceData given to the stages are loaded
+once for every stage.
+
+In streaming mode, the stages which run jobs only prepare them (see
+gargamel.jobs.defer_jobs), and the jobs of all of those stages are then run
+together by gargamel.jobs.run_graph, so that each family moves on to its next
+stage as soon as its own jobs of the stage before have finished. The summary
+stages, which read every output, are run after all of the jobs.
+
+"""
+
+from util import require_python_version
+require_python_version(2, 7)
+
+import time
+from collections import namedtuple
+
+from alignments import generate_matt_alignments
+from argumentparsers import AlignmentArgumentParser
+from argumentparsers import ModelArgumentParser
+from argumentparsers import MultipleAlignmentArgumentParser
+from argumentparsers import NegativeControlArgumentParser
+from argumentparsers import StructuralAlignmentArgumentParser
+from constants import HMMER
+from constants import SMURF_LITE
+from controls import generate_negative_controls
+from controls import generate_positive_controls
+from jobs import DEFAULT_NUM_JOBS
+from jobs import defer_jobs
+from jobs import deferred_jobs
+from jobs import log_summary
+from jobs import run_graph
+from logger import logger
+from models import generate_hmm
+from refclient import server_available
+from summary import generate_csv
+
+# the scripts of the stages of the pipeline
+MATT_SCRIPT = 'generate-matt-alignments.py'
+HMM_SCRIPT = 'generate-hmm.py'
+POSITIVE_SCRIPT = 'generate-positive-controls.py'
+NEGATIVE_SCRIPT = 'generate-negative-controls.py'
+CSV_SCRIPT = 'generate-csv.py'
+
+# the representative fields used for training and for the negative controls,
+# as in analyze-smurf.sh
+TRAINING_REP = 'blast7'
+POSITIVE_REP = 'nonident'
+NEGATIVE_REP = 'blast7'
+
+class Stage(namedtuple('Stage', ('script', 'argv', 'function', 'args'))):
+    """A single stage of the pipeline: the script which runs it alone and the
+    list of its command-line arguments, and the function which the pipeline
+    calls in its place and the arguments with which to call it.
+
+    """
+
+    def __str__(self):
+        """Returns the command line of this stage."""
+        return ' '.join([self.script] + self.argv)
+
+def _stage(script, argparser_class, function, argv, reference=None):
+    """Returns the Stage which calls the specified function with the options
+    parsed from the specified list of command-line arguments by the specified
+    argument parser class, followed by the specified ReferenceData if there is
+    one.
+
+    """
+    parsed_args = argparser_class(script).parse_args(argv)
+    args = (parsed_args, ) if reference is None else (parsed_args, reference)
+    return Stage(script, argv, function, args)
+
+def analysis_stages(reference, output_dir, level, threshold, simev_frequency,
+                    simev_count, simev_threshold, run_hmmer=False,
+                    skip_matt=False, num_jobs=DEFAULT_NUM_JOBS,
+                    verbose=False):
+    """Returns the list of the stages run by analyze-smurf.sh for the
+    specified output directory, SCOP hierarchy level (for example,
+    'sf=46458'), smurf-lite beta threshold and simulated evolution options,
+    reading the reference data files of the specified ReferenceData.
+
+    The stages which align the structures with Matt are left out if
+    `skip_matt' is True, and the stages which train and query HMMER are left
+    out unless `run_hmmer' is True. Each stage runs at most `num_jobs' jobs at
+    once.
+
+    """
+    common = ['-j', str(num_jobs)] + (['-v'] if verbose else [])
+    stages = []
+    if not skip_matt:
+        stages.append(_stage(MATT_SCRIPT, MultipleAlignmentArgumentParser,
+                             generate_matt_alignments,
+                             common + ['-r', TRAINING_REP, output_dir, level],
+                             reference))
+    for aligner in [SMURF_LITE] + ([HMMER] if run_hmmer else []):
+        options = []
+        if aligner == SMURF_LITE:
+            options = ['-s', str(threshold), '-f', str(simev_frequency),
+                       '-c', str(simev_count), '-t', str(simev_threshold)]
+        stages.extend([
+            _stage(HMM_SCRIPT, ModelArgumentParser, generate_hmm,
+                   common + [output_dir, aligner] + options),
+            _stage(POSITIVE_SCRIPT, StructuralAlignmentArgumentParser,
+                   generate_positive_controls,
+                   common + ['-r', POSITIVE_REP, output_dir, aligner, level],
+                   reference),
+            _stage(NEGATIVE_SCRIPT, NegativeControlArgumentParser,
+                   generate_negative_controls,
+                   common + ['-r', NEGATIVE_REP, output_dir, aligner, level],
+                   reference),
+            _stage(CSV_SCRIPT, AlignmentArgumentParser, generate_csv,
+                   common + [output_dir, aligner])])
+    return stages
+
+def run_stage(stage):
+    """Calls the function of the specified stage, and returns its exit status.
+
+    An exception raised by the function is logged, and the status is then 1.
+
+    """
+    try:
+        return stage.function(*stage.args)
+    except Exception as error:
+        logger.exception(stage.script + ' raised ' + repr(error))
+        return 1
+
+def _run_stages(stages):
+    """Runs the specified stages one after another, stopping at the first
+    stage which fails, and returns the exit status of the last stage run.
+
+    """
+    for number, stage in enumerate(stages):
+        logger.info('Running stage ' + str(number + 1) + ' of '
+                    + str(len(stages)) + ': ' + str(stage))
+        start = time.time()
+        status = run_stage(stage)
+        if status != 0:
+            logger.critical(stage.script + ' exited with status '
+                            + str(status))
+            return status
+        logger.info('Finished ' + stage.script + ' in '
+                    + '%.1f' % (time.time() - start) + ' seconds')
+    return 0
+
+def run_pipeline(stages, reference, streaming=False,
+                 num_jobs=DEFAULT_NUM_JOBS):
+    """Loads the specified ReferenceData, then runs the specified stages one
+    after another in this process, stopping at the first stage which fails,
+    and returns the exit status of the last stage run.
+
+    If `streaming' is True, the jobs of every stage but the summaries are
+    instead run together, at most `num_jobs' at once, each as soon as the jobs
+    which write its inputs have finished, and then the summaries are run.
+
+    The reference data is not loaded here if a reference data server is
+    running, since the stages then get it from the server instead.
+
+    """
+    if not server_available():
+        start = time.time()
+        reference.load()
+        logger.info('Loaded reference data in '
+                    + '%.1f' % (time.time() - start) + ' seconds')
+    if streaming:
+        queueing = [stage for stage in stages
+                    if stage.function is not generate_csv]
+        stages = [stage for stage in stages if stage.function is generate_csv]
+        defer_jobs()
+        try:
+            status = _run_stages(queueing)
+        finally:
+            jobs = deferred_jobs()
+        if status != 0:
+            return status
+        logger.info('Running ' + str(len(jobs)) + ' jobs of '
+                    + str(len(queueing)) + ' stages, ' + str(num_jobs)
+                    + ' at a time...')
+        log_summary(run_graph(jobs, num_jobs))
+    return _run_stages(stages)
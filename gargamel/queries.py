@@ -0,0 +1,477 @@
+# queries.py - functions for querying aligners with single protein chains
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Provides functions common to the scripts which query a trained aligner with
+protein chains, such as generate-positive-controls.py and
+generate-negative-controls.py.
+
+"""
+
+from util import require_python_version
+require_python_version(2, 7)
+
+import hashlib
+import os
+import os.path
+import tempfile
+
+import numpy
+
+from cache import file_signature
+from constants import BATCH_OUTPUT_SUFFIX
+from constants import DEFAULT_EVALUE
+from constants import DOMAIN_TABLE_OUTPUT_SUFFIX
+from constants import DEFAULT_MAX_NUM_HITS
+from constants import HMMER
+from constants import HMMER_EXECUTABLE
+from constants import HMMER_HMM_FILENAME
+from constants import HMMER_HMMPRESS_EXECUTABLE
+from constants import HMMER_HMMSCAN_EXECUTABLE
+from constants import MRFY
+from constants import MRFY_EXECUTABLE
+from constants import MRF_FILENAME
+from constants import PROFILE_SMURF
+from constants import PROFILE_SMURF_EXECUTABLE
+from constants import QUERY_OUTPUT_SUFFIX
+from constants import SHARD_DONE_SUFFIX
+from constants import SHARED_CHAINS_SUFFIX
+from constants import SMURF
+from constants import SMURF_EXECUTABLE
+from constants import SMURF_HMM_FILENAME
+from constants import SMURF_LITE
+from constants import SMURF_LITE_EXECUTABLE
+from constants import SMURF_LITE_HMM_FILENAME
+from constants import TABLE_OUTPUT_SUFFIX
+from constants import TMP_DIR
+from hmmer import split_scan_output
+from hmmer import split_scan_table_output
+from hmmer import split_search_output
+from hmmer import split_table_output
+from hmmer import write_model_database
+from jobs import describe
+from logger import logger
+from nrpdb import index_from_file
+from refclient import served
+from scop import arrays_from_file
+
+# the text to write to a readme file for each query output file
+QUERY_README = \
+"""This file contains the result of running a structural aligner on a single
+query protein chain, using the HMM file in the parent directory."""
+
+def write_query_readme(filename, query_cmd):
+    with open(filename, 'w') as f:
+        f.write(QUERY_README + '\n')
+        f.write('\n')
+        f.write('query command:\n')
+        f.write('  ' + str(query_cmd) + '\n')
+
+def file_stem(pdbid):
+    """Returns the stem of the names of the files for the specified PDB
+    ID:chain, for example 'pdb101m_A' for '101m:A'.
+
+    """
+    return 'pdb' + pdbid.replace(':', '_')
+
+def query_fasta_filename(pdbid):
+    """Returns the name of the temporary FASTA file containing the sequence of
+    the specified PDB ID:chain.
+
+    """
+    return os.path.join(TMP_DIR, file_stem(pdbid) + '.fasta')
+
+def query_output_filename(dirname, pdbid):
+    """Returns the name of the file in the specified directory to which the
+    result of querying the specified PDB ID:chain is written.
+
+    """
+    return os.path.join(dirname, file_stem(pdbid) + QUERY_OUTPUT_SUFFIX)
+
+def table_filename(output_filename):
+    """Returns the name of the file to which the tabular output of the HMMER
+    query writing to the specified output file is written.
+
+    """
+    return output_filename + TABLE_OUTPUT_SUFFIX
+
+def domain_table_filename(output_filename):
+    """Returns the name of the file to which the domain tabular output of the
+    HMMER query writing to the specified output file is written.
+
+    """
+    return output_filename + DOMAIN_TABLE_OUTPUT_SUFFIX
+
+def _table_options(output_filename):
+    """Returns the options which make HMMER write its tabular and domain
+    tabular outputs beside the specified output file.
+
+    """
+    return ['--tblout', table_filename(output_filename),
+            '--domtblout', domain_table_filename(output_filename)]
+
+def write_query_fasta(sequences, pdbid):
+    """Writes the sequence of the specified PDB ID:chain from the specified
+    mapping (as returned by gargamel.fasta.sequences_from_file) to its
+    temporary FASTA file, unless that file already exists, and returns the
+    name of the file.
+
+    The sequence is written to a uniquely named file which is then renamed, so
+    concurrent queries of the same chain never see a partially written file.
+
+    """
+    fasta_filename = query_fasta_filename(pdbid)
+    logger.debug('  Checking whether FASTA file for ' + str(pdbid)
+                 + ' exists...')
+    if not os.path.isfile(fasta_filename):
+        logger.debug('  ...it doesn\'t, so we create it...')
+        fd, temp_filename = tempfile.mkstemp(dir=TMP_DIR, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as fasta_file:
+                fasta_file.writelines(sequences[pdbid])
+            # mkstemp creates the file readable only by its owner
+            os.chmod(temp_filename, 0644)
+            os.rename(temp_filename, fasta_filename)
+        except:
+            os.remove(temp_filename)
+            raise
+        logger.debug('  ...wrote to ' + fasta_filename)
+    return fasta_filename
+
+def _batch_stem(pdbids):
+    """Returns the stem of the names of the files for a batch query of the
+    specified PDB ID:chains, which depends only on the chains in the batch.
+
+    """
+    return 'batch.' + hashlib.md5('\n'.join(pdbids)).hexdigest()
+
+def write_batch_fasta(sequences, pdbids):
+    """Writes the sequences of the specified PDB ID:chains from the specified
+    mapping to a single temporary FASTA file, unless that file already exists.
+
+    Returns a tuple containing the name of the file and a list of the names of
+    the sequences in it (for example, '101m_A'), in the order of `pdbids'. As
+    with write_query_fasta, the file is written atomically, so the same batch
+    can be used concurrently against several models.
+
+    """
+    fasta_filename = os.path.join(TMP_DIR, _batch_stem(pdbids) + '.fasta')
+    names = [str(sequences[pdbid][0]).split()[0][1:] for pdbid in pdbids]
+    if not os.path.isfile(fasta_filename):
+        fd, temp_filename = tempfile.mkstemp(dir=TMP_DIR, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as fasta_file:
+                for pdbid in pdbids:
+                    fasta_file.writelines(sequences[pdbid])
+            os.chmod(temp_filename, 0644)
+            os.rename(temp_filename, fasta_filename)
+        except:
+            os.remove(temp_filename)
+            raise
+        logger.debug('  wrote ' + str(len(pdbids)) + ' sequences to '
+                     + fasta_filename)
+    return fasta_filename, names
+
+def batch_output_filename(dirname, pdbids):
+    """Returns the name of the file in the specified directory to which the
+    result of a batch query of the specified PDB ID:chains is written.
+
+    """
+    return os.path.join(dirname, _batch_stem(pdbids) + BATCH_OUTPUT_SUFFIX)
+
+def batch_query_command(aligner, aligner_output_dir, fasta_filename,
+                        output_filename):
+    """Returns the command line (as a list) which queries the model trained
+    by the specified aligner in the specified directory with every sequence in
+    the specified FASTA file at once, writing the result to the specified
+    output file.
+
+    Only HMMER can query many sequences at once, so raises a ValueError for
+    any other aligner. The domain E-values are computed as if each sequence
+    had been searched alone, as are the sequence E-values by query_command.
+
+    """
+    if aligner != HMMER:
+        raise ValueError('Cannot query many sequences at once with aligner '
+                         + aligner)
+    return [HMMER_EXECUTABLE,
+            '-Z 1.0',
+            '--domZ', '1.0',
+            '-E 10000',
+            '-o', output_filename] + _table_options(output_filename) + [
+            os.path.join(aligner_output_dir, HMMER_HMM_FILENAME),
+            fasta_filename]
+
+def split_batch_output(batch_output_filename, names, output_filenames):
+    """Splits the output of a batch query written to the specified file into
+    one output file per query, as if each had been queried alone.
+
+    `names' is the list of the names of the queried sequences, as returned by
+    write_batch_fasta, and `output_filenames' is the list of the files to
+    which to write their results. Returns 0, for use as a command of a
+    gargamel.jobs.Job.
+
+    """
+    split_search_output(batch_output_filename,
+                        dict(zip(names, output_filenames)))
+    # split the tabular outputs too, unless they were not requested
+    for suffix_filename, domains in ((table_filename, False),
+                                     (domain_table_filename, True)):
+        if os.path.isfile(suffix_filename(batch_output_filename)):
+            split_table_output(suffix_filename(batch_output_filename),
+                               dict(zip(names, map(suffix_filename,
+                                                   output_filenames))),
+                               domains)
+    return 0
+
+def press_command(database_filename):
+    """Returns the command line (as a list) which indexes the specified
+    database of HMMER models for use by scan_query_command, overwriting any
+    index left from a previous run.
+
+    """
+    return [HMMER_HMMPRESS_EXECUTABLE, '-f', database_filename]
+
+def write_scan_database(model_filenames, names, database_filename):
+    """Writes the models in the specified files to the specified database for
+    scan_query_command, each renamed to the corresponding name in `names'
+    (see gargamel.hmmer.write_model_database). Returns 0, for use as a command
+    of a gargamel.jobs.Job.
+
+    """
+    write_model_database(model_filenames, names, database_filename)
+    return 0
+
+def scan_query_command(database_filename, fasta_filename, output_filename):
+    """Returns the command line (as a list) which queries every model in the
+    specified database (written by gargamel.hmmer.write_model_database and
+    indexed by press_command) with every sequence in the specified FASTA file
+    at once, writing the result to the specified output file.
+
+    The E-values are computed as if each sequence had been searched against
+    each model alone, as by query_command.
+
+    """
+    return [HMMER_HMMSCAN_EXECUTABLE,
+            '-Z 1.0',
+            '--domZ', '1.0',
+            '-E 10000',
+            '-o', output_filename] + _table_options(output_filename) + [
+            database_filename,
+            fasta_filename]
+
+def split_scan_output_by_family(scan_output_filename, names, models,
+                                output_filenames):
+    """Splits the output of a scan query written to the specified file into
+    one output file per query and family, as if each query had been run
+    against the model of each family alone.
+
+    `names' is the list of the names of the queried sequences, as returned by
+    write_batch_fasta, `models' is the list of the names of the models in the
+    database, and `output_filenames' is a list containing, for each model, the
+    list of the files to which to write the results of the queries against
+    that model. Returns 0, for use as a command of a gargamel.jobs.Job.
+
+    """
+    by_query = dict((name, {}) for name in names)
+    for model, model_output_filenames in zip(models, output_filenames):
+        for name, output_filename in zip(names, model_output_filenames):
+            by_query[name][model] = output_filename
+    split_scan_output(scan_output_filename, by_query)
+    # split the tabular outputs too, unless they were not requested
+    for suffix_filename, domains in ((table_filename, False),
+                                     (domain_table_filename, True)):
+        if os.path.isfile(suffix_filename(scan_output_filename)):
+            split_scan_table_output(suffix_filename(scan_output_filename),
+                                    dict((name, dict((model,
+                                                      suffix_filename(output))
+                                                     for model, output in
+                                                     models.iteritems()))
+                                         for name, models in
+                                         by_query.iteritems()),
+                                    domains)
+    return 0
+
+def write_shared_chains(output_filename, shared_pdbids):
+    """Records that the result in the specified output file also applies to
+    each of the specified PDB ID:chains, which have the same sequence as the
+    chain which was queried.
+
+    The PDB ID:chains are written one per line to a file whose name is the
+    output filename followed by SHARED_CHAINS_SUFFIX. If there are none, any
+    such file left from a previous run is removed.
+
+    """
+    shared_filename = output_filename + SHARED_CHAINS_SUFFIX
+    if not shared_pdbids:
+        if os.path.isfile(shared_filename):
+            os.remove(shared_filename)
+        return
+    with open(shared_filename, 'w') as f:
+        f.writelines(pdbid + '\n' for pdbid in shared_pdbids)
+
+def shared_chains(output_filename):
+    """Returns a list of the PDB ID:chains recorded by write_shared_chains for
+    the specified output file.
+
+    """
+    shared_filename = output_filename + SHARED_CHAINS_SUFFIX
+    if not os.path.isfile(shared_filename):
+        return []
+    with open(shared_filename, 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def shard_done_filename(dirname, output_filenames, model_filename, commands):
+    """Returns the name of the file in the specified directory which marks
+    that the specified commands, which query the model in the specified file
+    and write to each of the specified output files, have all finished, or
+    None if the model file does not exist.
+
+    The name depends on the output files, the digest of the contents of the
+    model file (from gargamel.cache.file_signature) and the commands, so a
+    shard made up of different queries (for example, after changing the shard
+    size), or run against a model which has since changed, has a different
+    marker. A model which is written again with the same contents (such as the
+    database of every model in scan mode) keeps its markers.
+
+    """
+    if not os.path.isfile(model_filename):
+        return None
+    digest = hashlib.md5('\n'.join(sorted(output_filenames)))
+    digest.update('\0' + file_signature(model_filename)[2])
+    for command in commands:
+        digest.update('\0' + describe(command))
+    return os.path.join(dirname, '.shard.' + digest.hexdigest()
+                        + SHARD_DONE_SUFFIX)
+
+@served
+def negative_query_chains(scop_filename, nrpdb_filename, rep_type,
+                          target_key, target_value, every=1):
+    """Returns a tuple containing a sorted list of the PDB ID:chains to query
+    as negative controls of the specified SCOP hierarchy level, and the number
+    of candidates from which they were chosen.
+
+    The candidates are the representatives, in the non-redundant set rep_type
+    of the specified NRPDB file, of the chains in the specified SCOP
+    classification file outside of the hierarchy level, except those in the
+    same PDB entry as the representative of a chain inside it. Only every
+    `every'th candidate, in sorted order, is chosen.
+
+    The chains are handled as integer codes into the SCOP and NRPDB indices
+    (see gargamel.scop.ScopArrays and gargamel.nrpdb.NrpdbIndex), and only
+    the chosen chains are converted to strings, so when a reference data
+    server is running only they are sent to this process.
+
+    """
+    arrays = arrays_from_file(scop_filename)
+    index = index_from_file(nrpdb_filename)
+    representatives = index.representative_array(rep_type)
+
+    def representatives_of(codes):
+        codes = numpy.unique(codes)
+        positions = index.positions(arrays.chain_array[codes[codes >= 0]])
+        reps = representatives[positions[positions >= 0]]
+        return numpy.unique(reps[reps >= 0])
+
+    trained = representatives_of(arrays.members(target_key, target_value))
+    candidates = representatives_of(arrays.outside(target_key, target_value))
+    candidates = candidates[~numpy.in1d(index.structures[candidates],
+                                        index.structures[trained])]
+    candidates = candidates[numpy.argsort(index.ranks[candidates])]
+    return ([index.chains[position]
+             for position in candidates[every - 1::every].tolist()],
+            len(candidates))
+
+def distinct_queries(sequences, pdbids):
+    """Returns a list of (pdbid, shared_pdbids) tuples, one for each distinct
+    sequence among the specified PDB ID:chains.
+
+    Only `pdbid' needs to be queried; its result applies equally to each of the
+    PDB ID:chains in `shared_pdbids', which have identical sequences. Chains
+    with no sequence in the specified mapping (which must be keyed by chain)
+    are logged and skipped.
+
+    """
+    # fetch the records of all the chains at once, so that a RemoteSequences
+    # asks the reference data server only once
+    records = sequences.records(pdbids)
+    missing = [pdbid for pdbid in pdbids if pdbid not in records]
+    for pdbid in sorted(missing):
+        logger.error('  No FASTA sequence was read for PDB ID ' + pdbid)
+        logger.error('  Not writing FASTA file for this protein.')
+    queries = sequences.identical_groups(pdbids)
+    logger.debug('  ' + str(len(queries)) + ' distinct sequences among '
+                 + str(len(pdbids) - len(missing)) + ' chains')
+    return queries
+
+def model_filename(aligner, aligner_output_dir):
+    """Returns the name of the model trained by the specified aligner in the
+    specified directory, which is read by query_command and
+    batch_query_command.
+
+    Raises a ValueError if the aligner is unknown.
+
+    """
+    if aligner == SMURF or aligner == PROFILE_SMURF:
+        return os.path.join(aligner_output_dir, SMURF_HMM_FILENAME)
+    elif aligner == MRFY:
+        return os.path.join(aligner_output_dir, MRF_FILENAME)
+    elif aligner == HMMER:
+        return os.path.join(aligner_output_dir, HMMER_HMM_FILENAME)
+    elif aligner == SMURF_LITE:
+        return os.path.join(aligner_output_dir, SMURF_LITE_HMM_FILENAME)
+    raise ValueError('Unknown aligner type: ' + aligner)
+
+def query_command(aligner, aligner_output_dir, fasta_filename,
+                  output_filename):
+    """Returns the command line (as a list) which queries the model trained
+    by the specified aligner in the specified directory with the sequence in
+    the specified FASTA file, writing the result to the specified output file.
+
+    Raises a ValueError if the aligner is unknown.
+
+    """
+    if aligner == SMURF:
+        return [SMURF_EXECUTABLE,
+                os.path.join(aligner_output_dir, SMURF_HMM_FILENAME),
+                fasta_filename,
+                output_filename]
+    elif aligner == MRFY:
+        return [MRFY_EXECUTABLE,
+                # MRFY_ARGS,
+                os.path.join(aligner_output_dir, MRF_FILENAME),
+                fasta_filename,
+                output_filename]
+    elif aligner == HMMER:
+        return [HMMER_EXECUTABLE,
+                '-Z 1.0',
+                '-E 10000',
+                '-o', output_filename] + _table_options(output_filename) + [
+                os.path.join(aligner_output_dir, HMMER_HMM_FILENAME),
+                fasta_filename]
+    elif aligner == PROFILE_SMURF:
+        return [PROFILE_SMURF_EXECUTABLE,
+                '-e ' + str(DEFAULT_EVALUE),
+                '-x ' + str(DEFAULT_MAX_NUM_HITS),
+                os.path.join(aligner_output_dir, SMURF_HMM_FILENAME),
+                fasta_filename,
+                output_filename]
+    elif aligner == SMURF_LITE:
+        return [SMURF_LITE_EXECUTABLE,
+                os.path.join(aligner_output_dir, SMURF_LITE_HMM_FILENAME),
+                fasta_filename,
+                output_filename]
+    raise ValueError('Unknown aligner type: ' + aligner)
@@ -0,0 +1,242 @@
+# refclient.py - client for the long-lived reference data server
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Provides the client side of the reference data server (see
+gargamel.refserver and reference-server.py).
+
+Functions which answer queries about the SCOP, NRPDB and FASTA reference data
+files are decorated with `served'. When a reference data server is listening
+on REFERENCE_SOCKET, calling such a function sends the call to the server,
+which has already loaded the file, and returns its answer. Otherwise the
+function is called directly in this process, as if it had not been decorated.
+
+Since every answer is copied to the client, only functions which answer a
+specific query (for example, the representatives of a list of chains, or the
+chains beneath a single SCOP node) are served, and never functions which
+return the whole of a reference data file; those are instead loaded in each
+process from the indices saved by gargamel.cache. Queries about many keys
+should be asked in a single call rather than one call per key.
+
+Messages in both directions are pickled objects, each preceded by its length
+as a four byte unsigned integer in network byte order. A request is a tuple
+(name, args, kwargs), and a response is a tuple (succeeded, value), where
+`value' is the exception raised by the function if `succeeded' is False.
+
+"""
+
+from util import require_python_version
+require_python_version(2, 7)
+
+import cPickle
+import functools
+import os
+import os.path
+import socket
+import struct
+import threading
+
+from constants import REFERENCE_SOCKET
+from logger import logger
+
+# the format of the length which precedes each message
+LENGTH_FORMAT = '!I'
+LENGTH_SIZE = struct.calcsize(LENGTH_FORMAT)
+
+# the functions which may be called through the server, keyed by name
+_local_functions = {}
+
+# whether this process is the server, in which case calls are never forwarded
+serving = False
+
+# the connection to the server, None if not yet connected, or False if no
+# server is available, and the process which made it
+_connection = None
+_connection_lock = threading.Lock()
+_connection_pid = os.getpid()
+
+class ReferenceServerError(Exception):
+    """Raised when the reference data server cannot answer a request."""
+    pass
+
+def send_message(f, obj):
+    """Pickles the specified object and writes it, preceded by its length, to
+    the specified file-like object.
+
+    The object is pickled completely before anything is written, so if it
+    cannot be pickled nothing is sent.
+
+    """
+    data = cPickle.dumps(obj, cPickle.HIGHEST_PROTOCOL)
+    f.write(struct.pack(LENGTH_FORMAT, len(data)) + data)
+    f.flush()
+
+def _read_exactly(f, size):
+    """Reads exactly the specified number of bytes from the specified file-like
+    object, raising EOFError if it is closed first.
+
+    """
+    data = f.read(size)
+    if len(data) < size:
+        raise EOFError('connection closed')
+    return data
+
+def receive_message(f):
+    """Reads a message written by send_message from the specified file-like
+    object and returns the unpickled object.
+
+    Raises EOFError if the connection is closed before a complete message has
+    been read.
+
+    """
+    size, = struct.unpack(LENGTH_FORMAT, _read_exactly(f, LENGTH_SIZE))
+    return cPickle.loads(_read_exactly(f, size))
+
+def function_name(function):
+    """Returns the name by which the specified function is called through the
+    server, for example 'scop.hierarchy_sets_from_file'.
+
+    """
+    return function.__module__.rpartition('.')[2] + '.' + function.__name__
+
+def register(function):
+    """Allows the specified function to be called through the server with
+    `call', and returns it unchanged.
+
+    """
+    _local_functions[function_name(function)] = function
+    return function
+
+def local_function(name):
+    """Returns the function registered with the specified name.
+
+    Raises ReferenceServerError if no function has been registered with that
+    name.
+
+    """
+    try:
+        return _local_functions[name]
+    except KeyError:
+        raise ReferenceServerError('Unknown function ' + name)
+
+def _forget_parent_connection():
+    """Forgets the connection inherited from the parent process, if this
+    process was forked after connecting, so that this process makes its own
+    connection rather than interleaving its messages with the parent's.
+
+    The lock is replaced as well, since another thread of the parent may have
+    held it at the time of the fork.
+
+    """
+    global _connection, _connection_lock, _connection_pid
+    if _connection_pid != os.getpid():
+        _connection = None
+        _connection_lock = threading.Lock()
+        _connection_pid = os.getpid()
+
+def _connect():
+    """Returns a connection to the reference data server, or False if no
+    server is available.
+
+    The result is remembered, so a process which finds no server does not look
+    for one again. Must be called with _connection_lock held.
+
+    """
+    global _connection
+    if _connection is None:
+        _connection = False
+        if os.path.exists(REFERENCE_SOCKET):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(REFERENCE_SOCKET)
+            except socket.error as error:
+                logger.debug('No reference data server on ' + REFERENCE_SOCKET
+                             + ': ' + str(error))
+                sock.close()
+            else:
+                logger.debug('Connected to reference data server on '
+                             + REFERENCE_SOCKET)
+                _connection = sock.makefile('rwb')
+                sock.close()
+    return _connection
+
+def server_available():
+    """Returns True if and only if calls to served functions are being sent to
+    a reference data server.
+
+    """
+    if serving:
+        return False
+    _forget_parent_connection()
+    with _connection_lock:
+        return bool(_connect())
+
+def call(name, *args, **kwargs):
+    """Calls the registered function with the specified name on the reference
+    data server with the specified arguments, and returns its result.
+
+    If the function raises an exception on the server, the same exception is
+    raised here. Raises ReferenceServerError if no server is available or the
+    connection to the server is lost, in which case no server is used for the
+    rest of the lifetime of this process.
+
+    """
+    global _connection
+    _forget_parent_connection()
+    with _connection_lock:
+        connection = _connect()
+        if not connection:
+            raise ReferenceServerError('No reference data server is available')
+        try:
+            send_message(connection, (name, args, kwargs))
+            succeeded, value = receive_message(connection)
+        except (EOFError, IOError, socket.error, cPickle.UnpicklingError) \
+                as error:
+            _connection = False
+            try:
+                connection.close()
+            except socket.error:
+                pass
+            raise ReferenceServerError('Lost connection to reference data '
+                                       'server: ' + str(error))
+    if not succeeded:
+        raise value
+    return value
+
+def served(function):
+    """Decorates the specified function so that it is called through the
+    reference data server when one is available.
+
+    The arguments and the result of the function must be picklable, and the
+    result should be small, since it is copied to the client on every call.
+    If the server cannot be reached, the function is called directly in this
+    process.
+
+    """
+    name = function_name(function)
+    register(function)
+
+    @functools.wraps(function)
+    def call_served(*args, **kwargs):
+        if server_available():
+            try:
+                return call(name, *args, **kwargs)
+            except ReferenceServerError as error:
+                logger.warning(str(error) + '; reading reference data '
+                               'directly')
+        return function(*args, **kwargs)
+
+    return call_served
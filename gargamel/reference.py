@@ -0,0 +1,54 @@
+# reference.py - the reference data files read by the stages of the analysis
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Provides the ReferenceData passed to the stages of the leave-one-out
+analysis which read the SCOP, NRPDB and FASTA reference data files (see
+gargamel.alignments and gargamel.controls).
+
+"""
+
+from util import require_python_version
+require_python_version(2, 7)
+
+from collections import namedtuple
+
+from refserver import load_reference_data
+
+class ReferenceData(namedtuple('ReferenceData', ('scop_filename',
+                                                 'nrpdb_filename',
+                                                 'fasta_filename'))):
+    """The SCOP classification file, the NRPDB file and the FASTA file of
+    sequences from which the stages of the analysis read.
+
+    The stages look up the data in these files with the functions of
+    gargamel.scop, gargamel.nrpdb and gargamel.fasta, each of which loads the
+    index of its file the first time it is called and remembers it for the
+    lifetime of this process, or asks the reference data server if one is
+    running. Every stage run in the same process with the same ReferenceData
+    therefore shares the data loaded by the first.
+
+    """
+
+    __slots__ = ()
+
+    def load(self):
+        """Loads the indices of all of the files now, rather than when a stage
+        first needs them.
+
+        """
+        load_reference_data(self.scop_filename, self.nrpdb_filename,
+                            self.fasta_filename)
@@ -0,0 +1,131 @@
+# refserver.py - long-lived server for the reference data files
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Provides a server which loads the SCOP, NRPDB and FASTA reference data
+files once and answers the calls of the functions decorated with
+gargamel.refclient.served, so that each of the scripts in a pipeline does not
+need to load the files itself.
+
+The protocol is described in gargamel.refclient.
+
+"""
+
+from util import require_python_version
+require_python_version(2, 7)
+
+import cPickle
+import os
+import os.path
+import socket
+import SocketServer
+
+import fasta
+import nrpdb
+import queries
+import refclient
+import scop
+from logger import logger
+from refclient import ReferenceServerError
+from refclient import local_function
+from refclient import receive_message
+from refclient import send_message
+
+class ReferenceRequestHandler(SocketServer.StreamRequestHandler):
+    """Answers each of the requests sent on a single connection, until the
+    client closes it.
+
+    """
+
+    def handle(self):
+        """Reads requests from the connection and writes the response to each
+        of them.
+
+        """
+        while True:
+            try:
+                name, args, kwargs = receive_message(self.rfile)
+            except EOFError:
+                return
+            try:
+                response = (True, local_function(name)(*args, **kwargs))
+            except Exception as error:
+                response = (False, error)
+            try:
+                send_message(self.wfile, response)
+            except (cPickle.PicklingError, TypeError) as error:
+                send_message(self.wfile,
+                             (False, ReferenceServerError('Cannot send result '
+                                                          'of ' + name + ': '
+                                                          + str(error))))
+
+class ReferenceServer(SocketServer.ThreadingMixIn,
+                      SocketServer.UnixStreamServer):
+    """Serves each connection in its own thread."""
+    daemon_threads = True
+
+def _remove_stale_socket(socket_filename):
+    """Removes the specified socket file if no server is listening on it.
+
+    Raises a ReferenceServerError if another server is already listening.
+
+    """
+    if not os.path.exists(socket_filename):
+        return
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_filename)
+    except socket.error:
+        os.remove(socket_filename)
+    else:
+        raise ReferenceServerError('A reference data server is already '
+                                   'listening on ' + socket_filename)
+    finally:
+        sock.close()
+
+def load_reference_data(scop_filename, nrpdb_filename, fasta_filename):
+    """Loads the indices of the specified reference data files, which are then
+    remembered for the lifetime of this process.
+
+    """
+    logger.info('Loading SCOP classification file ' + scop_filename + '...')
+    scop.tree_from_file(scop_filename)
+    scop.arrays_from_file(scop_filename)
+    scop.lineage_index_from_file(scop_filename)
+    logger.info('Loading NRPDB file ' + nrpdb_filename + '...')
+    index = nrpdb.index_from_file(nrpdb_filename)
+    for rep_type in [None] + nrpdb.RepresentativeFields.ALL_REPS:
+        index.mapping(rep_type)
+    logger.info('Loading FASTA file ' + fasta_filename + '...')
+    for by_chain in (False, True):
+        fasta._served_sequences_call(fasta_filename, by_chain, '__len__')
+
+def serve(socket_filename, scop_filename, nrpdb_filename, fasta_filename):
+    """Loads the specified reference data files and answers requests on the
+    specified Unix domain socket until interrupted.
+
+    """
+    refclient.serving = True
+    _remove_stale_socket(socket_filename)
+    load_reference_data(scop_filename, nrpdb_filename, fasta_filename)
+
+    server = ReferenceServer(socket_filename, ReferenceRequestHandler)
+    logger.info('Serving reference data on ' + socket_filename)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(socket_filename)
@@ -0,0 +1,219 @@
+# results.py - columnar binary store of the summarized results of queries
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Provides functions for writing the rows of the summary CSV file written by
+generate-csv.py to a columnar binary store, and for loading that store.
+
+The store is a directory of NumPy .npy files, one per column, so each column
+can be memory mapped when it is loaded instead of being read and parsed. The
+chains and families are stored as integer codes into sorted lists of their
+names, the scores as floating point numbers (NaN where there is no score),
+and the labels as booleans (True for a positive control).
+
+Each time the store is written, its columns are written to a new version
+subdirectory of the store, and the symbolic link CURRENT_LINKNAME in the store
+is then atomically replaced by one to the new version, so a reader always
+finds either the whole of the old version or the whole of the new one.
+
+"""
+
+from util import require_python_version
+require_python_version(2, 7)
+
+import os
+import os.path
+import shutil
+import tempfile
+
+import numpy
+
+from cache import make_dirs
+
+# the name of the store in the output directory, after the name of the aligner
+RESULTS_DIRNAME = 'results'
+
+# the names of the files containing the columns of the store
+CHAINS_FILENAME = 'chains.npy'
+FAMILIES_FILENAME = 'families.npy'
+SCORES_FILENAME = 'scores.npy'
+LABELS_FILENAME = 'labels.npy'
+CHAIN_NAMES_FILENAME = 'chain_names.npy'
+FAMILY_NAMES_FILENAME = 'family_names.npy'
+
+# the name of the symbolic link in the store to the directory of its current
+# version, and the suffix of the name of the directory of each version
+CURRENT_LINKNAME = 'current'
+VERSION_SUFFIX = '.version'
+
+def results_dirname(output_dir, aligner):
+    """Returns the name of the store of the results of the specified aligner
+    in the specified output directory.
+
+    """
+    return os.path.join(output_dir, aligner + '_' + RESULTS_DIRNAME)
+
+class Results(object):
+    """The columns of the summarized results of the queries of one aligner.
+
+    Row i is the result of querying the model of family
+    family_names[families[i]] with chain chain_names[chains[i]] (a PDB
+    ID:chain string), which got score scores[i] and was a positive control if
+    and only if labels[i] is True.
+
+    """
+
+    def __init__(self, chains, families, scores, labels, chain_names,
+                 family_names):
+        """Instantiates these results with the specified columns and lists of
+        names.
+
+        """
+        self.chains = chains
+        self.families = families
+        self.scores = scores
+        self.labels = labels
+        self.chain_names = chain_names
+        self.family_names = family_names
+
+    def __len__(self):
+        """Returns the number of rows."""
+        return len(self.scores)
+
+    def family_mask(self, family):
+        """Returns a boolean array which is True for the rows of the specified
+        family (a sunid string).
+
+        """
+        code = numpy.searchsorted(self.family_names, family)
+        if code == len(self.family_names) or \
+                self.family_names[code] != family:
+            return numpy.zeros(len(self), dtype=bool)
+        return self.families == code
+
+    def row(self, i):
+        """Returns row i as a (pdbid, chainid, family, rawscore, label) tuple,
+        as written to the summary CSV file, with a rawscore of None if there
+        is no score.
+
+        """
+        pdbid, chain = self.chain_names[self.chains[i]].split(':')
+        score = float(self.scores[i])
+        return (pdbid, chain, self.family_names[self.families[i]],
+                None if numpy.isnan(score) else score,
+                'positive' if self.labels[i] else 'negative')
+
+def _codes(names):
+    """Returns a tuple containing the sorted array of the distinct specified
+    names, and the array of the code of each name in it.
+
+    """
+    distinct, codes = numpy.unique(numpy.array(names, dtype=str),
+                                   return_inverse=True)
+    return distinct, codes.astype(numpy.int32)
+
+def write_results(dirname, rows):
+    """Writes the specified rows, each a (pdbid, chainid, family, rawscore,
+    label) tuple as written to the summary CSV file, to the store in the
+    specified directory.
+
+    The columns are written to a new version directory in the store, which
+    then replaces the current version by renaming a symbolic link to it over
+    CURRENT_LINKNAME, so a reader never sees a partially written column nor a
+    missing store. The versions replaced are then removed.
+
+    """
+    rows = list(rows)
+    chain_names, chains = _codes([pdbid + ':' + chain
+                                  for pdbid, chain, family, score, label
+                                  in rows])
+    family_names, families = _codes([family for pdbid, chain, family, score,
+                                     label in rows])
+    scores = numpy.array([numpy.nan if score is None else float(score)
+                          for pdbid, chain, family, score, label in rows],
+                         dtype=numpy.float64)
+    labels = numpy.array([label == 'positive'
+                          for pdbid, chain, family, score, label in rows],
+                         dtype=bool)
+
+    make_dirs(dirname)
+    version_dirname = tempfile.mkdtemp(dir=dirname, suffix=VERSION_SUFFIX)
+    version = os.path.basename(version_dirname)
+    temp_linkname = os.path.join(dirname, version + '.link')
+    try:
+        for filename, column in ((CHAINS_FILENAME, chains),
+                                 (FAMILIES_FILENAME, families),
+                                 (SCORES_FILENAME, scores),
+                                 (LABELS_FILENAME, labels),
+                                 (CHAIN_NAMES_FILENAME, chain_names),
+                                 (FAMILY_NAMES_FILENAME, family_names)):
+            numpy.save(os.path.join(version_dirname, filename), column)
+        os.chmod(version_dirname, 0755)
+        # the link is relative, so the output directory can be moved
+        os.symlink(version, temp_linkname)
+        os.rename(temp_linkname, os.path.join(dirname, CURRENT_LINKNAME))
+    except:
+        shutil.rmtree(version_dirname, ignore_errors=True)
+        if os.path.lexists(temp_linkname):
+            os.remove(temp_linkname)
+        raise
+
+    # remove the versions replaced, and the columns of a store written before
+    # the store was versioned
+    for name in os.listdir(dirname):
+        if name.endswith(VERSION_SUFFIX) and name != version:
+            shutil.rmtree(os.path.join(dirname, name), ignore_errors=True)
+        elif name.endswith('.npy'):
+            os.remove(os.path.join(dirname, name))
+
+def _current_dirname(dirname):
+    """Returns the directory containing the columns of the current version of
+    the store in the specified directory.
+
+    """
+    linkname = os.path.join(dirname, CURRENT_LINKNAME)
+    if os.path.islink(linkname):
+        return os.path.join(dirname, os.readlink(linkname))
+    # a store written before the store was versioned
+    return dirname
+
+def load_results(dirname):
+    """Returns the Results in the store in the specified directory.
+
+    The numeric columns are memory mapped read-only rather than read, so
+    loading the store takes the same short time however many rows it has.
+
+    The current version is loaded; if it is replaced and removed by
+    write_results while it is being loaded, the new version is loaded
+    instead. A column which has been memory mapped remains readable after its
+    version is removed.
+
+    """
+    while True:
+        version_dirname = _current_dirname(dirname)
+
+        def column(filename):
+            return numpy.load(os.path.join(version_dirname, filename),
+                              mmap_mode='r')
+
+        try:
+            return Results(column(CHAINS_FILENAME), column(FAMILIES_FILENAME),
+                           column(SCORES_FILENAME), column(LABELS_FILENAME),
+                           column(CHAIN_NAMES_FILENAME),
+                           column(FAMILY_NAMES_FILENAME))
+        except IOError:
+            if _current_dirname(dirname) == version_dirname:
+                raise
@@ -24,8 +24,14 @@ from util import require_python_version
 from logger import logger
 require_python_version(2, 7)
 
+from collections import namedtuple
+
+import numpy
 from Bio.SCOP.Cla import parse as cla_parse
 
+from cache import cached_index
+from refclient import served
+
 # SCOP classification file format is at
 # http://scop.mrc-lmb.cam.ac.uk/scop/release-notes.html#scop-parseable-files
 #
@@ -39,6 +45,16 @@ from Bio.SCOP.Cla import parse as cla_parse
 #                species (sp), and domain entry (px)
 SCOP_CLASSIFICATION_FILE = '/r/bcb/protein_structure/SCOP/scop_cla'
 
+# the kind of index saved for SCOP classification files; change this whenever
+# the structure of the index built by _records_from_file changes
+INDEX_KIND = 'scop1'
+
+# the kind of index saved for the ScopArrays layout of a classification file
+ARRAYS_INDEX_KIND = 'scoparrays2'
+
+# the kind of index saved for the map from chains to their lineages
+LINEAGE_INDEX_KIND = 'scoplineage1'
+
 class Keys:
     """The keys for SUNIDs in the SCOP Classification hierarchy."""
     CLASS = 'cl'
@@ -52,19 +68,429 @@ class Keys:
     order = [CLASS, FOLD, SUPERFAMILY, FAMILY, DOMAIN, SPECIES, ENTRY]
 
 
-def all_pdbids_from_file(filename):
-    """Returns a set of all PDB ID:chains in the specified SCOP class file.
+def _level(target_key):
+    """Returns the position of the specified key in Keys.order, raising a
+    ValueError if it is not a known hierarchy key.
 
     """
+    try:
+        return Keys.order.index(target_key)
+    except ValueError:
+        raise ValueError('Key "' + str(target_key) + '" is not a ' + \
+                         'known hierarchy key')
+
+def _records_from_file(filename):
+    """Parses every record in the specified SCOP classification file and
+    returns a list of (PDB ID, chain, lineage) tuples, one for each record.
+
+    The chain is the chain of the first fragment of the record, or None if the
+    record has no fragments. The lineage is a tuple containing the sunid of
+    each level of the hierarchy of the record, in the order given by
+    Keys.order (None for a level which is missing).
+
+    """
+    records = []
     with open(filename, 'r') as f:
-        res = set()
         for record in cla_parse(f):
-          if record.residues.fragments and record.residues.fragments[0]:
-            res.add(record.residues.pdbid + ':' + record.residues.fragments[0][0])
-        return res
-      
-        # return set((record.residues.pdbid + ':' + record.residues.fragments[0][0] ) for record in cla_parse(f) if record.residues.fragments[0])
+            # older versions of BioPython store the hierarchy as a list of
+            # key/value pairs, newer versions store it as a dictionary
+            hierarchy = dict(record.hierarchy)
+            fragments = record.residues.fragments
+            if fragments:
+                chain = str(fragments[0][0])
+            else:
+                chain = None
+            records.append((str(record.residues.pdbid), chain,
+                            tuple(hierarchy.get(key) for key in Keys.order)))
+    return records
+
+def records_from_file(filename):
+    """Returns a list of (PDB ID, chain, lineage) tuples for the records in the
+    specified SCOP classification file, as described in _records_from_file.
+
+    The list is read from an index saved in INDEX_DIR the first time this
+    SCOP release was parsed, so the classification file itself is only parsed
+    once. The returned list must not be modified.
+
+    """
+    return cached_index(filename, INDEX_KIND, _records_from_file)
+
+def all_pdbids_from_file(filename):
+    """Returns a set of all PDB ID:chains in the specified SCOP class file.
+
+    """
+    return set(pdbid + ':' + chain
+               for pdbid, chain, lineage in records_from_file(filename)
+               if chain is not None)
+
+class ScopNode(object):
+    """An element of the SCOP hierarchy, such as a single fold or family.
+
+    Each node knows its hierarchy key (one of the members of Keys), its sunid,
+    its parent node and its child nodes. The chains of the records classified
+    directly at this node (normally only nodes at the Keys.ENTRY level) are
+    kept as a list of (PDB ID, chain) tuples.
+
+    """
+
+    __slots__ = ('key', 'sunid', 'parent', 'children', 'chains')
+
+    def __init__(self, key, sunid, parent=None):
+        """Instantiates this node with the specified key, sunid and parent."""
+        self.key = key
+        self.sunid = sunid
+        self.parent = parent
+        self.children = []
+        self.chains = []
+
+    def __str__(self):
+        """Returns the string representation of this node."""
+        return 'ScopNode[{}={}]'.format(self.key, self.sunid)
+
+
+class ScopTree(object):
+    """The entire SCOP hierarchy, from classes (cl) down to domain entries
+    (px), built in a single pass over the records of a classification file.
+
+    Queries take time proportional to the size of their answer rather than to
+    the size of the classification file, so a single tree can be used to
+    evaluate every superfamily in a fold, or every fold in a class.
+
+    """
+
+    def __init__(self, records):
+        """Builds the tree from the specified (PDB ID, chain, lineage) tuples,
+        as returned by records_from_file.
+
+        """
+        self.records = records
+        self.root = ScopNode(None, None)
+        self.nodes = {}
+        for pdbid, chain, lineage in records:
+            parent = self.root
+            for key, sunid in zip(Keys.order, lineage):
+                if sunid is None:
+                    continue
+                node = self.nodes.get(sunid)
+                if node is None:
+                    node = ScopNode(key, sunid, parent)
+                    self.nodes[sunid] = node
+                    parent.children.append(node)
+                parent = node
+            parent.chains.append((pdbid, chain))
+
+    def find(self, target_key, target_value):
+        """Returns the node with the specified key and sunid, or None if there
+        is no such node in this tree.
+
+        """
+        _level(target_key)
+        node = self.nodes.get(target_value)
+        if node is None or node.key != target_key:
+            return None
+        return node
+
+    def _chains_of_subtree(self, node):
+        """Generates the (PDB ID, chain) tuples of every record in the subtree
+        rooted at the specified node.
+
+        """
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for pdbid_tuple in node.chains:
+                yield pdbid_tuple
+            stack.extend(node.children)
+
+    def children_chains(self, target_key, target_value):
+        """Returns a map from the sunid of each child of the specified node to
+        a set of (PDB ID, chain) tuples of all records beneath that child.
+
+        If there is no such node, the returned map is empty.
+
+        """
+        node = self.find(target_key, target_value)
+        if node is None:
+            return {}
+        return dict((child.sunid, set(self._chains_of_subtree(child)))
+                    for child in node.children)
+
+    def chains_under(self, target_key, target_value):
+        """Generates the (PDB ID, chain) tuples of all records beneath the
+        specified node, if it exists.
+
+        """
+        node = self.find(target_key, target_value)
+        if node is not None:
+            for pdbid_tuple in self._chains_of_subtree(node):
+                yield pdbid_tuple
+
+    def chains_not_under(self, target_key, target_value):
+        """Generates the (PDB ID, chain) tuples of all records which are not
+        beneath the specified node.
+
+        Rather than scanning every record, this generates the records beneath
+        each sibling of the node and of each of its ancestors. If there is no
+        such node, all records are generated.
+
+        """
+        node = self.find(target_key, target_value)
+        if node is None:
+            for pdbid_tuple in self._chains_of_subtree(self.root):
+                yield pdbid_tuple
+            return
+        while node.parent is not None:
+            parent = node.parent
+            for pdbid_tuple in parent.chains:
+                yield pdbid_tuple
+            for sibling in parent.children:
+                if sibling is not node:
+                    for pdbid_tuple in self._chains_of_subtree(sibling):
+                        yield pdbid_tuple
+            node = parent
+
+# trees which have already been built by this process, keyed by filename
+_trees = {}
+
+def tree_from_file(filename):
+    """Returns the ScopTree of the records in the specified SCOP
+    classification file.
+
+    The tree is built from the saved index of the file (see records_from_file)
+    and is remembered for the lifetime of this process.
+
+    """
+    records = records_from_file(filename)
+    tree = _trees.get(filename)
+    if tree is None or tree.records is not records:
+        tree = ScopTree(records)
+        _trees[filename] = tree
+    return tree
+
+class ScopArrays(object):
+    """A preorder layout of the SCOP hierarchy in NumPy arrays.
+
+    The records of the classification file are stored in the order of a
+    preorder traversal of the ScopTree, so the records beneath any node occupy
+    the contiguous range [start, end) of the `chains' array. Each record is
+    stored as an integer code into the sorted list `chain_names' of PDB
+    ID:chain strings (or -1 if the record has no chain), which is also stored
+    as the NumPy array `chain_array'.
+
+    Queries such as "all members of a superfamily" or "everything outside a
+    superfamily" then become slices and masks of a single integer array rather
+    than sets of strings.
 
+    """
+
+    def __init__(self, tree):
+        """Lays out the specified ScopTree in arrays."""
+        self.chain_names = sorted(set(pdbid + ':' + chain
+                                      for pdbid, chain, lineage in tree.records
+                                      if chain is not None))
+        self.chain_array = numpy.array(self.chain_names, dtype=str)
+        codes = dict((name, code) for code, name in
+                     enumerate(self.chain_names))
+
+        chains = []
+        sunids = []
+        levels = []
+        starts = []
+        ends = []
+
+        def lay_out(node, level):
+            index = len(sunids)
+            sunids.append(node.sunid)
+            levels.append(level)
+            starts.append(len(chains))
+            ends.append(None)
+            for pdbid, chain in node.chains:
+                if chain is None:
+                    chains.append(-1)
+                else:
+                    chains.append(codes[pdbid + ':' + chain])
+            for child in node.children:
+                lay_out(child, Keys.order.index(child.key))
+            ends[index] = len(chains)
+
+        for node in tree.root.children:
+            lay_out(node, Keys.order.index(node.key))
+
+        self.chains = numpy.array(chains, dtype=numpy.int32)
+        self.sunids = numpy.array(sunids, dtype=numpy.int32)
+        self.levels = numpy.array(levels, dtype=numpy.int8)
+        self.starts = numpy.array(starts, dtype=numpy.int32)
+        self.ends = numpy.array(ends, dtype=numpy.int32)
+        self.positions = dict((sunid, index)
+                              for index, sunid in enumerate(sunids))
+
+    def range(self, target_key, target_value):
+        """Returns the range [start, end) of the records beneath the specified
+        node, or (0, 0) if there is no such node.
+
+        """
+        level = _level(target_key)
+        index = self.positions.get(target_value)
+        if index is None or self.levels[index] != level:
+            return 0, 0
+        return int(self.starts[index]), int(self.ends[index])
+
+    def children(self, target_key, target_value):
+        """Returns a list of the (sunid, start, end) of each child of the
+        specified node, in the order in which they are laid out.
+
+        """
+        start, end = self.range(target_key, target_value)
+        if start == end:
+            return []
+        index = self.positions[target_value]
+        level = self.levels[index]
+        result = []
+        child = index + 1
+        while child < len(self.sunids) and self.starts[child] < end:
+            if self.levels[child] <= level:
+                break
+            result.append((int(self.sunids[child]), int(self.starts[child]),
+                           int(self.ends[child])))
+            # skip over the descendants of this child
+            next_child = child + 1
+            while next_child < len(self.sunids) and \
+                      self.levels[next_child] > self.levels[child]:
+                next_child += 1
+            child = next_child
+        return result
+
+    def members(self, target_key, target_value):
+        """Returns the array of chain codes of the records beneath the
+        specified node.
+
+        The returned array is a view of `chains' and must not be modified.
+
+        """
+        start, end = self.range(target_key, target_value)
+        return self.chains[start:end]
+
+    def outside_mask(self, target_key, target_value):
+        """Returns a boolean array which is True for each record which is not
+        beneath the specified node.
+
+        """
+        start, end = self.range(target_key, target_value)
+        mask = numpy.ones(len(self.chains), dtype=bool)
+        mask[start:end] = False
+        return mask
+
+    def outside(self, target_key, target_value):
+        """Returns the array of chain codes of the records which are not
+        beneath the specified node.
+
+        Note that a chain with several domains may have one record beneath the
+        node and another record outside of it; use complement to exclude such
+        chains.
+
+        """
+        start, end = self.range(target_key, target_value)
+        return numpy.concatenate((self.chains[:start], self.chains[end:]))
+
+    def complement(self, target_key, target_value):
+        """Returns the sorted array of distinct chain codes of chains which have
+        no record beneath the specified node.
+
+        """
+        return numpy.setdiff1d(self.outside(target_key, target_value),
+                               self.members(target_key, target_value))
+
+    def leave_one_out(self, target_key, target_value):
+        """Returns a map from the sunid of each child of the specified node to
+        the array of chain codes of the records beneath the node but not
+        beneath that child.
+
+        """
+        start, end = self.range(target_key, target_value)
+        return dict((sunid, numpy.concatenate((self.chains[start:child_start],
+                                               self.chains[child_end:end])))
+                    for sunid, child_start, child_end
+                    in self.children(target_key, target_value))
+
+    def names(self, codes):
+        """Returns a set of the PDB ID:chain strings of the specified array of
+        chain codes, ignoring records without a chain.
+
+        """
+        return set(self.chain_names[code] for code in numpy.unique(codes)
+                   if code >= 0)
+
+def _arrays_from_file(filename):
+    """Builds the ScopArrays of the specified SCOP classification file."""
+    return ScopArrays(tree_from_file(filename))
+
+def arrays_from_file(filename):
+    """Returns the ScopArrays of the records in the specified SCOP
+    classification file.
+
+    The arrays are saved in INDEX_DIR alongside the index of the records, so
+    they are only laid out once per SCOP release.
+
+    """
+    return cached_index(filename, ARRAYS_INDEX_KIND, _arrays_from_file)
+
+class Lineage(namedtuple('Lineage', Keys.order)):
+    """The sunids of each level of the SCOP hierarchy containing a single
+    record, with one attribute for each of the members of Keys (for example,
+    lineage.sf is the sunid of the superfamily).
+
+    """
+
+    __slots__ = ()
+
+    def get(self, key):
+        """Returns the sunid at the hierarchy level with the specified key."""
+        return self[_level(key)]
+
+def _lineage_index_from_file(filename):
+    """Builds a map from each PDB ID:chain in the specified SCOP classification
+    file to a tuple containing the lineage tuple of each record of that chain.
+
+    A chain has more than one lineage when its domains are classified in
+    different parts of the hierarchy.
+
+    """
+    index = {}
+    for pdbid, chain, lineage in records_from_file(filename):
+        if chain is None:
+            continue
+        name = pdbid + ':' + chain
+        if name in index:
+            index[name] += (lineage, )
+        else:
+            index[name] = (lineage, )
+    return index
+
+def lineage_index_from_file(filename):
+    """Returns a map from each PDB ID:chain in the specified SCOP
+    classification file to a tuple of the lineage tuples of its records (see
+    _records_from_file).
+
+    The map is saved in INDEX_DIR, so it is only built once per SCOP release.
+    The returned map must not be modified.
+
+    """
+    return cached_index(filename, LINEAGE_INDEX_KIND, _lineage_index_from_file)
+
+@served
+def lineages_from_file(filename, pdbids):
+    """Returns a map from each of the specified PDB ID:chain strings to a list
+    of the Lineage of each of its records in the specified SCOP classification
+    file.
+
+    Chains which are not classified in SCOP map to an empty list.
+
+    """
+    index = lineage_index_from_file(filename)
+    return dict((pdbid, [Lineage(*lineage) for lineage in index.get(pdbid, ())])
+                for pdbid in pdbids)
+
+@served
 def all_pdbids_from_file_in(filename, target_key, target_value):
     """Returns a set of all PDB ID:chainss in the specified SCOP classification file
     in the hierarchy at the specified level (target_key) and with the specified
@@ -73,22 +499,12 @@ def all_pdbids_from_file_in(filename, target_key, target_value):
     target_key should be one of the members of the Keys class.
 
     """
-    pdbids = set(())
-    with open(filename, 'r') as f:
-        # iterate over each record in the SCOP Classification file
-        for record in cla_parse(f):
-
-            # iterate over each key/value pair in that record's hierarchy
-            for key, value in record.hierarchy:
-
-                # if this record is of the correct level of the hierarchy
-                if key == target_key and value == target_value and record.residues.fragments and record.residues.fragments[0]:
-                    pdbids.add(record.residues.pdbid + ':' + record.residues.fragments[0][0])
-    return pdbids
+    tree = tree_from_file(filename)
+    return set(pdbid + ':' + chain
+               for pdbid, chain in tree.chains_under(target_key, target_value)
+               if chain is not None)
 
-# TODO I have submitted to BioPython a patch which changes each Record's
-# hierarchy member from a list to a dictionary so that we don't have to iterate
-# over the entire list just to find the hierarchy member we want
+@served
 def hierarchy_sets_from_file(filename, target_key, target_value):
     """Reads PDB ids from the specified SCOP classification file and returns a
     map from elements of the hierarchy level beneath the specified target key
@@ -105,51 +521,9 @@ def hierarchy_sets_from_file(filename, target_key, target_value):
     # instead of the 'to' in the map being PDB IDs, it should be to (maybe) pdbCHAIN:start-end
     # FOR NOW this returns a tuple of pdbid,chain (chain may be None)
     
-    
-    result = {}
-    logger.debug("opening " + filename + " in hierarchy_sets_from_file. target: " + target_key + ':' + str(target_value))
-    with open(filename, 'r') as hierarchy_file:
-
-        try:
-            if Keys.order.index(target_key) == len(Keys.order):
-                raise Error('Cannot get sets for lowest level of hierarchy')
-        except ValueError:
-            raise ValueError('Key "' + str(target_key) + '" is not a ' + \
-                             'known hierarchy key')
-
-        # iterate over each record in the SCOP Classification file
-        for record in cla_parse(hierarchy_file):
-
-            # iterate over each key/value pair in that record's hierarchy
-            for key, value in record.hierarchy:
-
-                # if this record is of the correct level of the hierarchy
-                if key == target_key and value == target_value:
-
-                    # get the key for the next level down in the hierarchy
-                    next_target_key = Keys.order[Keys.order.index(key) + 1]
-
-                    # iterate over the record's hierarchy AGAIN
-                    for key2, value2 in record.hierarchy:
-
-                        # if we are looking at the next target key
-                        if key2 == next_target_key:
-
-                            # add this record's pdbid
-                            # and chain to the result dictionary
-                            # we get the fragments (residues.fragments)
-                            # and add pdbid + fragments[0]
-                            if record.residues.fragments:
-                              # we have a fragment, use first chain
-                              newfrag = str(record.residues.fragments[0][0])
-                            else:
-                              newfrag = None
-                            newval = (str(record.residues.pdbid), newfrag)
-                            if value2 in result:
-                                result[value2].add(newval)
-                                  
-                            else:
-                                result[value2] = set(())
-                                result[value2].add(newval)
-
-    return result
+    logger.debug("reading " + filename + " in hierarchy_sets_from_file. target: " + target_key + ':' + str(target_value))
+
+    if _level(target_key) == len(Keys.order) - 1:
+        raise ValueError('Cannot get sets for lowest level of hierarchy')
+
+    return tree_from_file(filename).children_chains(target_key, target_value)
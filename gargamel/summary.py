@@ -0,0 +1,382 @@
+# summary.py - functions for summarizing the results of queries
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Provides the last stage of the leave-one-out analysis, which summarizes
+the score of each query output file written by the positive and negative
+controls (see gargamel.controls) in a CSV file, for use by generate-csv.py and
+gargamel.pipeline.
+
+Parsing every output of a large sweep takes a long time, so the parsed result
+of each output file is remembered in an index beside the summary, along with
+the size and modification time of the files from which it was read, and only
+new or changed outputs are parsed again, in a pool of processes.
+
+"""
+
+from util import require_python_version
+require_python_version(2, 7)
+
+import multiprocessing
+import os
+import os.path
+import tempfile
+
+from cache import dump_atomically
+from cache import load
+from constants import MRFY
+from constants import NEGATIVE_DIRNAME
+from constants import POSITIVE_DIRNAME
+from constants import PROFILE_SMURF
+from constants import QUERY_OUTPUT_SUFFIX
+from constants import SHARED_CHAINS_SUFFIX
+from constants import SMURF
+from constants import SMURF_LITE
+from hmmer import result_from_file
+from hmmer import result_from_table
+from hmmer import table_finished
+from jobs import DEFAULT_NUM_JOBS
+from logger import logger
+from queries import shared_chains
+from queries import table_filename
+from results import results_dirname
+from results import write_results
+
+# the suffix of the index file kept beside a summary file
+SUMMARY_INDEX_SUFFIX = '.index'
+
+# the version of the structure of the index, which should be changed whenever
+# that structure or the parsed results change
+SUMMARY_INDEX_VERSION = 2
+
+# the number of output files sent to a worker process at a time
+CHUNK_SIZE = 64
+
+# exit status code representing no output directory found
+STATUS_NO_DIR = 1 << 0
+
+# the name of the file containing the CSV file
+CSV_FILENAME = 'summary.csv'
+
+# the suffix for file-specific README files
+README_SUFFIX = '.README'
+
+CSV_README = \
+"""This file contains a summary of the alignments generated by smurf which are
+the positive and negative controls for leave-one-out cross-validation. The
+fields in each record of the CSV file are
+
+<pdbid>:<chainid>:<family-sunid>:<rawscore>:<positive_or_negative>
+
+where
+
+<pdbid>, a string of length exactly four, is the PDB ID of a protein,
+<chainid>, a single character, is the identifying character of the protein
+  chain,
+<family-sunid>, an unsigned integer, is the SCOP SUNID of the family which
+  contains this chain,
+<rawscore>, a floating point real number, is the raw score as generated by the
+  smurf alignment of this protein, and
+<positive_or_negative>, exactly one of the strings "positive" or "negative", is
+  a string representing whether this was a positive control or a negative
+  control in the alignment test."""
+
+#<superfamily-sunid>, an unsigned integer, is the SCOP SUNID of the superfamily
+#  which contains this chain,
+
+def parse_mrfy_output(filename):
+    logger.debug('parsing from file: ' + filename)
+    with open(filename, 'r') as f:
+        pdb_str = f.readline()[1:7]
+        # logger.debug('read: ' + pdb_str)
+        if len(pdb_str) < 6:
+          return None, None, None
+        pdbid, chainid = pdb_str.split('_')
+        read_value = f.readline()
+        if read_value[0:8] == 'Sequence':
+          return pdbid, chainid, None
+        strVal = read_value[11:]
+        if strVal[0:7] == 'Infinity':
+          return pdbid, chainid, 1000000
+        rawscore = float(strVal)
+        # logger.debug('read: ' + str(rawscore))
+    return pdbid, chainid, rawscore
+
+
+def parse_smurf_output(filename):
+    logger.debug('parsing from file: ' + filename)
+    with open(filename, 'r') as f:
+        pdb_str = f.readline()[1:7]
+        # logger.debug('read: ' + pdb_str)
+        if len(pdb_str) < 6:
+          return None, None, None
+        pdbid, chainid = pdb_str.split('_')
+        read_value = f.readline()
+        if read_value[0:8] == 'Sequence':
+          return pdbid, chainid, None
+        rawscore = float(read_value[11:])
+        # logger.debug('read: ' + str(rawscore))
+    return pdbid, chainid, rawscore
+
+def parse_hmmer_output(filename):
+    logger.debug('parsing from file: ' + filename)
+    # prefer the tabular output, which is much faster to parse, once its
+    # search has finished; outputs from before it was requested have only the
+    # main output
+    if os.path.isfile(table_filename(filename)) \
+            and table_finished(table_filename(filename)):
+      result = result_from_table(table_filename(filename))
+    else:
+      result = result_from_file(filename)
+    if result == None:
+      return 'Unknown', 'Unknown', None
+    pdbid, chainid = result.pdbid, result.chain
+    # logger.debug('result: ' + str(result))
+    rawscore = float(result.full_seq_score.score)
+    return  pdbid, chainid, rawscore
+
+def parse_output(aligner, filename):
+    """Returns a tuple containing the PDB ID, chain ID, and raw score read from
+    the specified output file of the specified aligner.
+
+    """
+    if aligner == SMURF or aligner == PROFILE_SMURF or aligner == SMURF_LITE:
+        return parse_smurf_output(filename)
+    elif aligner == MRFY:
+        return parse_mrfy_output(filename)
+    return parse_hmmer_output(filename)
+
+def _stat(filename):
+    """Returns a tuple containing the size and modification time of the
+    specified file, or None if it does not exist.
+
+    """
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+def output_signature(filename):
+    """Returns the sizes and modification times of the specified output file
+    and of the files beside it which affect its summary, that is, its tabular
+    output and its list of chains which share its result.
+
+    """
+    return (_stat(filename), _stat(table_filename(filename)),
+            _stat(filename + SHARED_CHAINS_SUFFIX))
+
+def _parse(task):
+    """Parses the output file of the specified (aligner, filename) task, and
+    returns a tuple containing the filename, the parsed (pdbid, chainid,
+    rawscore) tuple, and the list of chains which share its result.
+
+    """
+    aligner, filename = task
+    return filename, parse_output(aligner, filename), shared_chains(filename)
+
+def parsed_outputs(aligner, filenames, index_filename,
+                   num_jobs=DEFAULT_NUM_JOBS):
+    """Returns a map from each of the specified output files of the specified
+    aligner to a tuple containing its parsed (pdbid, chainid, rawscore) tuple
+    and the list of the chains which share its result.
+
+    The results are remembered in the specified index file, so that only the
+    output files which are new or have changed since the index was last
+    written are parsed again, by a pool of at most `num_jobs' processes. The
+    index is written atomically, and forgets output files which no longer
+    exist.
+
+    """
+    index_dir = os.path.dirname(index_filename) or '.'
+    index = load(index_filename)
+    if index is None or index.get('version') != SUMMARY_INDEX_VERSION \
+            or index.get('aligner') != aligner:
+        index = {'version': SUMMARY_INDEX_VERSION, 'aligner': aligner,
+                 'entries': {}}
+    old_entries = index['entries']
+
+    # the entries are keyed by the path relative to the index, so the index
+    # stays valid however the output directory is named on the command line
+    entries = {}
+    signatures = {}
+    stale = []
+    for filename in filenames:
+        key = os.path.relpath(filename, index_dir)
+        signatures[filename] = output_signature(filename)
+        entry = old_entries.get(key)
+        if entry is not None and entry[0] == signatures[filename]:
+            entries[key] = entry
+        else:
+            stale.append(filename)
+    logger.debug('Parsing ' + str(len(stale)) + ' new or changed outputs of '
+                 + str(len(filenames)) + '...')
+
+    tasks = [(aligner, filename) for filename in stale]
+    if num_jobs > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(min(num_jobs, len(tasks)))
+        try:
+            results = pool.imap_unordered(_parse, tasks, CHUNK_SIZE)
+            for filename, parsed, shared_pdbids in results:
+                entries[os.path.relpath(filename, index_dir)] = \
+                    (signatures[filename], parsed, shared_pdbids)
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        for filename, parsed, shared_pdbids in map(_parse, tasks):
+            entries[os.path.relpath(filename, index_dir)] = \
+                (signatures[filename], parsed, shared_pdbids)
+
+    index['entries'] = entries
+    if stale or len(entries) != len(old_entries):
+        dump_atomically(index, index_filename)
+    return dict((filename, entries[os.path.relpath(filename, index_dir)][1:])
+                for filename in filenames)
+
+def write_csv_readme(filename):
+    """Writes README information for the CSV file created by generate_csv."""
+    with open(filename, 'w') as f:
+        f.write(CSV_README + '\n')
+
+def generate_csv(parsed_args):
+    """Writes a CSV file, and a results store beside it (see
+    gargamel.results), summarizing the positive and negative controls of the
+    aligner given in the specified options (as parsed by
+    gargamel.argumentparsers.AlignmentArgumentParser).
+
+    Returns the exit status of generate-csv.py.
+
+    """
+    # the directory containing the results from the smurf/hmmer alignment
+    # tests
+    output_dir = parsed_args.outputdir
+    aligner = parsed_args.aligner
+    num_jobs = parsed_args.jobs
+
+    # a summary of the runtime configuration of this program
+    config = {'output_dir' : output_dir, 'num_jobs' : num_jobs}
+    logger.debug('Program configuration: ' + str(config))
+
+    # check if the output dir exists
+    if not os.path.isdir(output_dir):
+        logger.critical('Directory ' + output_dir + ' does not exist.')
+        return STATUS_NO_DIR
+
+    # find all subdirectories of the output directory
+    logger.debug('Determining which family directories exist...')
+    logger.debug('  output_dir contains: ' + str(os.listdir(output_dir)))
+    subdirectories = filter(lambda x: os.path.isdir(os.path.join(output_dir,
+                                                                 x)),
+                            os.listdir(output_dir))
+    logger.debug('  subdirectories: ' + str(subdirectories))
+    # get all subdirectories which are only digits (not, for example, the
+    # results stores written beside the CSV files)
+    families = filter(lambda x: x.isdigit(), subdirectories)
+    logger.debug('  families: '  + str(families))
+
+    # the CSV file is replaced only once every row has been written
+    csv_filename = os.path.join(output_dir, aligner + '_' + CSV_FILENAME)
+
+    # write some README information for the CSV file
+    write_csv_readme(csv_filename + README_SUFFIX)
+
+    # the output files of the positive and negative controls of each family,
+    # as (family, control, filenames) tuples
+    controls = []
+
+    # iterator over each family
+    for family in families:
+
+        # generate the names of the directories where (we assume) the results
+        # live
+        family_output_dir = os.path.join(output_dir, family)
+        positive_dir = os.path.join(family_output_dir, aligner,
+                                    POSITIVE_DIRNAME)
+        negative_dir = os.path.join(family_output_dir, aligner,
+                                    NEGATIVE_DIRNAME)
+
+        # require both of the directories exist
+        if not os.path.isdir(positive_dir):
+            logger.critical('Expected directory at ' + positive_dir)
+            logger.critical('Not generating output for this family')
+            break
+
+        skip_negative = False
+        if not os.path.isdir(negative_dir):
+            logger.debug('Skipping negative directory at ' + negative_dir)
+            skip_negative = True
+
+        # get all the resulting smurf alignment files, excluding the README
+        # files and the lists of chains which share a result
+        positive_files = [os.path.join(positive_dir, f) for f in
+                          os.listdir(positive_dir) if
+                          f.endswith(QUERY_OUTPUT_SUFFIX)]
+        controls.append((family, 'positive', positive_files))
+
+        if not skip_negative:
+            negative_files = [os.path.join(negative_dir, f) for f in
+                              os.listdir(negative_dir) if
+                              f.endswith(QUERY_OUTPUT_SUFFIX)]
+            controls.append((family, 'negative', negative_files))
+
+    # parse only the output files which are new or have changed since the last
+    # run, at most num_jobs at a time
+    parsed = parsed_outputs(aligner,
+                            [f for family, control, files in controls
+                             for f in files],
+                            csv_filename + SUMMARY_INDEX_SUFFIX, num_jobs)
+
+    # gather the rows of the summary, once for the queried chain and once for
+    # each chain with an identical sequence
+    rows = []
+    for family, control, files in controls:
+        for f in files:
+            (pdbid, chainid, rawscore), shared_pdbids = parsed[f]
+            # only a positive control of HMMER with no score is recorded with
+            # the lowest score; the others are recorded as None
+            if rawscore == None and control == 'positive' and \
+                    aligner not in (SMURF, PROFILE_SMURF, SMURF_LITE, MRFY):
+                rawscore = -1000.0
+            if pdbid != None:
+                rows.append((pdbid, chainid, family, rawscore, control))
+                for shared_pdbid in shared_pdbids:
+                    shared_pdbid, shared_chainid = shared_pdbid.split(':')
+                    rows.append((shared_pdbid, shared_chainid, family,
+                                 rawscore, control))
+
+    # write the rows to a temporary file, and rename it over the CSV file once
+    # every row has been written
+    logger.debug('Writing CSV file ' + csv_filename)
+    fd, temp_filename = tempfile.mkstemp(dir=output_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as csv_file:
+            csv_file.writelines(','.join((pdbid, chainid, family,
+                                          str(rawscore), control)) + '\n'
+                                for pdbid, chainid, family, rawscore, control
+                                in rows)
+        os.chmod(temp_filename, 0644)
+        os.rename(temp_filename, csv_filename)
+    except:
+        os.remove(temp_filename)
+        raise
+
+    # also write the rows to a columnar store, for fast loading by the
+    # analyses
+    store_dirname = results_dirname(output_dir, aligner)
+    logger.debug('Writing results store ' + store_dirname)
+    write_results(store_dirname, rows)
+    return 0
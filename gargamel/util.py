@@ -41,3 +41,16 @@ def require_python_version(*version):
         logging.critical('Your interpreter version: '
                          + '.'.join(str(n) for n in sys.version_info) + '.')
         sys.exit(1)
+
+def chain_name(pdbid, chain):
+    """Returns the PDB ID:chain name of the specified chain of the specified
+    protein, for example '101m:A' for '101M' and 'a'.
+
+    The PDB ID is lowercased and the chain uppercased, as in the SCOP, NRPDB,
+    PISCES and whitelist files, so the same chain has the same name whichever
+    file it is read from. Chains which differ only in case (as in the largest
+    entries of the PDB, which have both an 'A' and an 'a' chain) therefore
+    have the same name, and only the first of them in each file is used.
+
+    """
+    return pdbid.lower() + ':' + chain.upper()
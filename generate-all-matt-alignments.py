@@ -30,9 +30,13 @@ from gargamel.argumentparsers import MultipleAlignmentArgumentParser
 from gargamel.argumentparsers import DEFAULT_REP_ARG
 from gargamel.constants import MATT_PREFIX
 from gargamel.logger import logger
+from gargamel.mattcache import alignment_key
+from gargamel.mattcache import remove_alignment
+from gargamel.mattcache import restore_alignment
+from gargamel.mattcache import store_alignment
 from gargamel.nrpdb import NRPDB_FILENAME
 from gargamel.nrpdb import RepresentativeFields
-from gargamel.nrpdb import nrpdbs_from_file
+from gargamel.nrpdb import representatives_from_file
 from gargamel.scop import Keys
 from gargamel.scop import SCOP_CLASSIFICATION_FILE
 from gargamel.scop import all_pdbids_from_file_in
@@ -115,6 +119,8 @@ target_level = parsed_args.target_level
 target_sunid = parsed_args.target_sunid # this is the sf or fold number
 pdb_dir = parsed_args.pdbdir.rstrip('/')  # remove trailing slash
 representative_field = parsed_args.repfield
+cache_dir = parsed_args.cache_dir
+use_cache = not parsed_args.no_cache
 
 # determine the amount of logging info to output
 if parsed_args.verbose:
@@ -127,14 +133,10 @@ config = {'output_dir' : output_dir,
           'pdb_dir' : pdb_dir,
           'representative_field' : representative_field,
           'target_level' : target_level,
-          'target_sunid' : target_sunid}
+          'target_sunid' : target_sunid,
+          'cache_dir' : cache_dir if use_cache else None}
 logger.debug('Program configuration: ' + str(config))
 
-# get the set of non-redundant PDB chains from the NRPDB file, and use only
-# these chains for training
-
-nrpdbs = nrpdbs_from_file(NRPDB_FILENAME, representative_field)
-
 # get all the records from the SCOP classification file
 logger.debug('Getting PDB IDs from SCOP Classification file...')
 all_pdbs = all_pdbids_from_file_in(SCOP_CLASSIFICATION_FILE, target_level,
@@ -144,6 +146,11 @@ if len(all_pdbs) == 0:
     logger.critical('Nothing in all_pdbs for target level: ' + str(target_level) + ' and target_sunid: ' + str(target_sunid))
     sys.exit(1)
 
+# get the representatives of these chains in the non-redundant set from the
+# NRPDB file, and use only the representatives for training
+nrpdbs = representatives_from_file(NRPDB_FILENAME, all_pdbs,
+                                   representative_field)
+
 # create the whitelist of PDB chains on which to train explicitly
 #logger.debug('Getting the whitelist of chains to test...')
 #whitelist = whitelist_from_file(WHITELIST_FILENAME)
@@ -162,6 +169,8 @@ write_general_readme(os.path.join(output_dir, 'README'), config)
 logger.debug('Generating filenames...')
 num_chains = 0
 pdb_filenames = set()
+# the PDB ID:chain of each filename (plus chain)
+filename_pdbids = {}
 
 used_pdbids = set()
 
@@ -191,6 +200,7 @@ for pdbid_str in all_pdbs:
         used_pdbids.add(pdbid)
             # generate the filename of this pdb file plus its chain
         filename = to_pdb_filename(pdb_dir, base_pdbid) + ':' + pdb_chain
+        filename_pdbids[filename] = pdbid
         # add that filename to the set of pdb filenames (plus chains)
         pdb_filenames.add(filename)
 
@@ -200,6 +210,7 @@ logger.debug('Writing list of PDB files on which to train...')
 pdblist_filename = os.path.join(output_dir, PDBLIST_FILENAME)
 limit = 30
 count = 0
+aligned_pdbids = []
 with open(pdblist_filename, 'w') as pdblist_file:
     for name in pdb_filenames:
         count += 1
@@ -209,15 +220,30 @@ with open(pdblist_filename, 'w') as pdblist_file:
           continue
         logger.debug('writing')
         pdblist_file.write(name + '\n')
+        aligned_pdbids.append(filename_pdbids[name])
 logger.debug('  written to file ' + pdblist_filename)
 
 # generate multiple alignments in Stockholm format using matt
 # TODO sometimes matt segfaults; capture output from stdout and stderr
-logger.debug('Running matt alignment...')
+matt_prefix = os.path.join(output_dir, MATT_PREFIX)
 matt_cmd = [MATT_EXECUTABLE,
-            '-o', os.path.join(output_dir, MATT_PREFIX),
+            '-o', matt_prefix,
             '-f', ','.join(OUTPUT_FORMATS), '-L', pdblist_filename]
+
+# reuse an earlier alignment of the same chains if there is one
+if use_cache:
+    key = alignment_key(aligned_pdbids, MATT_EXECUTABLE, OUTPUT_FORMATS)
+    if restore_alignment(key, matt_prefix, OUTPUT_FORMATS, cache_dir):
+        logger.info('Reused cached alignment ' + key)
+        sys.exit(0)
+remove_alignment(matt_prefix, OUTPUT_FORMATS)
+
+logger.debug('Running matt alignment...')
 logger.debug('  ' + ' '.join(matt_cmd))
 return_code = subprocess.call(matt_cmd)
 logger.debug('  Return code: ' + str(return_code))
 
+# store the alignment for reuse
+if use_cache and return_code == 0:
+    store_alignment(key, matt_prefix, OUTPUT_FORMATS, cache_dir)
+
@@ -19,10 +19,9 @@
 
 import os
 import os.path
-import subprocess
 import sys
 
-from gargamel.argumentparsers import AlignmentArgumentParser
+from gargamel.argumentparsers import ModelArgumentParser
 from gargamel.constants import HMM_SUFFIX
 from gargamel.constants import HMM_PREFIX
 from gargamel.constants import HMMER
@@ -45,7 +44,13 @@ from gargamel.constants import HMMER_HMMBUILD_OPTIONS
 from gargamel.constants import SMURF_HMMBUILD_OPTIONS
 from gargamel.constants import PROFILE_SMURF_HMMBUILD_OPTIONS
 from gargamel.constants import SMURF_LITE_HMMBUILD_OPTIONS
+from gargamel.jobs import Call
+from gargamel.jobs import Job
+from gargamel.jobs import log_summary
+from gargamel.jobs import run_jobs
 from gargamel.logger import logger
+from gargamel.modelcache import CachedModel
+from gargamel.modelcache import remove_models
 
 # a brief description of the purpose of this program
 PROGRAM_DESCRIPTION = 'Generates HMM files from multiple alignment files ' + \
@@ -53,7 +58,7 @@ PROGRAM_DESCRIPTION = 'Generates HMM files from multiple alignment files ' + \
 
 # create a parser for command-line arguments, with a description of the purpose
 # of this program
-argparser = AlignmentArgumentParser(PROGRAM_DESCRIPTION)
+argparser = ModelArgumentParser(PROGRAM_DESCRIPTION)
 
 # parse the command-line arguments
 parsed_args = argparser.parse_args()
@@ -61,10 +66,13 @@ parsed_args = argparser.parse_args()
 # get the values from the command-line arguments
 output_dir = parsed_args.outputdir.rstrip('/')  # remove trailing slash
 aligner = parsed_args.aligner
-smurf_lite_threshold = parsed_args.smurf_lite_threshold
+smurf_lite_threshold = str(parsed_args.smurf_lite_threshold)
 simev_frequency = parsed_args.simev_frequency
 simev_count = parsed_args.simev_count
 simev_threshold = parsed_args.simev_threshold
+cache_dir = parsed_args.cache_dir
+cache_size = parsed_args.cache_size
+use_cache = not parsed_args.no_cache
 
 # determine the amount of logging info to output
 if parsed_args.verbose:
@@ -102,41 +110,50 @@ if not os.path.isfile(mult_alignment_file):
   logger.debug('Group not aligned; could not find alignment file ' + mult_alignment_file + ' - skipping.')
   sys.exit(1)
 
+build_inputs = [mult_alignment_file]
+build_parameters = [aligner, hmmbuild_options]
+build_executables = [executable]
+build_cmds = []
+
 # call smurf-preparse to set up beta strand goodness
 if aligner != HMMER:
-  logger.debug('Running smurf-preparse...')
-  mult_alignment_file = os.path.join(output_dir,
-                                     MATT_PREFIX + '_' + aligner + '.ssi')
-  if float(simev_frequency) > 0.0:        
-    preparse_cmd = [preparse_executable,
-                    os.path.join(output_dir, MATT_PREFIX + '.pdb'),
-                    os.path.join(output_dir, MATT_PREFIX + '.fasta'),
-                    mult_alignment_file,
-                    smurf_lite_threshold,
-                    simev_frequency,
-                    simev_count,
-                    simev_threshold
-                    ]
-  else:
+    logger.debug('Queueing smurf-preparse...')
+    mult_alignment_file = os.path.join(output_dir,
+                                       MATT_PREFIX + '_' + aligner + '.ssi')
     preparse_cmd = [preparse_executable,
                     os.path.join(output_dir, MATT_PREFIX + '.pdb'),
                     os.path.join(output_dir, MATT_PREFIX + '.fasta'),
                     mult_alignment_file,
-                    smurf_lite_threshold
-                    ]
-  logger.debug('  ' + ' '.join(preparse_cmd))
-  return_code = subprocess.call(preparse_cmd)
-  logger.debug('Return code: ' + str(return_code))
-  
+                    smurf_lite_threshold]
+    if float(simev_frequency) > 0.0:
+        preparse_cmd += [simev_frequency, simev_count, simev_threshold]
+    build_cmds.append(preparse_cmd)
+    build_inputs.extend(preparse_cmd[1:3])
+    build_parameters.extend(preparse_cmd[4:])
+    build_executables.append(preparse_executable)
+
 # generate a hidden Markov model from the multiple alignment generated by
 # matt (specifically, the .ssi file)
+logger.debug('Queueing hmmbuild...')
+hmmbuild_cmd = ([executable] + hmmbuild_options.split()
+                + [os.path.join(output_dir, hmm_filename),
+                   mult_alignment_file])
+build_cmds.append(hmmbuild_cmd)
+build_outputs = [os.path.join(output_dir, hmm_filename)]
+remove_models(build_outputs)
 
-logger.debug('Running hmmbuild...')
-hmmbuild_cmd = filter(lambda x: len(x)>0, [executable,
-                hmmbuild_options,
-                os.path.join(output_dir, hmm_filename),
-                mult_alignment_file])
-logger.debug('  ' + ' '.join(hmmbuild_cmd))
-  
-return_code = subprocess.call(' '.join(hmmbuild_cmd), shell=True)
-logger.debug('Return code: ' + str(return_code))
+# reuse a model built from the same alignment with the same parameters if
+# there is one, and otherwise store this model for reuse once it is built
+reuse = None
+if use_cache:
+    model = CachedModel(build_inputs, build_parameters, build_executables,
+                        build_outputs, cache_dir, cache_size)
+    build_cmds.append(Call(model.store))
+    reuse = model.restore
+
+# the build stops at the first command which fails
+build_job = Job(output_dir, build_cmds, inputs=build_inputs,
+                outputs=build_outputs, reuse=reuse)
+log_summary(run_jobs([build_job], 1))
+if not build_job.succeeded:
+    sys.exit(1)
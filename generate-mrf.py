@@ -19,7 +19,6 @@
 
 import os
 import os.path
-import subprocess
 import sys
 
 
@@ -30,6 +29,7 @@ from gargamel.constants import SIMEV_MRFY_SSANOTATE_EXECUTABLE
 from gargamel.constants import MRF_FILENAME
 from gargamel.constants import MRFY
 from gargamel.constants import MRFBUILD_OPTIONS
+from gargamel.constants import BUILD_LOG_FILENAME
 from gargamel.constants import HMM_SUFFIX
 from gargamel.constants import HMM_PREFIX
 from gargamel.constants import HMMER
@@ -52,7 +52,13 @@ from gargamel.constants import HMMER_HMMBUILD_OPTIONS
 from gargamel.constants import SMURF_HMMBUILD_OPTIONS
 from gargamel.constants import PROFILE_SMURF_HMMBUILD_OPTIONS
 from gargamel.constants import SMURF_LITE_HMMBUILD_OPTIONS
+from gargamel.jobs import Call
+from gargamel.jobs import Job
+from gargamel.jobs import log_summary
+from gargamel.jobs import run_pipelined
 from gargamel.logger import logger
+from gargamel.modelcache import CachedModel
+from gargamel.modelcache import remove_models
 
 # a brief description of the purpose of this program
 PROGRAM_DESCRIPTION = 'Generates HMM files from multiple alignment files ' + \
@@ -72,6 +78,12 @@ aligner = parsed_args.aligner
 simev_frequency = parsed_args.simev_frequency
 simev_count = parsed_args.simev_count
 simev_threshold = parsed_args.simev_threshold
+num_jobs = parsed_args.jobs
+annotate_jobs = parsed_args.annotate_jobs or num_jobs
+build_jobs = parsed_args.build_jobs or num_jobs
+cache_dir = parsed_args.cache_dir
+cache_size = parsed_args.cache_size
+use_cache = not parsed_args.no_cache
 
 # determine the amount of logging info to output
 if parsed_args.verbose:
@@ -80,7 +92,8 @@ if parsed_args.verbose:
     console_handler.setLevel(DEBUG)
 
 # summary of the program configuration
-config = {'output_dir' : output_dir, 'aligner' : aligner}
+config = {'output_dir' : output_dir, 'aligner' : aligner,
+          'annotate_jobs' : annotate_jobs, 'build_jobs' : build_jobs}
 logger.debug('Program configuration: ' + str(config))
 
 # end the program if the output dir doesn't exist
@@ -97,6 +110,10 @@ sunids = filter(lambda x: os.path.isdir(os.path.join(output_dir, x)),
                 os.listdir(output_dir))
 logger.debug('  sunids: ' + str(sunids))
 
+# the annotate and build jobs for each sunid directory, which are run as a
+# pipeline once all have been prepared
+pipelines = []
+
 for sunid in sunids:
 
     level_output_dir = os.path.join(output_dir, sunid)
@@ -144,7 +161,7 @@ for sunid in sunids:
       continue                                   
     
     # call smurf-preparse to set up beta strand goodness
-    logger.debug('Running SSAnnotate...')
+    logger.debug('Queueing SSAnnotate...')
     mult_alignment_file = os.path.join(level_output_dir,
                                        MATT_PREFIX + '.ssi')
     if float(simev_frequency) > 0.0:        
@@ -159,19 +176,45 @@ for sunid in sunids:
       preparse_cmd = [preparse_executable,
                       os.path.join(level_output_dir, MATT_PREFIX),
                       ]
-    logger.debug('  ' + ' '.join(preparse_cmd))
-    return_code = subprocess.call(preparse_cmd)
-    logger.debug('Return code: ' + str(return_code))
       
     # generate a hidden Markov model from the multiple alignment generated by
     # matt (specifically, the .ssi file)
     
-    logger.debug('Running mrfbuild...')
-    mrfbuild_cmd = filter(lambda x: len(x)>0, [executable,
-                    hmmbuild_options,
-                    os.path.join(aligner_output_dir, hmm_filename),
-                    mult_alignment_file])
-    logger.debug('  ' + ' '.join(mrfbuild_cmd))
-      
-    return_code = subprocess.call(' '.join(mrfbuild_cmd), shell=True)
-    logger.debug('Return code: ' + str(return_code))
+    logger.debug('Queueing mrfbuild...')
+    mrfbuild_cmd = ([executable] + hmmbuild_options.split()
+                    + [os.path.join(aligner_output_dir, hmm_filename),
+                       mult_alignment_file])
+    build_cmds = [mrfbuild_cmd]
+    remove_models([os.path.join(aligner_output_dir, hmm_filename)])
+
+    # reuse a model built from the same alignment with the same parameters if
+    # there is one, in which case neither stage is run, and otherwise store
+    # this model for reuse once it is built
+    reuse = None
+    if use_cache:
+        model = CachedModel([os.path.join(level_output_dir,
+                                          MATT_PREFIX + '.' + format)
+                             for format in ('ssi', 'pdb', 'fasta')],
+                            [aligner, hmmbuild_options] + preparse_cmd[2:],
+                            [preparse_executable, executable],
+                            [os.path.join(aligner_output_dir, hmm_filename)],
+                            cache_dir, cache_size)
+        build_cmds.append(Call(model.store))
+        reuse = model.restore
+
+    # the output of both stages is written to a log in the aligner output
+    # directory; larger alignments take longer, so start them first
+    log_filename = os.path.join(aligner_output_dir, BUILD_LOG_FILENAME)
+    pipelines.append([Job(aligner_output_dir + ' (annotate)', [preparse_cmd],
+                          log_filename=log_filename,
+                          cost=os.path.getsize(mult_alignment_file),
+                          reuse=reuse),
+                      Job(aligner_output_dir + ' (build)', build_cmds,
+                          log_filename=log_filename, reuse=reuse)])
+
+# run the annotations and builds concurrently, so that one family can be
+# annotated while another is being built
+logger.debug('Running ' + str(len(pipelines)) + ' annotations and builds, '
+             + str(annotate_jobs) + ' and ' + str(build_jobs)
+             + ' at a time...')
+log_summary(run_pipelined(pipelines, [annotate_jobs, build_jobs]))
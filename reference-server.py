@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+#
+# reference-server.py - serve the SCOP, NRPDB and FASTA reference data to the
+# other scripts
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 2 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+from gargamel.util import require_python_version
+require_python_version(2, 7)
+
+import sys
+
+from gargamel.argumentparsers import ReferenceServerArgumentParser
+from gargamel.logger import logger
+from gargamel.refclient import ReferenceServerError
+from gargamel.refserver import serve
+
+# a brief description of the purpose of this program
+PROGRAM_DESCRIPTION = ('Loads the SCOP, NRPDB and FASTA reference data files '
+                       'once and answers queries about them from the other '
+                       'scripts over a Unix domain socket, until interrupted. '
+                       'Reference data file names given to the other scripts '
+                       'must be absolute paths.')
+
+# create a parser for command-line arguments, with a description of the purpose
+# of this program
+argparser = ReferenceServerArgumentParser(PROGRAM_DESCRIPTION)
+
+# parse the command-line arguments
+parsed_args = argparser.parse_args()
+
+# determine the amount of logging info to output
+if parsed_args.verbose:
+    from logging import DEBUG
+    from gargamel.logger import console_handler
+    console_handler.setLevel(DEBUG)
+
+try:
+    serve(parsed_args.socket, parsed_args.scop, parsed_args.nrpdb,
+          parsed_args.fasta)
+except ReferenceServerError as error:
+    logger.critical(str(error))
+    sys.exit(1)
+except KeyboardInterrupt:
+    logger.info('Stopped serving reference data')
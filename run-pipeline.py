@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+#
+# run-pipeline.py - run the whole leave-one-out analysis in a single process
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 2 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+from gargamel.util import require_python_version
+require_python_version(2, 7)
+
+import sys
+
+from gargamel.argumentparsers import PipelineArgumentParser
+from gargamel.pipeline import analysis_stages
+from gargamel.pipeline import run_pipeline
+from gargamel.reference import ReferenceData
+
+# a brief description of the purpose of this program
+PROGRAM_DESCRIPTION = ('Runs the leave-one-out analysis of smurf-lite (and '
+                       'optionally HMMER) on a SCOP hierarchy level, as '
+                       'analyze-smurf.sh does, with every stage in this '
+                       'process so that the reference data is loaded once')
+
+# create a parser for command-line arguments, with a description of the purpose
+# of this program
+argparser = PipelineArgumentParser(PROGRAM_DESCRIPTION)
+
+# parse the command-line arguments
+parsed_args = argparser.parse_args()
+
+# determine the amount of logging info to output
+if parsed_args.verbose:
+    from logging import DEBUG
+    from gargamel.logger import console_handler
+    console_handler.setLevel(DEBUG)
+
+reference = ReferenceData(parsed_args.scop, parsed_args.nrpdb,
+                          parsed_args.fasta)
+level = parsed_args.target_level + '=' + str(parsed_args.target_sunid)
+stages = analysis_stages(reference, parsed_args.outputdir, level,
+                         parsed_args.smurf_lite_threshold,
+                         parsed_args.simev_frequency, parsed_args.simev_count,
+                         parsed_args.simev_threshold,
+                         run_hmmer=parsed_args.run_hmmer,
+                         skip_matt=parsed_args.skip_matt,
+                         num_jobs=parsed_args.jobs,
+                         verbose=parsed_args.verbose)
+sys.exit(run_pipeline(stages, reference, streaming=parsed_args.stream,
+                      num_jobs=parsed_args.jobs))
@@ -0,0 +1,241 @@
+# test_evaluation.py - tests of the accuracy statistics of the controls
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests that the ROC statistics computed from cumulative counts agree with
+their definitions computed by brute force: the AUC as the Mann-Whitney
+statistic, and the ROCn score as Gribskov's sum over the first n negatives.
+
+"""
+
+import math
+import os.path
+import shutil
+import tempfile
+import unittest
+import warnings
+
+import numpy
+
+from gargamel.constants import HMMER
+from gargamel.constants import MRFY
+from gargamel.evaluation import RocCurve
+from gargamel.evaluation import evaluate
+from gargamel.evaluation import evaluation_report
+from gargamel.evaluation import oriented_scores
+from gargamel.results import results_dirname
+from gargamel.results import write_results
+
+# scores with ties within and between the positive and negative controls
+SCORES = [9.0, 7.0, 7.0, 7.0, 5.0, 3.0, 3.0, 1.0, 1.0, 0.0]
+LABELS = [True, True, False, True, False, True, False, False, True, False]
+
+def _beats(positive, negative):
+    """Returns 1 if the positive score is better, 0.5 if the scores are tied,
+    and 0 otherwise.
+
+    """
+    return 1.0 if positive > negative else 0.5 if positive == negative \
+        else 0.0
+
+def brute_auc(scores, labels):
+    """Returns the Mann-Whitney statistic of the specified controls, that is,
+    the fraction of pairs of a positive and a negative in which the positive
+    scores better, counting ties as half.
+
+    """
+    positives = [s for s, label in zip(scores, labels) if label]
+    negatives = [s for s, label in zip(scores, labels) if not label]
+    return (sum(_beats(p, n) for p in positives for n in negatives)
+            / float(len(positives) * len(negatives)))
+
+def brute_roc_n(scores, labels, n):
+    """Returns Gribskov's ROCn score of the specified controls: the number of
+    positives scoring better than each of the n best negatives (ties counted
+    as half), with every positive counted for each missing negative, divided
+    by n times the number of positives.
+
+    This is the area under the curve only if the nth negative is not tied
+    with the next.
+
+    """
+    positives = [s for s, label in zip(scores, labels) if label]
+    negatives = sorted((s for s, label in zip(scores, labels) if not label),
+                       reverse=True)[:n]
+    total = sum(_beats(p, negative) for negative in negatives
+                for p in positives)
+    total += (n - len(negatives)) * len(positives)
+    return total / float(n * len(positives))
+
+class RocCurveTest(unittest.TestCase):
+    """Tests of the statistics of a single RocCurve."""
+
+    def setUp(self):
+        warnings.simplefilter('error', RuntimeWarning)
+
+    def tearDown(self):
+        warnings.resetwarnings()
+
+    def assertNan(self, value):
+        self.assertTrue(math.isnan(value), value)
+
+    def test_counts(self):
+        curve = RocCurve(SCORES, LABELS)
+        self.assertEqual(list(curve.thresholds), [9, 7, 5, 3, 1, 0])
+        self.assertEqual(list(curve.tps), [0, 1, 3, 3, 4, 5, 5])
+        self.assertEqual(list(curve.fps), [0, 0, 1, 2, 3, 4, 5])
+        self.assertEqual((curve.positives, curve.negatives), (5, 5))
+
+    def test_auc_with_ties(self):
+        curve = RocCurve(SCORES, LABELS)
+        self.assertAlmostEqual(curve.auc(), brute_auc(SCORES, LABELS))
+        # the order of tied controls makes no difference
+        order = numpy.random.RandomState(0).permutation(len(SCORES))
+        shuffled = RocCurve(numpy.array(SCORES)[order],
+                            numpy.array(LABELS)[order])
+        self.assertAlmostEqual(shuffled.auc(), curve.auc())
+        self.assertEqual(list(shuffled.tps), list(curve.tps))
+
+    def test_auc_random(self):
+        random = numpy.random.RandomState(1)
+        for i in range(20):
+            scores = random.randint(0, 8, size=30).astype(float)
+            labels = random.rand(30) < 0.4
+            labels[:2] = [True, False]
+            self.assertAlmostEqual(RocCurve(scores, labels).auc(),
+                                   brute_auc(scores, labels))
+            # n does not fall within a group of tied negatives
+            for n in (sum(~labels), 50):
+                self.assertAlmostEqual(RocCurve(scores, labels).roc_n(n),
+                                       brute_roc_n(scores, labels, n))
+
+    def test_roc_n(self):
+        curve = RocCurve(SCORES, LABELS)
+        for n in (1, 2, 3, 5):
+            self.assertAlmostEqual(curve.roc_n(n),
+                                   brute_roc_n(SCORES, LABELS, n))
+        # with fewer than n negatives, every positive counts for each missing
+        # negative
+        self.assertAlmostEqual(curve.roc_n(50),
+                               brute_roc_n(SCORES, LABELS, 50))
+        self.assertAlmostEqual(curve.roc_n(50), (18.0 + 45 * 5) / (50 * 5))
+
+    def test_roc_n_within_ties(self):
+        # the nth negative falls within a group of tied controls, across which
+        # the curve is linearly interpolated
+        curve = RocCurve([2, 2, 2, 1], [True, False, False, True])
+        self.assertAlmostEqual(curve.roc_n(1), (1 * 0.5 / 2) / (1 * 2))
+        self.assertAlmostEqual(curve.roc_n(2),
+                               brute_roc_n([2, 2, 2, 1],
+                                           [True, False, False, True], 2))
+
+    def test_perfect_and_worst(self):
+        curve = RocCurve([4, 3, 2, 1], [True, True, False, False])
+        self.assertEqual(curve.auc(), 1.0)
+        self.assertEqual(curve.roc_n(2), 1.0)
+        self.assertEqual(curve.sensitivity((0.0, 0.5)), [1.0, 1.0])
+        curve = RocCurve([1, 2, 3, 4], [True, True, False, False])
+        self.assertEqual(curve.auc(), 0.0)
+        self.assertEqual(curve.roc_n(2), 0.0)
+        self.assertEqual(curve.sensitivity((0.0, 0.5)), [0.0, 0.0])
+
+    def test_sensitivity(self):
+        curve = RocCurve(SCORES, LABELS)
+        # no negative scores 9; one of five scores 7, tied with two positives
+        self.assertEqual(curve.sensitivity((0.0, 0.1, 0.2, 0.4, 1.0)),
+                         [0.2, 0.2, 0.6, 0.6, 1.0])
+
+    def test_all_positive(self):
+        curve = RocCurve([1, 2, 3], [1, 1, 1])
+        self.assertNan(curve.auc())
+        for value in curve.sensitivity():
+            self.assertNan(value)
+        # with no negatives, every positive counts for each missing negative
+        self.assertEqual(curve.roc_n(), 1.0)
+
+    def test_all_negative(self):
+        curve = RocCurve([1, 2, 3], [0, 0, 0])
+        self.assertNan(curve.auc())
+        self.assertNan(curve.roc_n())
+        for value in curve.sensitivity():
+            self.assertNan(value)
+
+    def test_empty(self):
+        curve = RocCurve([], [])
+        self.assertNan(curve.auc())
+        self.assertNan(curve.roc_n())
+
+    def test_bootstrap(self):
+        curve = RocCurve(SCORES, LABELS)
+        intervals = curve.bootstrap(200, n=3, fprs=(0.2, 0.4), seed=0)
+        self.assertEqual(intervals, curve.bootstrap(200, n=3,
+                                                    fprs=(0.2, 0.4), seed=0))
+        lower, upper = intervals['auc']
+        self.assertTrue(0 <= lower <= curve.auc() <= upper <= 1)
+        lower, upper = intervals['roc_n']
+        self.assertTrue(0 <= lower <= upper <= 1)
+        self.assertEqual([len(bounds) for bounds in intervals['sensitivity']],
+                         [2, 2])
+
+class OrientedScoresTest(unittest.TestCase):
+    """Tests of the direction of the scores of each aligner."""
+
+    def test_higher_is_better(self):
+        self.assertEqual(list(oriented_scores(HMMER, [1.0, float('nan')])),
+                         [1.0, -numpy.inf])
+
+    def test_mrfy(self):
+        # a lower MRFy score is better, and 1000000 stands for an infinite
+        # score, the worst of all, though not as bad as no score
+        scores = oriented_scores(MRFY, [5.0, 1000000.0, 2.0, float('nan')])
+        self.assertEqual(list(scores), [-5.0, -1000000.0, -2.0, -numpy.inf])
+        curve = RocCurve(oriented_scores(MRFY, [2.0, 1000000.0, 5.0]),
+                         [True, True, False])
+        self.assertEqual(curve.auc(), 0.5)
+        self.assertEqual(list(curve.tps), [0, 1, 1, 2])
+
+class EvaluateTest(unittest.TestCase):
+    """Tests of evaluating the results stores written by generate-csv.py."""
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def test_evaluate(self):
+        rows = [('1abc', 'A', '46459', 9.0, 'positive'),
+                ('1abd', 'A', '46459', 3.0, 'negative'),
+                ('1abe', 'B', '46463', None, 'positive'),
+                ('1abf', 'A', '46463', 1.0, 'negative'),
+                ('1abg', 'A', '46463', 2.0, 'positive')]
+        write_results(results_dirname(self.dirname, HMMER), rows)
+        evaluations = evaluate(self.dirname, [HMMER])
+        pooled, families = evaluations[HMMER]
+        self.assertEqual((pooled.positives, pooled.negatives), (3, 2))
+        self.assertAlmostEqual(pooled.auc(), 3.0 / 6)
+        self.assertEqual(sorted(families), ['46459', '46463'])
+        self.assertEqual(families['46459'].auc(), 1.0)
+        self.assertEqual(families['46463'].auc(), 0.5)
+        lines = evaluation_report(evaluations, n=2, num_resamples=10, seed=0,
+                                  families=True)
+        self.assertTrue(lines[0].startswith(HMMER + ': 3 positive and 2 '
+                                            'negative controls'))
+        self.assertTrue(lines[1].startswith('  AUC:     0.5000 ['))
+        self.assertTrue(lines[-1].startswith('  family 46463: AUC 0.5000'))
+
+if __name__ == '__main__':
+    unittest.main()
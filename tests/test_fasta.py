@@ -0,0 +1,162 @@
+# test_fasta.py - tests of the indexed FASTA readers
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests that the FASTA readers find each record by its saved offset."""
+
+import gzip
+import hashlib
+import os.path
+import shutil
+import tempfile
+import unittest
+
+from Bio import bgzf
+
+import gargamel.cache
+from gargamel.fasta import IndexedSequences
+from gargamel.fasta import MappedSequences
+from gargamel.fasta import chain_key
+from gargamel.fasta import mapped_sequences_from_file
+
+# the test FASTA file, which has chains differing only in case
+FASTA_FILENAME = os.path.join(os.path.dirname(__file__), 'data',
+                              'seqres.fasta')
+
+class FastaTestCase(unittest.TestCase):
+    """Saves the indices of the test file, and any copies of it, in a
+    temporary directory.
+
+    """
+
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        self.saved_index_dir = gargamel.cache.INDEX_DIR
+        gargamel.cache.INDEX_DIR = self.index_dir
+        gargamel.cache._loaded_indices.clear()
+
+    def tearDown(self):
+        gargamel.cache.INDEX_DIR = self.saved_index_dir
+        gargamel.cache._loaded_indices.clear()
+        shutil.rmtree(self.index_dir)
+
+    def copy(self, open_function, basename):
+        """Writes the test FASTA file to the specified file in the index
+        directory with the specified function, returning its name.
+
+        """
+        filename = os.path.join(self.index_dir, basename)
+        with open(FASTA_FILENAME, 'rb') as source:
+            with open_function(filename, 'wb') as destination:
+                destination.write(source.read())
+        return filename
+
+class IndexedSequencesTest(FastaTestCase):
+    """Tests of reading records from a plain, block gzipped, or gzipped FASTA
+    file.
+
+    """
+
+    def check(self, filename):
+        """Checks the records read from the specified copy of the test FASTA
+        file.
+
+        """
+        sequences = IndexedSequences(filename)
+        # only the first record of each PDB ID is used
+        self.assertEqual(sorted(sequences), ['101m', '1big', '2xyz'])
+        self.assertEqual(len(sequences), 3)
+        self.assertTrue('2xyz' in sequences)
+        self.assertFalse('101m:A' in sequences)
+        # records are read in any order, so each is found by its own offset
+        self.assertEqual(sequences['2xyz'],
+                         ('>2xyz_a mol:protein length:24  XYZ\n',
+                          'GGGGSSSSAAAA\nggggssssaaaa\n'))
+        self.assertEqual(sequences['101m'],
+                         ('>101m_A mol:protein length:10  MYOGLOBIN\n',
+                          'MVLSEGEWQL\n'))
+        self.assertEqual(sorted(sequences.records(['1big', '9zzz'])),
+                         ['1big'])
+        sequences.close()
+        # the saved index is used the second time
+        gargamel.cache._loaded_indices.clear()
+        sequences = IndexedSequences(filename)
+        self.assertEqual(sequences['1big'][1], 'ACDEFGHI\n')
+        sequences.close()
+
+    def test_plain(self):
+        self.check(FASTA_FILENAME)
+
+    def test_bgzf(self):
+        self.check(self.copy(bgzf.BgzfWriter, 'seqres.fasta.gz'))
+
+    def test_gzip(self):
+        self.check(self.copy(gzip.open, 'seqres.fasta.gz'))
+
+    def test_chain_key(self):
+        self.assertEqual(chain_key('101m_A'), '101m:A')
+        self.assertEqual(chain_key('101M_a'), '101m:A')
+
+    def test_lowercase_chains(self):
+        sequences = IndexedSequences(FASTA_FILENAME, by_chain=True)
+        self.assertEqual(sorted(sequences),
+                         ['101m:A', '101m:B', '1big:A', '2xyz:A'])
+        # a lowercase chain has the same key as in the NRPDB and SCOP files
+        header, sequence = sequences['2xyz:A']
+        self.assertTrue(header.startswith('>2xyz_a '))
+        self.assertEqual(sequence, 'GGGGSSSSAAAA\nggggssssaaaa\n')
+        # of chains which differ only in case, the first is used
+        self.assertTrue(sequences['1big:A'][0].startswith('>1big_A '))
+        self.assertEqual(sequences['1big:A'][1], 'ACDEFGHI\n')
+        sequences.close()
+
+    def test_identical_groups(self):
+        sequences = IndexedSequences(FASTA_FILENAME, by_chain=True)
+        # the chains of 101m have the same sequence, and the case of the
+        # residues does not matter
+        self.assertEqual(sequences.digest('101m:A'),
+                         sequences.digest('101m:B'))
+        self.assertEqual(sequences.digest('2xyz:A'),
+                         hashlib.md5('GGGGSSSSAAAA' * 2).digest())
+        self.assertEqual(sequences.identical_groups(['2xyz:A', '101m:B',
+                                                     '101m:A', '9zzz:A']),
+                         [('101m:A', ['101m:B']), ('2xyz:A', [])])
+        sequences.close()
+
+class MappedSequencesTest(FastaTestCase):
+    """Tests of serving records from a memory map of a FASTA file."""
+
+    def test_mapped(self):
+        sequences = mapped_sequences_from_file(FASTA_FILENAME)
+        self.assertTrue(isinstance(sequences, MappedSequences))
+        header, sequence = sequences['2xyz']
+        # the records are buffers referring to the mapped file
+        self.assertTrue(isinstance(sequence, buffer))
+        self.assertEqual(str(header), '>2xyz_a mol:protein length:24  XYZ\n')
+        self.assertEqual(str(sequence), 'GGGGSSSSAAAA\nggggssssaaaa\n')
+        self.assertEqual(str(sequences['1big'][1]), 'ACDEFGHI\n')
+        sequences.close()
+
+    def test_compressed(self):
+        filename = self.copy(bgzf.BgzfWriter, 'seqres.fasta.gz')
+        self.assertRaises(ValueError, MappedSequences, filename)
+        sequences = mapped_sequences_from_file(filename)
+        self.assertFalse(isinstance(sequences, MappedSequences))
+        self.assertEqual(sequences['1big'][1], 'ACDEFGHI\n')
+        sequences.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,298 @@
+# test_hmmer.py - tests of the splitting of outputs produced by HMMER
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests that a result read from the output of a single `hmmsearch' of many
+sequences, or of `hmmscan' of many sequences against many models, is the same
+after the output has been split into one file per sequence (or per pair of
+sequence and model).
+
+"""
+
+import os.path
+import shutil
+import tempfile
+import unittest
+
+from gargamel.hmmer import _rename_target
+from gargamel.hmmer import iter_domain_table
+from gargamel.hmmer import iter_results
+from gargamel.hmmer import iter_table
+from gargamel.hmmer import result_from_file
+from gargamel.hmmer import result_from_table
+from gargamel.hmmer import split_scan_output
+from gargamel.hmmer import split_scan_table_output
+from gargamel.hmmer import split_search_output
+from gargamel.hmmer import split_table_output
+from gargamel.hmmer import table_finished
+
+# the directory containing the captured outputs
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# the output of `hmmsearch' of model 46459 against the sequences in SEQUENCES,
+# and its tabular and domain tabular outputs
+SEARCH_OUTPUT = os.path.join(DATA_DIR, 'hmmsearch-batch.out')
+SEARCH_TABLE = SEARCH_OUTPUT + '.tbl'
+SEARCH_DOMAIN_TABLE = SEARCH_OUTPUT + '.domtbl'
+
+# the output of `hmmscan' of the sequences in SEQUENCES against models 46459
+# and 46463, and its tabular and domain tabular outputs
+SCAN_OUTPUT = os.path.join(DATA_DIR, 'hmmscan.out')
+SCAN_TABLE = SCAN_OUTPUT + '.tbl'
+SCAN_DOMAIN_TABLE = SCAN_OUTPUT + '.domtbl'
+
+# the sequences searched, in order; 1dlw_A has no hits
+SEQUENCES = ['1b33_A', '1ubq_A', '1dlw_A']
+MODELS = ['46459', '46463']
+
+def result_fields(result):
+    """Returns a tuple of the scores and the target of the specified
+    HmmerResult, for comparison.
+
+    """
+    return (result.full_seq_score.evalue, result.full_seq_score.score,
+            result.full_seq_score.bias, result.best_domain_score.evalue,
+            result.best_domain_score.score, result.best_domain_score.bias,
+            result.domain_exp, result.domain_N, result.pdbid, result.chain)
+
+def domain_fields(domain):
+    """Returns a tuple of the fields of the specified Domain, for comparison.
+
+    """
+    return (domain.number, domain.included, domain.score, domain.bias,
+            domain.c_evalue, domain.i_evalue, domain.hmm_from, domain.hmm_to,
+            domain.ali_from, domain.ali_to, domain.env_from, domain.env_to,
+            domain.acc, domain.alignment)
+
+def only_result(filename):
+    """Returns the single HmmerResult, with its domains, in the specified
+    output file.
+
+    """
+    results = list(iter_results(filename, domains=True))
+    assert len(results) == 1, filename
+    return results[0]
+
+class SplitSearchOutputTest(unittest.TestCase):
+    """Tests of splitting the outputs of a single `hmmsearch'."""
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.output_filenames = dict((name, os.path.join(self.dirname,
+                                                         name + '.out'))
+                                     for name in SEQUENCES)
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def test_iter_results(self):
+        results = list(iter_results(SEARCH_OUTPUT))
+        self.assertEqual([(r.pdbid, r.chain) for r in results],
+                         [('1b33', 'A'), ('1ubq', 'A')])
+        self.assertEqual([r.domains for r in results], [[], []])
+        with_domains = list(iter_results(SEARCH_OUTPUT, domains=True))
+        self.assertEqual(map(result_fields, with_domains),
+                         map(result_fields, results))
+        self.assertEqual([[d.number for d in r.domains] for r in with_domains],
+                         [[1], [1, 2]])
+        self.assertEqual([d.included for d in with_domains[1].domains],
+                         [False, False])
+        self.assertEqual(len(with_domains[0].domains[0].alignment), 4)
+
+    def test_iter_results_truncated(self):
+        # the results of a search whose domain annotation was cut short are
+        # still yielded, with the domains read so far
+        truncated = os.path.join(self.dirname, 'truncated.out')
+        with open(SEARCH_OUTPUT, 'r') as f:
+            lines = f.readlines()
+        with open(truncated, 'w') as f:
+            f.writelines(lines[:lines.index(DOMAIN_LINE) + 4])
+        results = list(iter_results(truncated, domains=True))
+        self.assertEqual([r.pdbid for r in results], ['1b33', '1ubq'])
+        self.assertEqual([len(r.domains) for r in results], [1, 1])
+
+    def test_split_search_output(self):
+        before = dict((r.pdbid + '_' + r.chain, r)
+                      for r in iter_results(SEARCH_OUTPUT, domains=True))
+        split_search_output(SEARCH_OUTPUT, self.output_filenames)
+        for name, output_filename in self.output_filenames.iteritems():
+            after = result_from_file(output_filename)
+            if name in before:
+                self.assertEqual(result_fields(after),
+                                 result_fields(before[name]))
+                after = only_result(output_filename)
+                self.assertEqual(map(domain_fields, after.domains),
+                                 map(domain_fields, before[name].domains))
+            else:
+                self.assertEqual(after.full_seq_score.score, -1000)
+                self.assertEqual(list(iter_results(output_filename)), [])
+
+    def test_split_table_output(self):
+        split_search_output(SEARCH_OUTPUT, self.output_filenames)
+        tables = dict((name, filename + '.tbl')
+                      for name, filename in self.output_filenames.iteritems())
+        domain_tables = dict((name, filename + '.domtbl')
+                             for name, filename
+                             in self.output_filenames.iteritems())
+        split_table_output(SEARCH_TABLE, tables)
+        split_table_output(SEARCH_DOMAIN_TABLE, domain_tables, domains=True)
+        for name, output_filename in self.output_filenames.iteritems():
+            self.assertEqual(result_fields(result_from_table(tables[name])),
+                             result_fields(result_from_file(output_filename)))
+            self.assertEqual([(hit.number, hit.i_evalue, hit.hmm_from,
+                               hit.hmm_to, hit.ali_from, hit.ali_to)
+                              for hit in iter_domain_table(
+                                  domain_tables[name])],
+                             [(d.number, d.i_evalue, d.hmm_from, d.hmm_to,
+                               d.ali_from, d.ali_to)
+                              for result in iter_results(output_filename,
+                                                         domains=True)
+                              for d in result.domains])
+
+    def test_table_finished(self):
+        self.assertTrue(table_finished(SEARCH_TABLE))
+        self.assertTrue(table_finished(SEARCH_DOMAIN_TABLE))
+        # the table of a search killed part way through, or before any hit
+        with open(SEARCH_TABLE, 'r') as f:
+            lines = f.readlines()
+        truncated = os.path.join(self.dirname, 'truncated.out.tbl')
+        for end in (0, 3, len(lines) - 1):
+            with open(truncated, 'w') as f:
+                f.writelines(lines[:end])
+            self.assertFalse(table_finished(truncated))
+        # the split tables keep the trailer
+        tables = dict((name, filename + '.tbl')
+                      for name, filename in self.output_filenames.iteritems())
+        split_table_output(SEARCH_TABLE, tables)
+        for table in tables.itervalues():
+            self.assertTrue(table_finished(table))
+
+class SplitScanOutputTest(unittest.TestCase):
+    """Tests of splitting the outputs of `hmmscan' of many sequences."""
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.output_filenames = dict(
+            (name, dict((model, os.path.join(self.dirname,
+                                             name + '.' + model + '.out'))
+                        for model in MODELS))
+            for name in SEQUENCES)
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def results_before(self):
+        """Returns a map from each pair of sequence and model listed in the
+        output of `hmmscan' to its HmmerResult, read from the output of the
+        search of that sequence alone.
+
+        """
+        results = {}
+        with open(SCAN_OUTPUT, 'r') as f:
+            queries = f.read().split('//\n')
+        for query in queries:
+            # the first query is preceded by the header of the program
+            if 'Query:' not in query:
+                continue
+            query = query[query.index('Query:'):]
+            name = query.split()[1]
+            filename = os.path.join(self.dirname, name + '.scan')
+            with open(filename, 'w') as f:
+                f.write(query + '//\n')
+            for result in iter_results(filename, domains=True):
+                results[name, result.pdbid] = result
+        return results
+
+    def test_iter_results(self):
+        self.assertEqual([r.pdbid for r in iter_results(SCAN_OUTPUT)],
+                         ['46459', '46463', '46459'])
+        self.assertEqual([len(r.domains)
+                          for r in iter_results(SCAN_OUTPUT, domains=True)],
+                         [1, 1, 2])
+
+    def test_rename_target(self):
+        with open(SCAN_OUTPUT, 'r') as f:
+            line = [line for line in f if line.split()[8:9] == ['46459']][0]
+        renamed = _rename_target(line, '1b33_A')
+        self.assertEqual(renamed.split()[:8], line.split()[:8])
+        self.assertEqual(renamed.split()[8:], ['1b33_A'])
+        self.assertEqual(renamed[:renamed.index('1b33_A')],
+                         line[:line.index('46459')])
+        self.assertTrue(renamed.endswith('\n'))
+
+    def test_split_scan_output(self):
+        before = self.results_before()
+        self.assertEqual(sorted(before), [('1b33_A', '46459'),
+                                          ('1b33_A', '46463'),
+                                          ('1ubq_A', '46459')])
+        split_scan_output(SCAN_OUTPUT, self.output_filenames)
+        for name, models in self.output_filenames.iteritems():
+            for model, output_filename in models.iteritems():
+                after = result_from_file(output_filename)
+                if (name, model) not in before:
+                    self.assertEqual(after.full_seq_score.score, -1000)
+                    continue
+                expected = before[name, model]
+                # the target of the split output is the sequence, as in the
+                # output of `hmmsearch' of that model against the sequence
+                expected.pdbid, _, expected.chain = name.partition('_')
+                self.assertEqual(result_fields(after),
+                                 result_fields(expected))
+                self.assertEqual(map(domain_fields,
+                                     only_result(output_filename).domains),
+                                 map(domain_fields, expected.domains))
+                with open(output_filename, 'r') as f:
+                    self.assertIn('Query:       ' + model + '\n', f.read())
+
+    def test_split_scan_table_output(self):
+        split_scan_output(SCAN_OUTPUT, self.output_filenames)
+        tables = dict((name, dict((model, filename + '.tbl')
+                                  for model, filename in models.iteritems()))
+                      for name, models in self.output_filenames.iteritems())
+        domain_tables = dict((name, dict((model, filename + '.domtbl')
+                                         for model, filename
+                                         in models.iteritems()))
+                             for name, models
+                             in self.output_filenames.iteritems())
+        split_scan_table_output(SCAN_TABLE, tables)
+        split_scan_table_output(SCAN_DOMAIN_TABLE, domain_tables,
+                                domains=True)
+        for name, models in self.output_filenames.iteritems():
+            for model, output_filename in models.iteritems():
+                self.assertEqual(
+                    result_fields(result_from_table(tables[name][model])),
+                    result_fields(result_from_file(output_filename)))
+                for hit in iter_table(tables[name][model]):
+                    self.assertEqual((hit.target, hit.query), (name, model))
+                hits = list(iter_domain_table(domain_tables[name][model]))
+                for hit in hits:
+                    self.assertEqual((hit.target, hit.query), (name, model))
+                    self.assertEqual(hit.query_length,
+                                     112 if model == '46459' else 98)
+                domains = [domain for result in iter_results(output_filename,
+                                                             domains=True)
+                           for domain in result.domains]
+                self.assertEqual([(hit.number, hit.i_evalue, hit.hmm_from,
+                                   hit.hmm_to, hit.ali_from, hit.ali_to)
+                                  for hit in hits],
+                                 [(d.number, d.i_evalue, d.hmm_from, d.hmm_to,
+                                   d.ali_from, d.ali_to) for d in domains])
+
+# the domain annotation heading of the second target of SEARCH_OUTPUT
+DOMAIN_LINE = '>> 1ubq_A  mol:protein length:76  UBIQUITIN\n'
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,232 @@
+# test_jobs.py - tests of running external commands concurrently
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of the order in which jobs are run, and of what happens when one of
+them fails.
+
+"""
+
+import os.path
+import shutil
+import sys
+import tempfile
+import unittest
+
+from gargamel.jobs import COMMAND_NOT_RUN
+from gargamel.jobs import Call
+from gargamel.jobs import Job
+from gargamel.jobs import defer_jobs
+from gargamel.jobs import deferred_jobs
+from gargamel.jobs import run_graph
+from gargamel.jobs import run_jobs
+from gargamel.jobs import run_pipelined
+from gargamel.jobs import will_exist
+
+def record(names, name, return_code=0):
+    """Appends the specified name to the specified list, and returns the
+    specified return code.
+
+    """
+    names.append(name)
+    return return_code
+
+def fail():
+    """Raises an exception."""
+    raise RuntimeError('failed')
+
+class JobTest(unittest.TestCase):
+    """Tests of running the commands of single jobs, and of lists of them."""
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def test_commands(self):
+        log_filename = os.path.join(self.dirname, 'job.log')
+        job = Job('job', [[sys.executable, '-c', 'print "hello"'],
+                          [sys.executable, '-c', 'exit(3)'],
+                          [sys.executable, '-c', 'print "not run"']],
+                  log_filename=log_filename).run()
+        self.assertEqual(job.return_codes, [0, 3])
+        self.assertFalse(job.succeeded)
+        with open(log_filename) as log_file:
+            self.assertEqual(log_file.read(), 'hello\n')
+
+    def test_keep_going(self):
+        names = []
+        job = Job('job', [Call(record, names, 'a', 1), Call(fail),
+                          [os.path.join(self.dirname, 'missing')],
+                          Call(record, names, 'b')], keep_going=True).run()
+        self.assertEqual(names, ['a', 'b'])
+        self.assertEqual(job.return_codes, [1, 1, COMMAND_NOT_RUN, 0])
+        self.assertFalse(job.succeeded)
+
+    def test_reuse(self):
+        names = []
+        job = Job('job', [Call(record, names, 'a')],
+                  reuse=lambda: True).run()
+        self.assertEqual(names, [])
+        self.assertTrue(job.skipped and job.succeeded)
+
+    def test_done_filename(self):
+        names = []
+        done_filename = os.path.join(self.dirname, 'job.done')
+        job = Job('job', [Call(record, names, 'a')],
+                  done_filename=done_filename).run()
+        self.assertTrue(job.succeeded and not job.skipped)
+        self.assertTrue(os.path.isfile(done_filename))
+        # a finished job is skipped when it is run again
+        job.run()
+        self.assertTrue(job.skipped)
+        self.assertEqual(names, ['a'])
+        # the name may be chosen just before the job would run, and a job
+        # which fails is not marked as finished
+        failed_filename = os.path.join(self.dirname, 'failed.done')
+        job = Job('job', [Call(record, names, 'b', 1)],
+                  done_filename=lambda: failed_filename).run()
+        self.assertFalse(job.succeeded)
+        self.assertFalse(os.path.exists(failed_filename))
+
+    def test_run_jobs(self):
+        names = []
+        jobs = [Job(name, [Call(record, names, name, int(name == 'c'))],
+                    cost=cost)
+                for name, cost in (('a', 1), ('b', 3), ('c', 2), ('d', 1))]
+        finished = run_jobs(jobs, 1)
+        # the most costly jobs are started first, in the order specified for
+        # equal cost, and a failed job does not stop the others
+        self.assertEqual(names, ['b', 'c', 'a', 'd'])
+        self.assertEqual([job.name for job in finished], names)
+        self.assertEqual([job.succeeded for job in jobs],
+                         [True, True, False, True])
+        self.assertEqual(run_jobs([], 4), [])
+
+class RunPipelinedTest(unittest.TestCase):
+    """Tests of running the stages of several pipelines of jobs."""
+
+    def test_run_pipelined(self):
+        names = []
+        pipelines = [[Job(family + str(stage),
+                          [Call(record, names, family + str(stage),
+                                int(family + str(stage) == 'b0'))],
+                          cost=cost)
+                      for stage in range(2)]
+                     for family, cost in (('a', 1), ('b', 2), ('c', 0))]
+        finished = run_pipelined(pipelines + [[]], [1, 1])
+        # each pipeline runs its stages in order and stops at a failed job
+        self.assertEqual(sorted(names), ['a0', 'a1', 'b0', 'c0', 'c1'])
+        for family in 'ac':
+            self.assertTrue(names.index(family + '0')
+                            < names.index(family + '1'))
+        # the first stages are started in decreasing order of cost
+        self.assertEqual([name for name in names if name[1] == '0'],
+                         ['b0', 'a0', 'c0'])
+        self.assertEqual(sorted(job.name for job in finished), sorted(names))
+        self.assertEqual(run_pipelined([], [1, 1]), [])
+
+class RunGraphTest(unittest.TestCase):
+    """Tests of running jobs as soon as the jobs writing their inputs have
+    finished.
+
+    """
+
+    def setUp(self):
+        self.names = []
+
+    def job(self, name, inputs=(), outputs=(), return_code=0, cost=0):
+        """Returns a job which records its name in self.names and returns the
+        specified return code.
+
+        """
+        return Job(name, [Call(record, self.names, name, return_code)],
+                   inputs=inputs, outputs=outputs, cost=cost)
+
+    def families(self):
+        """Returns the jobs aligning, building and querying two families, of
+        which the alignment of the second is the most costly and its query
+        also reads the model of the first.
+
+        """
+        return [self.job('query1', ['1/hmm'], ['1/out']),
+                self.job('build1', ['1/ssi'], ['1/hmm']),
+                self.job('align1', [], ['1/ssi']),
+                self.job('query2', ['2/hmm', '1/./hmm'], ['2/out']),
+                self.job('build2', ['2/ssi'], ['2/hmm']),
+                self.job('align2', [], ['2/ssi'], cost=5)]
+
+    def test_order(self):
+        jobs = self.families()
+        finished = run_graph(jobs, 2)
+        self.assertEqual(len(finished), 6)
+        self.assertTrue(all(job.succeeded for job in jobs))
+        for before, after in (('align1', 'build1'), ('build1', 'query1'),
+                              ('align2', 'build2'), ('build2', 'query2'),
+                              ('build1', 'query2')):
+            self.assertTrue(self.names.index(before)
+                            < self.names.index(after))
+
+    def test_ready_order(self):
+        # the ready jobs are started in decreasing order of cost, and then in
+        # the order in which they were specified
+        run_graph(self.families(), 1)
+        self.assertEqual(self.names, ['align2', 'align1', 'build1', 'query1',
+                                      'build2', 'query2'])
+
+    def test_cycle(self):
+        jobs = [self.job('a', ['b.out'], ['a.out']),
+                self.job('b', ['c.out'], ['b.out']),
+                self.job('c', ['a.out'], ['c.out']),
+                self.job('d', ['d.out'], ['d.out'])]
+        self.assertRaises(ValueError, run_graph, jobs, 2)
+        self.assertEqual(self.names, [])
+        # a job which reads its own output does not depend on itself
+        self.assertEqual(len(run_graph(jobs[3:], 2)), 1)
+
+    def test_failure(self):
+        jobs = [self.job('align', [], ['ssi'], return_code=1),
+                self.job('build', ['ssi'], ['hmm']),
+                self.job('query', ['hmm', 'other'], ['out']),
+                self.job('other', [], ['other'])]
+        finished = run_graph(jobs, 1)
+        # the jobs which depend on the failed job, directly or not, are not
+        # run and are returned as failed
+        self.assertEqual(sorted(self.names), ['align', 'other'])
+        self.assertEqual(sorted(job.name for job in finished),
+                         ['align', 'build', 'other', 'query'])
+        self.assertEqual([job.succeeded for job in jobs],
+                         [False, False, False, True])
+
+    def test_defer(self):
+        defer_jobs()
+        try:
+            self.assertEqual(run_graph([self.job('align', [], ['1/ssi'])]),
+                             [])
+            self.assertTrue(will_exist('1/./ssi'))
+            self.assertFalse(will_exist('2/ssi'))
+            self.assertEqual(run_jobs([self.job('build', ['1/ssi'])]), [])
+        finally:
+            jobs = deferred_jobs()
+        self.assertEqual([job.name for job in jobs], ['align', 'build'])
+        self.assertEqual(self.names, [])
+        self.assertFalse(will_exist('1/ssi'))
+        run_graph(jobs)
+        self.assertEqual(self.names, ['align', 'build'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+# test_mattcache.py - tests of the cache of matt alignments
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of the keys of cached alignments, and of storing and restoring
+them.
+
+"""
+
+import os
+import os.path
+import shutil
+import stat
+import tempfile
+import unittest
+
+import gargamel.cache
+from gargamel.mattcache import alignment_key
+from gargamel.mattcache import restore_alignment
+from gargamel.mattcache import store_alignment
+
+# the output formats of the test alignments
+FORMATS = ['fasta', 'pdb', 'ssi']
+
+def write(filename, contents):
+    """Writes the specified contents to the specified file."""
+    with open(filename, 'w') as f:
+        f.write(contents)
+
+def read(filename):
+    """Returns the contents of the specified file."""
+    with open(filename) as f:
+        return f.read()
+
+class MattCacheTest(unittest.TestCase):
+    """Tests of the cache of matt alignments."""
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.saved_index_dir = gargamel.cache.INDEX_DIR
+        gargamel.cache.INDEX_DIR = os.path.join(self.dirname, 'index')
+        self.cache_dir = os.path.join(self.dirname, 'cache')
+        self.matt = os.path.join(self.dirname, 'matt')
+        write(self.matt, 'matt 1.00')
+
+    def tearDown(self):
+        gargamel.cache.INDEX_DIR = self.saved_index_dir
+        shutil.rmtree(self.dirname)
+
+    def alignment(self, dirname, contents):
+        """Writes the outputs of a matt alignment with the specified contents
+        to the specified directory, and returns their prefix.
+
+        """
+        os.mkdir(dirname)
+        prefix = os.path.join(dirname, 'matt_alignment')
+        for format in FORMATS:
+            write(prefix + '.' + format, contents + ' ' + format)
+        return prefix
+
+    def test_key(self):
+        key = alignment_key(['1abc:A', '2xyz:B'], self.matt, FORMATS)
+        self.assertEqual(alignment_key(['2xyz:B', '1abc:A'], self.matt,
+                                       ['ssi', 'pdb', 'fasta']), key)
+        self.assertNotEqual(alignment_key(['1abc:A'], self.matt, FORMATS),
+                            key)
+        self.assertNotEqual(alignment_key(['1abc:A', '2xyz:B'], self.matt,
+                                          FORMATS[:2]), key)
+        # a new version of matt gives a new key
+        write(self.matt, 'matt 1.01')
+        self.assertNotEqual(alignment_key(['1abc:A', '2xyz:B'], self.matt,
+                                          FORMATS), key)
+        # a missing executable still gives a key
+        self.assertNotEqual(alignment_key(['1abc:A', '2xyz:B'],
+                                          os.path.join(self.dirname,
+                                                       'missing'), FORMATS),
+                            key)
+
+    def test_store_and_restore(self):
+        key = alignment_key(['1abc:A', '2xyz:B'], self.matt, FORMATS)
+        first = self.alignment(os.path.join(self.dirname, '46459'), 'first')
+        second = self.alignment(os.path.join(self.dirname, '46463'), 'old')
+        self.assertFalse(restore_alignment(key, second, FORMATS,
+                                           self.cache_dir))
+        self.assertEqual(store_alignment(key, first, FORMATS, self.cache_dir),
+                         0)
+        # storing the same alignment again leaves the entry as it is
+        self.assertEqual(store_alignment(key, second, FORMATS,
+                                         self.cache_dir), 0)
+        self.assertEqual(os.listdir(self.cache_dir), [key])
+        self.assertTrue(restore_alignment(key, second, FORMATS,
+                                          self.cache_dir))
+        for format in FORMATS:
+            filename = second + '.' + format
+            entry_filename = os.path.join(self.cache_dir, key,
+                                          'matt_alignment.' + format)
+            self.assertEqual(read(filename), 'first ' + format)
+            # the entry is read-only, and the restored copy can be rewritten
+            # in place without changing it
+            self.assertEqual(stat.S_IMODE(os.stat(entry_filename).st_mode),
+                             0444)
+            write(filename, 'preparsed')
+            self.assertEqual(read(entry_filename), 'first ' + format)
+        # an entry missing one of the formats is not restored
+        self.assertFalse(restore_alignment(key, second, FORMATS + ['aln'],
+                                           self.cache_dir))
+
+    def test_store_missing(self):
+        prefix = self.alignment(os.path.join(self.dirname, '46459'), 'first')
+        os.remove(prefix + '.pdb')
+        self.assertEqual(store_alignment('key', prefix, FORMATS,
+                                         self.cache_dir), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir, 'key')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+# test_modelcache.py - tests of the cache of models
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests of the keys of cached models, of storing and restoring them, and of
+evicting the least recently used of them.
+
+"""
+
+import os
+import os.path
+import shutil
+import stat
+import tempfile
+import unittest
+
+import gargamel.cache
+from gargamel.jobs import Call
+from gargamel.jobs import Job
+from gargamel.modelcache import CachedModel
+from gargamel.modelcache import evict
+from gargamel.modelcache import model_key
+
+def write(filename, contents):
+    """Writes the specified contents to the specified file."""
+    with open(filename, 'w') as f:
+        f.write(contents)
+
+def read(filename):
+    """Returns the contents of the specified file."""
+    with open(filename) as f:
+        return f.read()
+
+class ModelCacheTest(unittest.TestCase):
+    """Tests of the cache of models."""
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.saved_index_dir = gargamel.cache.INDEX_DIR
+        gargamel.cache.INDEX_DIR = os.path.join(self.dirname, 'index')
+        self.cache_dir = os.path.join(self.dirname, 'cache')
+        self.hmmbuild = os.path.join(self.dirname, 'hmmbuild')
+        write(self.hmmbuild, 'hmmbuild 3.1b2')
+        for family in ('46459', '46463'):
+            os.mkdir(os.path.join(self.dirname, family))
+
+    def tearDown(self):
+        gargamel.cache.INDEX_DIR = self.saved_index_dir
+        shutil.rmtree(self.dirname)
+
+    def path(self, *names):
+        """Returns the name of the specified file in the test directory."""
+        return os.path.join(self.dirname, *names)
+
+    def model(self, family, max_size=1 << 20):
+        """Returns the CachedModel of the HMM built from the alignment of the
+        specified family.
+
+        """
+        return CachedModel([self.path(family, 'matt.ssi')],
+                           ['hmmer', '--hand'], [self.hmmbuild],
+                           [self.path(family, 'hmmer.hmm')], self.cache_dir,
+                           max_size)
+
+    def build(self, family, model):
+        """Runs a job which builds the specified model of the specified
+        family, unless it is restored from the cache, and returns the job.
+
+        """
+        def hmmbuild():
+            write(self.path(family, 'hmmer.hmm'),
+                  'HMM of ' + read(self.path(family, 'matt.ssi')))
+            return 0
+        return Job(family, [Call(hmmbuild), Call(model.store)],
+                   reuse=model.restore).run()
+
+    def test_key(self):
+        write(self.path('46459', 'matt.ssi'), 'alignment')
+        write(self.path('46463', 'matt.ssi'), 'alignment')
+        key = model_key([self.path('46459', 'matt.ssi')], ['hmmer', 1],
+                        [self.hmmbuild])
+        # the key depends on the contents of the inputs, not their names
+        self.assertEqual(model_key([self.path('46463', 'matt.ssi')],
+                                   ['hmmer', 1], [self.hmmbuild]), key)
+        self.assertNotEqual(model_key([self.path('46459', 'matt.ssi')],
+                                      ['hmmer', 2], [self.hmmbuild]), key)
+        self.assertNotEqual(model_key([self.path('46459', 'matt.ssi')],
+                                      ['hmmer', 1], []), key)
+        write(self.path('46463', 'matt.ssi'), 'another alignment')
+        self.assertNotEqual(model_key([self.path('46463', 'matt.ssi')],
+                                      ['hmmer', 1], [self.hmmbuild]), key)
+        write(self.hmmbuild, 'hmmbuild 3.2')
+        self.assertNotEqual(model_key([self.path('46459', 'matt.ssi')],
+                                      ['hmmer', 1], [self.hmmbuild]), key)
+
+    def test_reuse(self):
+        write(self.path('46459', 'matt.ssi'), 'alignment')
+        write(self.path('46463', 'matt.ssi'), 'alignment')
+        job = self.build('46459', self.model('46459'))
+        self.assertTrue(job.succeeded and not job.skipped)
+        entry = os.path.join(self.cache_dir, os.listdir(self.cache_dir)[0])
+        mode = os.stat(os.path.join(entry, 'model0')).st_mode
+        self.assertEqual(stat.S_IMODE(mode), 0444)
+        # the same alignment in another family is restored, not built
+        write(self.path('46463', 'hmmer.hmm'), 'old HMM')
+        job = self.build('46463', self.model('46463'))
+        self.assertTrue(job.skipped)
+        self.assertEqual(read(self.path('46463', 'hmmer.hmm')),
+                         'HMM of alignment')
+        # the restored copy can be changed in place without changing the entry
+        write(self.path('46463', 'hmmer.hmm'), 'calibrated HMM')
+        self.assertEqual(read(os.path.join(entry, 'model0')),
+                         'HMM of alignment')
+        # a changed alignment is built again
+        write(self.path('46463', 'matt.ssi'), 'another alignment')
+        job = self.build('46463', self.model('46463'))
+        self.assertFalse(job.skipped)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_missing_input(self):
+        model = self.model('46459')
+        self.assertFalse(model.restore())
+        # without a key, nothing is stored
+        self.assertEqual(model.store(), 0)
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_evict(self):
+        os.mkdir(self.cache_dir)
+        for name, mtime in (('old', 100), ('new', 300), ('middle', 200)):
+            entry = os.path.join(self.cache_dir, name)
+            os.mkdir(entry)
+            write(os.path.join(entry, 'model0'), 'x' * 10)
+            os.utime(entry, (mtime, mtime))
+        os.mkdir(os.path.join(self.cache_dir, 'partial.tmp'))
+        self.assertEqual(evict(self.cache_dir, 30), 0)
+        self.assertEqual(evict(self.cache_dir, 25), 1)
+        self.assertEqual(sorted(os.listdir(self.cache_dir)),
+                         ['middle', 'new', 'partial.tmp'])
+        self.assertEqual(evict(self.cache_dir, 0), 2)
+        self.assertEqual(os.listdir(self.cache_dir), ['partial.tmp'])
+
+    def test_evict_on_store(self):
+        for family in ('46459', '46463'):
+            write(self.path(family, 'matt.ssi'), 'alignment of ' + family)
+        self.build('46459', self.model('46459', 100))
+        first_entry = os.listdir(self.cache_dir)
+        os.utime(os.path.join(self.cache_dir, first_entry[0]), (100, 100))
+        # storing a second model evicts the least recently used first one
+        self.build('46463', self.model('46463', 30))
+        second_entry = os.listdir(self.cache_dir)
+        self.assertEqual(len(second_entry), 1)
+        self.assertNotEqual(second_entry, first_entry)
+        # reusing an entry marks it as recently used
+        second_entry = os.path.join(self.cache_dir, second_entry[0])
+        os.utime(second_entry, (200, 200))
+        self.assertTrue(self.build('46463', self.model('46463', 30)).skipped)
+        self.assertTrue(os.path.getmtime(second_entry) > 200)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+# test_nrpdb.py - tests of the index of NRPDB representatives
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests that the NRPDB index maps each chain to its representative."""
+
+import os.path
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+import gargamel.cache
+from gargamel.nrpdb import RepresentativeFields
+from gargamel.nrpdb import index_from_file
+from gargamel.nrpdb import nrpdbs_from_file
+from gargamel.nrpdb import representatives_from_file
+
+# the test NRPDB file, which has chains differing only in case
+NRPDB_FILENAME = os.path.join(os.path.dirname(__file__), 'data', 'nrpdb')
+
+class NrpdbIndexTest(unittest.TestCase):
+    """Tests of the index of a NRPDB file."""
+
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        self.saved_index_dir = gargamel.cache.INDEX_DIR
+        gargamel.cache.INDEX_DIR = self.index_dir
+        gargamel.cache._loaded_indices.clear()
+
+    def tearDown(self):
+        gargamel.cache.INDEX_DIR = self.saved_index_dir
+        gargamel.cache._loaded_indices.clear()
+        shutil.rmtree(self.index_dir)
+
+    def test_lowercase_chains(self):
+        index = index_from_file(NRPDB_FILENAME)
+        # the PDB ID is lowercased and the chain uppercased, and of chains
+        # which differ only in case the first is used
+        self.assertEqual(index.chains,
+                         ['1abc:A', '1abc:B', '2xyz:A', '1big:A', '3nor:A'])
+
+    def test_identity(self):
+        # without a non-redundant set, every chain is its own representative,
+        # even in a group without a representative
+        mapping = nrpdbs_from_file(NRPDB_FILENAME)
+        self.assertEqual(mapping, dict((chain, chain) for chain in
+                                       ['1abc:A', '1abc:B', '2xyz:A',
+                                        '1big:A', '3nor:A']))
+        self.assertEqual(nrpdbs_from_file(NRPDB_FILENAME, 'unknown'), mapping)
+
+    def test_representatives(self):
+        self.assertEqual(nrpdbs_from_file(NRPDB_FILENAME,
+                                          RepresentativeFields.BLAST7),
+                         {'1abc:A': '1abc:A', '1abc:B': '1abc:A',
+                          '2xyz:A': '1abc:A', '1big:A': '1big:A'})
+        self.assertEqual(nrpdbs_from_file(NRPDB_FILENAME,
+                                          RepresentativeFields.BLAST40),
+                         {'1abc:A': '1abc:A', '1abc:B': '1abc:B',
+                          '2xyz:A': '1abc:A', '1big:A': '1big:A'})
+        # 3nor:A is in a group without a representative, so it is left out
+        representatives = representatives_from_file(
+            NRPDB_FILENAME, ['2xyz:A', '3nor:A', '9zzz:A'],
+            RepresentativeFields.NONIDENT)
+        self.assertEqual(representatives, {'2xyz:A': '2xyz:A'})
+
+    def test_arrays(self):
+        index = index_from_file(NRPDB_FILENAME)
+        blast7 = index.representative_array(RepresentativeFields.BLAST7)
+        self.assertEqual(list(blast7), [0, 0, 0, 3, -1])
+        self.assertEqual(list(index.representative_array()), range(5))
+        names = numpy.array(['3nor:A', '1abc:B', '0aaa:A'])
+        self.assertEqual(list(index.positions(names)), [4, 1, -1])
+        # the chains of a structure share a code
+        self.assertEqual(index.structures[0], index.structures[1])
+        self.assertNotEqual(index.structures[0], index.structures[2])
+
+    def test_saved(self):
+        index = index_from_file(NRPDB_FILENAME)
+        gargamel.cache._loaded_indices.clear()
+        saved = index_from_file(NRPDB_FILENAME)
+        self.assertIsNot(saved, index)
+        self.assertEqual(saved.chains, index.chains)
+        self.assertEqual(saved.mapping(RepresentativeFields.BLAST80),
+                         index.mapping(RepresentativeFields.BLAST80))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+# test_results.py - tests of the columnar binary store of summarized results
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests that the rows written to the results store are loaded unchanged, and
+that rewriting the store replaces its version.
+
+"""
+
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from gargamel.results import CHAINS_FILENAME
+from gargamel.results import CHAIN_NAMES_FILENAME
+from gargamel.results import CURRENT_LINKNAME
+from gargamel.results import FAMILIES_FILENAME
+from gargamel.results import FAMILY_NAMES_FILENAME
+from gargamel.results import LABELS_FILENAME
+from gargamel.results import SCORES_FILENAME
+from gargamel.results import VERSION_SUFFIX
+from gargamel.results import load_results
+from gargamel.results import write_results
+
+# rows as written to the summary CSV file, one without a score
+ROWS = [('1abc', 'A', '46463', 12.5, 'positive'),
+        ('1abd', 'a', '46459', None, 'negative'),
+        ('1abc', 'A', '46459', -3.0, 'negative'),
+        ('2xyz', 'B', '46463', 0.0, 'positive')]
+
+class ResultsTest(unittest.TestCase):
+    """Tests of writing and loading the results store."""
+
+    def setUp(self):
+        self.dirname = os.path.join(tempfile.mkdtemp(), 'hmmer_results')
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.dirname))
+
+    def versions(self):
+        return [name for name in os.listdir(self.dirname)
+                if name.endswith(VERSION_SUFFIX)]
+
+    def test_round_trip(self):
+        write_results(self.dirname, ROWS)
+        results = load_results(self.dirname)
+        self.assertEqual(len(results), len(ROWS))
+        self.assertEqual([results.row(i) for i in range(len(results))], ROWS)
+        # names are coded by their sorted order, and a missing score is NaN
+        self.assertEqual(list(results.chain_names),
+                         ['1abc:A', '1abd:a', '2xyz:B'])
+        self.assertEqual(list(results.chains), [0, 1, 0, 2])
+        self.assertEqual(list(results.family_names), ['46459', '46463'])
+        self.assertEqual(list(results.families), [1, 0, 0, 1])
+        self.assertTrue(numpy.isnan(results.scores[1]))
+        self.assertEqual(list(results.labels), [True, False, False, True])
+        self.assertEqual(list(results.family_mask('46459')),
+                         [False, True, True, False])
+        self.assertFalse(results.family_mask('12345').any())
+
+    def test_rewrite(self):
+        write_results(self.dirname, ROWS)
+        old_versions = self.versions()
+        self.assertEqual(len(old_versions), 1)
+        write_results(self.dirname, ROWS[:1])
+        new_versions = self.versions()
+        self.assertEqual(len(new_versions), 1)
+        self.assertNotEqual(new_versions, old_versions)
+        self.assertEqual(os.readlink(os.path.join(self.dirname,
+                                                  CURRENT_LINKNAME)),
+                         new_versions[0])
+        results = load_results(self.dirname)
+        self.assertEqual([results.row(i) for i in range(len(results))],
+                         ROWS[:1])
+
+    def test_unversioned(self):
+        # a store written before the store was versioned has its columns at
+        # the top level
+        write_results(self.dirname, ROWS)
+        version_dirname = os.path.join(self.dirname, self.versions()[0])
+        for filename in (CHAINS_FILENAME, FAMILIES_FILENAME, SCORES_FILENAME,
+                         LABELS_FILENAME, CHAIN_NAMES_FILENAME,
+                         FAMILY_NAMES_FILENAME):
+            shutil.move(os.path.join(version_dirname, filename),
+                        self.dirname)
+        os.rmdir(version_dirname)
+        os.remove(os.path.join(self.dirname, CURRENT_LINKNAME))
+        results = load_results(self.dirname)
+        self.assertEqual([results.row(i) for i in range(len(results))], ROWS)
+        # rewriting it removes the unversioned columns
+        write_results(self.dirname, ROWS)
+        self.assertEqual(sorted(os.listdir(self.dirname)),
+                         sorted([CURRENT_LINKNAME] + self.versions()))
+        results = load_results(self.dirname)
+        self.assertEqual([results.row(i) for i in range(len(results))], ROWS)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+# test_scop.py - tests of the indices of SCOP classification files
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests that the SCOP tree, arrays and lineage index agree with a small
+classification file.
+
+The file has two classes. Chain 1aaa:A has a domain in each of superfamilies
+100 and 101, and the record of 3aab has no chain.
+
+"""
+
+import os.path
+import shutil
+import tempfile
+import unittest
+
+import gargamel.cache
+from gargamel.scop import Keys
+from gargamel.scop import all_pdbids_from_file_in
+from gargamel.scop import arrays_from_file
+from gargamel.scop import hierarchy_sets_from_file
+from gargamel.scop import lineages_from_file
+from gargamel.scop import records_from_file
+from gargamel.scop import tree_from_file
+
+# the test SCOP classification file
+SCOP_FILENAME = os.path.join(os.path.dirname(__file__), 'data', 'scop_cla')
+
+class ScopTestCase(unittest.TestCase):
+    """Saves the indices of the test file in a temporary directory."""
+
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        self.saved_index_dir = gargamel.cache.INDEX_DIR
+        gargamel.cache.INDEX_DIR = self.index_dir
+        gargamel.cache._loaded_indices.clear()
+
+    def tearDown(self):
+        gargamel.cache.INDEX_DIR = self.saved_index_dir
+        gargamel.cache._loaded_indices.clear()
+        shutil.rmtree(self.index_dir)
+
+class RecordsTest(ScopTestCase):
+    """Tests of parsing the records of the file."""
+
+    def test_records(self):
+        records = records_from_file(SCOP_FILENAME)
+        self.assertEqual(len(records), 8)
+        # each lineage is in the order of Keys.order, whether BioPython
+        # stores the hierarchy as a list of pairs or as a dictionary
+        self.assertEqual(records[0],
+                         ('1aaa', 'A', (1, 10, 100, 1000, 5000, 6000, 9001)))
+        self.assertEqual(records[7],
+                         ('3aab', None, (2, 20, 200, 2000, 5020, 6020, 9008)))
+
+    def test_saved(self):
+        records = records_from_file(SCOP_FILENAME)
+        gargamel.cache._loaded_indices.clear()
+        self.assertEqual(records_from_file(SCOP_FILENAME), records)
+
+class ScopTreeTest(ScopTestCase):
+    """Tests of the queries of the whole-hierarchy tree."""
+
+    def test_hierarchy_sets(self):
+        self.assertEqual(hierarchy_sets_from_file(SCOP_FILENAME,
+                                                  Keys.SUPERFAMILY, 100),
+                         {1000: set([('1aaa', 'A'), ('1aab', 'A')]),
+                          1001: set([('1aac', 'B'), ('1aaa', 'B')])})
+        self.assertEqual(hierarchy_sets_from_file(SCOP_FILENAME, Keys.CLASS,
+                                                  2),
+                         {20: set([('3aaa', 'A'), ('3aab', None)])})
+        self.assertEqual(hierarchy_sets_from_file(SCOP_FILENAME,
+                                                  Keys.SUPERFAMILY, 12345),
+                         {})
+        # a sunid at a different level is not found
+        self.assertEqual(hierarchy_sets_from_file(SCOP_FILENAME, Keys.FOLD,
+                                                  100), {})
+        self.assertRaises(ValueError, hierarchy_sets_from_file, SCOP_FILENAME,
+                          Keys.ENTRY, 9001)
+        self.assertRaises(ValueError, hierarchy_sets_from_file, SCOP_FILENAME,
+                          'xx', 1)
+
+    def test_chains(self):
+        self.assertEqual(all_pdbids_from_file_in(SCOP_FILENAME, Keys.FOLD, 10),
+                         set(['1aaa:A', '1aab:A', '1aac:B', '1aaa:B',
+                              '2aaa:A']))
+        tree = tree_from_file(SCOP_FILENAME)
+        self.assertEqual(sorted(tree.chains_not_under(Keys.SUPERFAMILY, 100)),
+                         [('1aaa', 'A'), ('2aaa', 'A'), ('3aaa', 'A'),
+                          ('3aab', None)])
+        self.assertEqual(len(list(tree.chains_not_under(Keys.FAMILY, 9))), 8)
+
+class ScopArraysTest(ScopTestCase):
+    """Tests of the range queries of the preorder arrays."""
+
+    def test_ranges(self):
+        arrays = arrays_from_file(SCOP_FILENAME)
+        self.assertEqual(arrays.range(Keys.CLASS, 1), (0, 6))
+        self.assertEqual(arrays.range(Keys.SUPERFAMILY, 101), (4, 6))
+        self.assertEqual(arrays.range(Keys.FOLD, 100), (0, 0))
+        self.assertEqual(arrays.range(Keys.FOLD, 12345), (0, 0))
+        self.assertEqual([sunid for sunid, start, end
+                          in arrays.children(Keys.FOLD, 10)], [100, 101])
+        self.assertEqual(arrays.children(Keys.FAMILY, 12345), [])
+
+    def test_members(self):
+        arrays = arrays_from_file(SCOP_FILENAME)
+        self.assertEqual(arrays.names(arrays.members(Keys.SUPERFAMILY, 100)),
+                         set(['1aaa:A', '1aab:A', '1aac:B', '1aaa:B']))
+        # the record of 3aab has no chain
+        self.assertEqual(arrays.names(arrays.members(Keys.FAMILY, 2000)),
+                         set(['3aaa:A']))
+        # 1aaa:A has a record outside superfamily 100 as well as in it
+        self.assertEqual(arrays.names(arrays.outside(Keys.SUPERFAMILY, 100)),
+                         set(['1aaa:A', '2aaa:A', '3aaa:A']))
+        self.assertEqual(arrays.names(arrays.complement(Keys.SUPERFAMILY,
+                                                        100)),
+                         set(['2aaa:A', '3aaa:A']))
+        self.assertEqual(list(arrays.outside_mask(Keys.SUPERFAMILY, 101)),
+                         [True] * 4 + [False] * 2 + [True] * 2)
+
+    def test_leave_one_out(self):
+        arrays = arrays_from_file(SCOP_FILENAME)
+        left_out = arrays.leave_one_out(Keys.SUPERFAMILY, 100)
+        self.assertEqual(sorted(left_out), [1000, 1001])
+        self.assertEqual(arrays.names(left_out[1000]),
+                         set(['1aac:B', '1aaa:B']))
+        self.assertEqual(arrays.names(left_out[1001]),
+                         set(['1aaa:A', '1aab:A']))
+
+    def test_saved(self):
+        arrays = arrays_from_file(SCOP_FILENAME)
+        gargamel.cache._loaded_indices.clear()
+        saved = arrays_from_file(SCOP_FILENAME)
+        self.assertIsNot(saved, arrays)
+        self.assertEqual(list(saved.chains), list(arrays.chains))
+        self.assertEqual(saved.positions, arrays.positions)
+
+class LineageTest(ScopTestCase):
+    """Tests of the index from chains to their lineages."""
+
+    def test_lineages(self):
+        lineages = lineages_from_file(SCOP_FILENAME, ['1aaa:A', '9zzz:A'])
+        self.assertEqual(sorted(lineage.sf for lineage in lineages['1aaa:A']),
+                         [100, 101])
+        self.assertEqual(lineages['1aaa:A'][0].get(Keys.FAMILY), 1000)
+        self.assertEqual(lineages['9zzz:A'], [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+# test_summary.py - tests of summarizing the outputs of the controls
+# Copyright 2010 Jeffrey Finkelstein
+#
+# This file is part of smurf.
+#
+# smurf is free software: you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# smurf is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# smurf.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests that the index of the summary parses only new or changed outputs,
+and that the summary written from it is complete.
+
+"""
+
+import argparse
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+
+from gargamel.cache import dump_atomically
+from gargamel.cache import load
+from gargamel.constants import SMURF
+from gargamel.results import load_results
+from gargamel.results import results_dirname
+from gargamel.summary import CSV_FILENAME
+from gargamel.summary import SUMMARY_INDEX_SUFFIX
+from gargamel.summary import generate_csv
+from gargamel.summary import parsed_outputs
+
+def write_output(filename, chain, score, mtime=1000):
+    """Writes a smurf output file for the specified PDB ID_chain with the
+    specified score and modification time.
+
+    """
+    with open(filename, 'w') as f:
+        f.write('>' + chain + ' mol:protein\n')
+        f.write('Raw score: ' + score + '\n')
+    os.utime(filename, (mtime, mtime))
+
+class ParsedOutputsTest(unittest.TestCase):
+    """Tests of the index of the parsed outputs."""
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.index_filename = os.path.join(self.dirname,
+                                           'smurf_summary.csv.index')
+        self.filenames = [os.path.join(self.dirname, name)
+                          for name in ('1abc_A.out', '2xyz_B.out')]
+        write_output(self.filenames[0], '1abc_A', '12.5')
+        write_output(self.filenames[1], '2xyz_B', '-3.0')
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def parse(self, num_jobs=1):
+        """Returns the parsed outputs, using the index of the test directory."""
+        return parsed_outputs(SMURF, self.filenames, self.index_filename,
+                              num_jobs)
+
+    def test_parse(self):
+        expected = {self.filenames[0]: (('1abc', 'A', 12.5), []),
+                    self.filenames[1]: (('2xyz', 'B', -3.0), [])}
+        self.assertEqual(self.parse(), expected)
+        os.remove(self.index_filename)
+        self.assertEqual(self.parse(2), expected)
+
+    def test_unchanged(self):
+        self.parse()
+        # an output with the same size and modification time is not parsed
+        # again
+        write_output(self.filenames[0], '1abc_A', '99.9')
+        self.assertEqual(self.parse()[self.filenames[0]][0][2], 12.5)
+        # the index is keyed by the path relative to it
+        self.filenames[0] = os.path.join(self.dirname, '.', '1abc_A.out')
+        self.assertEqual(self.parse()[self.filenames[0]][0][2], 12.5)
+
+    def test_changed(self):
+        self.parse()
+        write_output(self.filenames[0], '1abc_A', '99.9', mtime=2000)
+        self.assertEqual(self.parse()[self.filenames[0]][0][2], 99.9)
+        # writing the chains which share the result of an output also changes
+        # its summary
+        with open(self.filenames[1] + '.shared', 'w') as f:
+            f.write('3def:C\n')
+        self.assertEqual(self.parse()[self.filenames[1]],
+                         (('2xyz', 'B', -3.0), ['3def:C']))
+
+    def test_removed(self):
+        self.parse()
+        removed = self.filenames.pop()
+        os.remove(removed)
+        self.parse()
+        self.assertEqual(sorted(load(self.index_filename)['entries']),
+                         ['1abc_A.out'])
+
+    def test_version(self):
+        self.parse()
+        index = load(self.index_filename)
+        index['version'] -= 1
+        dump_atomically(index, self.index_filename)
+        # an index of an older version is not used
+        write_output(self.filenames[0], '1abc_A', '99.9')
+        self.assertEqual(self.parse()[self.filenames[0]][0][2], 99.9)
+
+class GenerateCsvTest(unittest.TestCase):
+    """Tests of writing the summary of the controls of an aligner."""
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def test_generate_csv(self):
+        for family, control, chain, score in \
+                (('46459', 'positive', '1abc_A', '12.5'),
+                 ('46459', 'negative', '2xyz_B', '-3.0'),
+                 ('46463', 'positive', '4ghi_D', '1.0')):
+            dirname = os.path.join(self.dirname, family, SMURF, control)
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            write_output(os.path.join(dirname, chain + '.out'), chain, score)
+        with open(os.path.join(self.dirname, '46459', SMURF, 'negative',
+                               '2xyz_B.out.shared'), 'w') as f:
+            f.write('3def:C\n')
+        parsed_args = argparse.Namespace(outputdir=self.dirname,
+                                         aligner=SMURF, jobs=1)
+        self.assertEqual(generate_csv(parsed_args), 0)
+        csv_filename = os.path.join(self.dirname, SMURF + '_' + CSV_FILENAME)
+        with open(csv_filename) as f:
+            rows = sorted(f)
+        self.assertEqual(rows, ['1abc,A,46459,12.5,positive\n',
+                                '2xyz,B,46459,-3.0,negative\n',
+                                '3def,C,46459,-3.0,negative\n',
+                                '4ghi,D,46463,1.0,positive\n'])
+        self.assertTrue(os.path.isfile(csv_filename + SUMMARY_INDEX_SUFFIX))
+        results = load_results(results_dirname(self.dirname, SMURF))
+        self.assertEqual(len(results), 4)
+        # a second run, with nothing changed, writes the same summary
+        self.assertEqual(generate_csv(parsed_args), 0)
+        with open(csv_filename) as f:
+            self.assertEqual(sorted(f), rows)
+
+if __name__ == '__main__':
+    unittest.main()